@@ -1,24 +1,35 @@
 import os
 import json
 import uuid
+import multiprocessing
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
 from openai import OpenAI
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER, TA_LEFT, TA_RIGHT
-from reportlab.lib import colors
 import stripe
-import time
-# Import for DOCX generation
-from docx import Document
-from docx.shared import Pt, Inches, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+import metrics
+from rendering import RenderService
+from renderers import document_date
+from artifacts import artifact_etag, artifact_filename, artifact_key
+from comment_classifier import ClassifierTier, CommentClassifier, DEFAULT_MODEL_PATH, VerdictLog
+from document_store import create_document_store
+from health import HealthProber, OK as HEALTH_OK
+from jobs import JobQueue, JobWorkerPool
+from profiling import ProfilingMiddleware
+from llm import CircuitBreaker, CompletionResult, LLMClient, deadline as llm_deadline, set_deadline as set_llm_deadline
+from keyword_matcher import DOCUMENT_CHANGE_INDICATORS, DOCUMENT_TYPE_KEYWORDS, DocumentTypeChangeDetector
+from revision_catalog import RevisionCatalog
+from revision_engine import RevisionEngine, SECTION_SYSTEM_PROMPT
+from revision_lineage import RevisionLineage
+from singleflight import SingleFlight
+from storage_gc import FolderQuota, StorageCollector, touch as touch_artifact
+from stripe_cache import SessionCache
+from token_budget import TokenBudget
+from verdict_cache import VerdictCache
 
 # Load environment variables
 load_dotenv()
@@ -29,14 +40,15 @@ app.secret_key = os.getenv("SECRET_KEY", "default-secret-key")
 frontend_URL = os.getenv("FRONTEND_URL")
 
 # Configure CORS
+CORS_ORIGINS = [
+    f"{frontend_URL}",
+    "http://localhost:3000",
+    "https://lexgenai.vercel.app",
+    "https://lexgenai-git-main-mohamedaldahoul.vercel.app",
+    "https://lexgenai.onrender.com"
+]
 CORS(app, resources={r"/api/*": {
-    "origins": [
-        f"{frontend_URL}",
-        "http://localhost:3000",
-        "https://lexgenai.vercel.app",
-        "https://lexgenai-git-main-mohamedaldahoul.vercel.app",
-        "https://lexgenai.onrender.com"
-    ],
+    "origins": CORS_ORIGINS,
     "methods": ["GET", "POST", "OPTIONS"],
     "allow_headers": ["Content-Type", "Authorization"],
     "expose_headers": ["Content-Type", "Authorization"],
@@ -44,24 +56,58 @@ CORS(app, resources={r"/api/*": {
     "max_age": 600
 }})
 
-# Configure rate limiting
+# Configure rate limiting (RATELIMIT_ENABLED=false turns it off, e.g. for load tests)
+app.config["RATELIMIT_ENABLED"] = os.getenv("RATELIMIT_ENABLED", "true").lower() == "true"
+DEFAULT_RATE_LIMITS = ["200 per day", "50 per hour"]
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"],
+    default_limits=DEFAULT_RATE_LIMITS,
     storage_uri="memory://",
 )
 
-# Configure Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Local stand-ins for OpenAI/Stripe used for offline load testing (see fake_services.py)
+FAKE_SERVICES_URL = os.getenv("FAKE_SERVICES_URL", "http://127.0.0.1:8010")
+
+# Configure Stripe (STRIPE_BACKEND=fake talks to the local stand-in instead)
+if os.getenv("STRIPE_BACKEND", "stripe") == "fake":
+    stripe.api_base = FAKE_SERVICES_URL
+    stripe.api_key = "sk_test_fake"
+else:
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
-# Configure OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Configure OpenAI (LLM_BACKEND=fake talks to the local stand-in; OPENAI_BASE_URL selects any compatible API)
+if os.getenv("LLM_BACKEND", "openai") == "fake":
+    client = OpenAI(api_key="fake", base_url=f"{FAKE_SERVICES_URL}/v1")
+else:
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
 
 if not client.api_key:
     raise ValueError("OPENAI_API_KEY environment variable is not set")
 
-# Document types and their descriptions
+# All OpenAI calls go through one layer with deadlines, jittered retries and a circuit breaker
+llm_client = LLMClient(
+    client,
+    CircuitBreaker(
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+        reset_timeout=int(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+    ),
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", 3)),
+    on_complete=metrics.observe_llm_call
+)
+
+# Requests must finish before gunicorn's worker timeout (GUNICORN_TIMEOUT in the Procfile) kills them
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", int(os.getenv("GUNICORN_TIMEOUT", 60)) - 10))
+
+@app.before_request
+def start_llm_deadline():
+    set_llm_deadline(LLM_REQUEST_DEADLINE)
+
+@app.before_request
+def start_request_metrics():
+    metrics.set_context(endpoint=request.endpoint or 'unknown', document_type='')
+
+# Document types and their descriptions (extend keyword_matcher.DOCUMENT_TYPE_KEYWORDS alongside)
 DOCUMENT_TYPES = {
     "nda": "Non-Disclosure Agreement (NDA)",
     "terms": "Website Terms of Service",
@@ -71,6 +117,16 @@ DOCUMENT_TYPES = {
     "partnership": "Partnership Agreement"
 }
 
+# All keywords and indicators are compiled into one matcher at startup
+document_type_change_detector = DocumentTypeChangeDetector(DOCUMENT_TYPE_KEYWORDS, DOCUMENT_CHANGE_INDICATORS)
+
+def known_document_type(document_type):
+    return document_type if document_type in DOCUMENT_TYPES else 'other'
+
+def set_metrics_document_type(document_type):
+    """Label metrics recorded for the rest of this request or job with the document type"""
+    metrics.set_context(document_type=known_document_type(document_type))
+
 # Ensure the downloads directory exists
 DOWNLOAD_FOLDER = os.path.join(os.getcwd(), "static", "downloads")
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
@@ -79,6 +135,179 @@ os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 REVISIONS_FOLDER = os.path.join(os.getcwd(), "static", "revisions")
 os.makedirs(REVISIONS_FOLDER, exist_ok=True)
 
+# Local data folder for databases (kept out of the publicly served static folder)
+DATA_FOLDER = os.getenv("DATA_FOLDER", os.path.join(os.getcwd(), "data"))
+os.makedirs(DATA_FOLDER, exist_ok=True)
+
+# Generated documents are stored per Stripe session so they are only generated once
+document_store = create_document_store(
+    os.getenv("DOCUMENT_STORE_URL", f"sqlite:///{os.path.join(DATA_FOLDER, 'documents.db')}")
+)
+
+# PDF/DOCX rendering runs in a pool of warm render processes
+render_service = RenderService(
+    workers=int(os.getenv("RENDER_WORKERS", 2)),
+    max_queue=int(os.getenv("RENDER_QUEUE_DEPTH", 16)),
+    queue_timeout=int(os.getenv("RENDER_QUEUE_TIMEOUT", 30)),
+    on_render=metrics.observe_render
+)
+
+# Paid checkout sessions are immutable, so cache them instead of calling Stripe on every request
+def fetch_checkout_session(session_id):
+    with metrics.stage('stripe_retrieve'):
+        return stripe.checkout.Session.retrieve(session_id)
+
+session_cache = SessionCache(
+    fetch_checkout_session,
+    not_found_errors=(stripe.error.InvalidRequestError,),
+    make_not_found=lambda message: stripe.error.InvalidRequestError(message, 'id'),
+    maxsize=int(os.getenv("STRIPE_SESSION_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("STRIPE_SESSION_CACHE_TTL", 3600)),
+    negative_ttl=int(os.getenv("STRIPE_SESSION_NEGATIVE_TTL", 30)),
+    shared_path=os.path.join(DATA_FOLDER, 'stripe_sessions.db')
+    if os.getenv("STRIPE_SESSION_SHARED_CACHE", "true").lower() == "true" else None,
+    on_count=metrics.cache_counter('stripe_sessions')
+)
+
+def retrieve_checkout_session(session_id):
+    """Return a checkout session (id, payment_status, status, metadata), cached once paid"""
+    return session_cache.get(session_id)
+
+# Coordinates concurrent generations/renders for the same session across threads and workers
+document_flight = SingleFlight(os.path.join(DATA_FOLDER, 'locks'))
+
+# Indexed catalog of revisions, journaled as events (import existing JSON files with `python revision_catalog.py import`)
+revision_catalog = RevisionCatalog(os.path.join(DATA_FOLDER, 'revisions.db'))
+REVISION_STALE_SECONDS = int(os.getenv("REVISION_STALE_SECONDS", 900))
+REVISION_COMPACT_DAYS = float(os.getenv("REVISION_COMPACT_DAYS", 30))
+
+def maintain_revision_journal():
+    """Fail revisions a crashed worker left pending and compact the journal of long-finished ones"""
+    now = datetime.now().timestamp()
+    recovered = revision_catalog.recover(datetime.fromtimestamp(now - REVISION_STALE_SECONDS))
+    compacted = revision_catalog.compact(datetime.fromtimestamp(now - REVISION_COMPACT_DAYS * 86400))
+    if recovered or compacted:
+        app.logger.info(f"Revision journal: {recovered} interrupted revisions failed, {compacted} compacted")
+
+# Every revision is stored as a delta against the version it was made from
+revision_lineage = RevisionLineage(os.path.join(DATA_FOLDER, 'lineage.db'))
+
+# Document-type validation verdicts are reused for repeated and near-identical comments
+validation_cache = VerdictCache(
+    maxsize=int(os.getenv("VALIDATION_CACHE_SIZE", 2048)),
+    threshold=float(os.getenv("VALIDATION_CACHE_SIMILARITY", 0.9)),
+    shared_path=os.path.join(DATA_FOLDER, 'validation_verdicts.db'),
+    on_count=metrics.cache_counter('validation_verdicts')
+)
+
+# Local classifier that settles confident validations without gpt-4 (empty model path disables it)
+def load_classifier_tier():
+    model_path = os.getenv("VALIDATION_CLASSIFIER_MODEL", DEFAULT_MODEL_PATH)
+    if not model_path:
+        return None
+    try:
+        classifier = CommentClassifier.load(model_path)
+        # The band calibrated on held-out comments when the model was trained, unless configured
+        band = os.getenv("VALIDATION_CLASSIFIER_BAND")
+        low, high = (float(value) for value in band.split(',')) if band else classifier.metadata.get('band', (0.1, 0.9))
+        return ClassifierTier(classifier, low=low, high=high, on_count=metrics.cache_counter('validation_classifier'))
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Validation classifier disabled: {str(e)}")
+        return None
+
+classifier_tier = load_classifier_tier()
+
+# gpt-4 verdicts are logged as training data for the classifier
+validation_log = VerdictLog(os.path.join(DATA_FOLDER, 'validation_log.jsonl'))
+
+# Background job queue shared by all gunicorn workers
+job_queue = JobQueue(
+    os.path.join(DATA_FOLDER, 'jobs.db'),
+    lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", 300)),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 2))
+)
+
+# max_tokens per request is sized from the prompt and from observed output lengths per document type
+token_budget = TokenBudget(
+    os.path.join(DATA_FOLDER, 'token_budget.db'),
+    percentile=float(os.getenv("LLM_BUDGET_PERCENTILE", 0.95)),
+    headroom=float(os.getenv("LLM_BUDGET_HEADROOM", 1.25)),
+    min_samples=int(os.getenv("LLM_BUDGET_MIN_SAMPLES", 20)),
+    on_budget=metrics.observe_token_budget
+)
+# Free-text inputs (form instructions, revision comments) longer than this are trimmed before prompting
+LLM_INPUT_TOKEN_LIMIT = int(os.getenv("LLM_INPUT_TOKEN_LIMIT", 1500))
+
+def trim_inputs(data, model):
+    """Copy of form data with over-long free-text values trimmed"""
+    return {key: token_budget.trim(value, LLM_INPUT_TOKEN_LIMIT, model) if isinstance(value, str) else value
+            for key, value in data.items()}
+
+def observe_output(kind, document_type, llm_request, text, completion=None):
+    """Record an output's length (as reported in ``completion`` when given) so later budgets learn from it"""
+    try:
+        token_budget.observe(kind, known_document_type(document_type), llm_request['model'], text,
+                             llm_request['max_tokens'],
+                             completion_tokens=completion.completion_tokens if completion else None,
+                             finish_reason=completion.finish_reason if completion else None)
+    except Exception as e:
+        app.logger.error(f"Failed to record output length: {str(e)}")
+
+# Upstream dependencies are probed in the background; health endpoints read the latest results
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 5))
+health_prober = HealthProber(
+    {
+        'stripe': lambda: stripe.Account.retrieve(),
+        'openai': lambda: client.with_options(timeout=HEALTH_CHECK_TIMEOUT, max_retries=0).models.list()
+    },
+    interval=float(os.getenv("HEALTH_CHECK_INTERVAL", 30)),
+    timeout=HEALTH_CHECK_TIMEOUT
+)
+
+# Age and size quotas for the rendered-file folders, applied by one worker at a time
+def storage_quota(name, folder, default_days, default_mb):
+    max_days = float(os.getenv(f"{name.upper()}_MAX_AGE_DAYS", default_days))
+    max_mb = float(os.getenv(f"{name.upper()}_MAX_MB", default_mb))
+    return FolderQuota(name, folder, max_age=max_days * 86400 if max_days > 0 else None,
+                       max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None)
+
+def recent_artifacts(since):
+    """Files referenced by sessions and revisions active since ``since``; the collector never deletes them"""
+    filenames = set()
+    for metadata in document_store.metadata_since(since):
+        filenames.update((metadata.get('pdf_filename'), metadata.get('docx_filename')))
+    for revision in revision_catalog.list_since(since):
+        filenames.update((revision['pdf_filename'], revision['docx_filename']))
+    filenames.discard(None)
+    return filenames
+
+storage_collector = StorageCollector(
+    [
+        storage_quota('downloads', DOWNLOAD_FOLDER, 30, 2048),
+        storage_quota('revisions', REVISIONS_FOLDER, 90, 2048)
+    ],
+    lock_path=os.path.join(DATA_FOLDER, 'locks', 'storage_gc.lock'),
+    protected=recent_artifacts,
+    protect_seconds=float(os.getenv("STORAGE_GC_PROTECT_HOURS", 72)) * 3600,
+    min_age=int(os.getenv("STORAGE_GC_MIN_AGE", 600)),
+    interval=int(os.getenv("STORAGE_GC_INTERVAL", 3600)),
+    dry_run=os.getenv("STORAGE_GC_DRY_RUN", "false").lower() == "true",
+    on_report=metrics.observe_storage_gc
+)
+
+# Opt-in request profiling; with PROFILING_ENABLED unset the middleware isn't installed at all
+request_profiler = None
+if os.getenv("PROFILING_ENABLED", "false").lower() == "true":
+    request_profiler = ProfilingMiddleware(
+        app.wsgi_app,
+        folder=os.getenv("PROFILING_FOLDER", os.path.join(DATA_FOLDER, 'profiles')),
+        token=os.getenv("PROFILING_TOKEN"),
+        sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", 0)),
+        fmt=os.getenv("PROFILING_FORMAT", "pstats"),
+        keep=int(os.getenv("PROFILING_KEEP", 100))
+    )
+    app.wsgi_app = request_profiler
+
 # Configure test mode
 TEST_MODE_ENABLED = os.getenv("ENABLE_TEST_MODE", "false").lower() == "true"
 
@@ -126,45 +355,35 @@ def payment_success():
     session_id = request.args.get('session_id')
     
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = retrieve_checkout_session(session_id)
         form_data = json.loads(session.metadata.get('form_data', '{}'))
+        set_metrics_document_type(form_data.get('document_type'))
         
-        start_time = time.time()
-        timeout_limit = 25
+        # Documents that were already generated are served straight from the store
+        if document_store.get(session_id) is not None:
+            return jsonify(get_session_document(session_id, form_data))
         
-        max_retries = 2
-        retry_delay = 1
+        # Otherwise generate in the background and let the client poll
+        job = job_queue.enqueue('generate_document', session_id, {
+            'session_id': session_id,
+            'form_data': form_data
+        })
         
-        for attempt in range(max_retries):
-            try:
-                if time.time() - start_time > timeout_limit:
-                    return jsonify({
-                        'status': 'processing',
-                        'message': 'Your document is still being generated. Please wait a moment and try again.'
-                    }), 202
-                
-                document_result = generate_document(form_data)
-                
-                if document_result.get('success'):
-                    return jsonify(document_result)
-                else:
-                    error_msg = document_result.get('error', 'Unknown error')
-                    app.logger.error(f"Document generation failed: {error_msg}")
-                    
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        retry_delay *= 2
-                    else:
-                        return jsonify({'error': f'Failed to generate document after {max_retries} attempts: {error_msg}'}), 500
-            
-            except Exception as doc_error:
-                app.logger.error(f"Document generation exception (attempt {attempt+1}/{max_retries}): {str(doc_error)}")
-                
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    return jsonify({'error': f"Document generation failed after {max_retries} attempts: {str(doc_error)}"}), 500
+        if job['status'] == 'completed':
+            return jsonify(get_session_document(session_id, form_data))
+        if job['status'] == 'failed':
+            app.logger.error(f"Document generation job {job['job_id']} failed: {job['error']}")
+            return jsonify({
+                'error': f"Document generation failed after {job['attempts']} attempts: {job['error']}",
+                'job_id': job['job_id']
+            }), 500
+        
+        return jsonify({
+            'status': 'processing',
+            'message': 'Your document is still being generated. Please wait a moment and try again.',
+            'job_id': job['job_id'],
+            'status_url': f"/api/jobs/{job['job_id']}"
+        }), 202
             
     except stripe.error.StripeError as e:
         app.logger.error(f"Stripe error: {str(e)}")
@@ -173,35 +392,37 @@ def payment_success():
         app.logger.error(f"Payment success route error: {str(e)}")
         return jsonify({'error': f"An unexpected error occurred: {str(e)}"}), 500
 
-def generate_document(form_data, generate_pdf=True, generate_docx=False):
-    try:
-        document_type = form_data.get('document_type')
-        business_name = form_data.get('business_name')
-        business_type = form_data.get('business_type')
-        country = form_data.get('country')
-        state_province = form_data.get('state_province', '')
-        language = form_data.get('language')
-        industry = form_data.get('industry')
-        protection_level = form_data.get('protection_level', '2')
-        
-        clauses = []
-        if form_data.get('clause_confidentiality'):
-            clauses.append("Enhanced Confidentiality")
-        if form_data.get('clause_arbitration'):
-            clauses.append("Arbitration Provision")
-        if form_data.get('clause_termination'):
-            clauses.append("Advanced Termination Options")
-        if form_data.get('clause_ip'):
-            clauses.append("Intellectual Property Protection")
-        
-        additional_instructions = form_data.get('additional_instructions', '')
-        
-        # Include state/province in the prompt if provided
-        location_detail = f"{country}"
-        if state_province:
-            location_detail = f"{state_province}, {country}"
-        
-        prompt = f"""Generate a professional {DOCUMENT_TYPES.get(document_type, 'legal document')} for {business_name}, a {business_type} in the {industry} industry, operating in {location_detail}.
+GENERATION_SYSTEM_PROMPT = "You are a legal document generator that creates professional, legally-sound documents tailored to specific business needs and jurisdictions."
+
+def build_document_prompt(form_data):
+    """Build the generation prompt for a paid document from the checkout form data"""
+    document_type = form_data.get('document_type')
+    business_name = form_data.get('business_name')
+    business_type = form_data.get('business_type')
+    country = form_data.get('country')
+    state_province = form_data.get('state_province', '')
+    language = form_data.get('language')
+    industry = form_data.get('industry')
+    protection_level = form_data.get('protection_level', '2')
+    
+    clauses = []
+    if form_data.get('clause_confidentiality'):
+        clauses.append("Enhanced Confidentiality")
+    if form_data.get('clause_arbitration'):
+        clauses.append("Arbitration Provision")
+    if form_data.get('clause_termination'):
+        clauses.append("Advanced Termination Options")
+    if form_data.get('clause_ip'):
+        clauses.append("Intellectual Property Protection")
+    
+    additional_instructions = form_data.get('additional_instructions', '')
+    
+    # Include state/province in the prompt if provided
+    location_detail = f"{country}"
+    if state_province:
+        location_detail = f"{state_province}, {country}"
+    
+    return f"""Generate a professional {DOCUMENT_TYPES.get(document_type, 'legal document')} for {business_name}, a {business_type} in the {industry} industry, operating in {location_detail}.
 Language document should be in {language}
 
 Protection Level: {protection_level} out of 3
@@ -224,258 +445,251 @@ Additional Instructions: {additional_instructions}
 Format the document professionally with appropriate sections, headings, and legal language. Include all necessary legal provisions for this type of document in {location_detail}.
 """
 
-        max_retries = 3
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a legal document generator that creates professional, legally-sound documents tailored to specific business needs and jurisdictions."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=4000,
-                    temperature=0.7
-                )
-                document_text = response.choices[0].message.content
-                break
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
-                else:
-                    raise Exception(f"Failed to generate document after {max_retries} attempts: {str(e)}")
+def generation_request(form_data):
+    """LLM request (model, messages, limits) for generating a paid document"""
+    model = "gpt-3.5-turbo"
+    with metrics.stage('prompt_build'):
+        prompt = build_document_prompt(trim_inputs(form_data, model))
+    messages = [
+        {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    budget = token_budget.plan('generation', known_document_type(form_data.get('document_type')), model, messages,
+                               default=4000, floor=1000)
+    return {
+        'model': model,
+        'messages': messages,
+        'max_tokens': budget['max_tokens'],
+        'temperature': 0.7
+    }
+
+def generate_document(form_data, generate_pdf=True, generate_docx=False):
+    try:
+        llm_request = generation_request(form_data)
+        completion = CompletionResult()
+        document_text = llm_client.complete(**llm_request, result=completion)
+        observe_output('generation', form_data.get('document_type'), llm_request, document_text, completion)
         
-        unique_id = uuid.uuid4().hex[:8]
         result = {
             'success': True,
             'preview': document_text
         }
-        
-        if generate_pdf:
-            pdf_filename = f"{document_type}_{unique_id}.pdf"
-            pdf_filepath = os.path.join(DOWNLOAD_FOLDER, pdf_filename)
-            create_pdf(document_text, pdf_filepath, business_name, DOCUMENT_TYPES.get(document_type, "Legal Document"))
-            result['pdf_filename'] = pdf_filename
-        
-        if generate_docx:
-            docx_filename = f"{document_type}_{unique_id}.docx"
-            docx_filepath = os.path.join(DOWNLOAD_FOLDER, docx_filename)
-            create_docx(document_text, docx_filepath, business_name, DOCUMENT_TYPES.get(document_type, "Legal Document"))
-            result['docx_filename'] = docx_filename
-            
+        result.update(render_document_files(document_text, form_data, generate_pdf, generate_docx))
         return result
     
     except Exception as e:
         app.logger.error(f"Document generation error: {str(e)}")
         raise Exception(f"Failed to generate document: {str(e)}")
 
-def create_pdf(text, filepath, business_name, document_type):
-    doc = SimpleDocTemplate(filepath, pagesize=letter,
-                          rightMargin=72, leftMargin=72,
-                          topMargin=72, bottomMargin=72)
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=16,
-        alignment=TA_CENTER,
-        spaceAfter=20,
-        textColor=colors.navy,
-        fontName='Helvetica-Bold'
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=11,
-        alignment=TA_JUSTIFY,
-        firstLineIndent=20,
-        leading=14,
-        spaceBefore=6,
-        spaceAfter=6
-    )
-    
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Heading2'],
-        fontSize=13,
-        spaceAfter=10,
-        spaceBefore=15,
-        textColor=colors.navy,
-        fontName='Helvetica-Bold',
-        borderWidth=1,
-        borderColor=colors.lightgrey,
-        borderPadding=5,
-        borderRadius=2
-    )
-    
-    content = []
-    
-    content.append(Paragraph(f"{document_type.upper()}", title_style))
-    content.append(Paragraph(f"For: {business_name}", title_style))
-    content.append(Spacer(1, 20))
-    
-    date_style = ParagraphStyle(
-        'Date',
-        parent=styles['Normal'],
-        fontSize=11,
-        alignment=TA_RIGHT,
-        textColor=colors.darkgrey
-    )
-    content.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", date_style))
-    content.append(Spacer(1, 20))
-    
-    paragraphs = text.split('\n')
-    for para in paragraphs:
-        if para.strip():
-            if para.strip().startswith('#'):
-                header_text = para.replace('#', '').strip()
-                content.append(Paragraph(header_text, header_style))
-            elif para.strip().isupper() and len(para.strip()) > 3:
-                content.append(Paragraph(para.strip(), header_style))
-            elif para.strip().startswith(('•', '-', '*')):
-                bullet_style = ParagraphStyle(
-                    'Bullet',
-                    parent=normal_style,
-                    leftIndent=30,
-                    firstLineIndent=0,
-                    spaceBefore=3,
-                    spaceAfter=3
-                )
-                content.append(Paragraph(para.strip(), bullet_style))
-            elif "signature" in para.lower() or "sign" in para.lower() or "date:" in para.lower():
-                sig_style = ParagraphStyle(
-                    'Signature',
-                    parent=normal_style,
-                    spaceBefore=15,
-                    spaceAfter=15
-                )
-                content.append(Paragraph(para, sig_style))
-            else:
-                content.append(Paragraph(para, normal_style))
-            
-            if para.strip().startswith('#') or para.strip().isupper():
-                content.append(Spacer(1, 10))
-            else:
-                content.append(Spacer(1, 6))
-    
-    doc.build(content)
-
-def create_docx(text, filepath, business_name, document_type):
-    doc = Document()
-    
-    # Set document margins (1 inch on all sides)
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Add title
-    title = doc.add_paragraph()
-    title_run = title.add_run(document_type.upper())
-    title_run.bold = True
-    title_run.font.size = Pt(16)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+def render_document_files(document_text, form_data, generate_pdf=True, generate_docx=False):
+    """Render the requested formats into DOWNLOAD_FOLDER and return their filenames"""
+    formats = [fmt for fmt, wanted in (('pdf', generate_pdf), ('docx', generate_docx)) if wanted]
+    filenames = render_artifacts(document_text, formats, DOWNLOAD_FOLDER, form_data.get('document_type'),
+                                 form_data.get('business_name'))
+    return {f"{fmt}_filename": filename for fmt, filename in filenames.items()}
+
+count_artifact = metrics.cache_counter('rendered_artifacts')
+
+def render_artifacts(text, formats, folder, document_type, business_name):
+    """Render each format into ``folder`` under a content-addressed name, reusing files that already exist"""
+    title = DOCUMENT_TYPES.get(document_type, "Legal Document")
+    date = document_date()
+    prefix = secure_filename(str(document_type or 'document')) or 'document'
+    filenames = {}
+    outputs = {}
+    for fmt in formats:
+        filename = artifact_filename(prefix, artifact_key(text, fmt, business_name, title, date), fmt)
+        filenames[fmt] = filename
+        if os.path.exists(os.path.join(folder, filename)):
+            count_artifact('hits')
+            touch_artifact(folder, filename)
+        else:
+            count_artifact('misses')
+            outputs[fmt] = os.path.join(folder, filename)
     
-    # Add business name
-    business = doc.add_paragraph()
-    business_run = business.add_run(f"For: {business_name}")
-    business_run.bold = True
-    business_run.font.size = Pt(14)
-    business.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    if outputs:
+        render_service.render(text, outputs, business_name, title, date=date)
+    return filenames
+
+def get_session_document(session_id, form_data, generate_pdf=True, generate_docx=False):
+    """Return the document for a paid session, calling the LLM only the first time.
+
+    The generated text is kept in the document store and rendered files are
+    reused as long as they are still on disk. Concurrent requests for the same
+    session share a single generation and a single render per format set.
+    """
+    stored = document_store.get(session_id)
+    if stored is None:
+        stored = document_flight.do(
+            f"document:{session_id}",
+            lambda: _generate_and_store_document(session_id, form_data)
+        )
     
-    # Add date
-    date_paragraph = doc.add_paragraph()
-    date_paragraph.add_run(f"Date: {datetime.now().strftime('%B %d, %Y')}")
-    date_paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    result = {
+        'success': True,
+        'preview': stored['text']
+    }
     
-    # Add document text
-    paragraphs = text.split("\n")
-    for para in paragraphs:
-        if not para.strip():
-            continue
-            
-        # Determine paragraph style
-        if para.strip().startswith('#') or (para.strip().isupper() and len(para.strip()) > 3):
-            # This is a heading
-            header_text = para.replace('#', '').strip()
-            header = doc.add_paragraph()
-            header_run = header.add_run(header_text if '#' in para else para)
-            header_run.bold = True
-            header_run.font.size = Pt(14)
-            header.style = 'Heading 2'
-        
-        elif para.strip().startswith(('•', '-', '*')):
-            # This is a bullet point
-            p = doc.add_paragraph(para.strip().lstrip('•-* '), style='List Bullet')
-            
-        elif "signature" in para.lower() or "sign" in para.lower() or "date:" in para.lower():
-            # This is a signature line
-            p = doc.add_paragraph()
-            p.add_run(para).bold = True
-            p.space_after = Pt(20)
-            
-        else:
-            # Regular paragraph
-            p = doc.add_paragraph(para)
+    metadata = stored['metadata']
+    if any(_missing_formats(metadata, generate_pdf, generate_docx)):
+        metadata = document_flight.do(
+            f"render:{session_id}:pdf={int(generate_pdf)}:docx={int(generate_docx)}",
+            lambda: _render_stored_document(session_id, generate_pdf, generate_docx)
+        )
     
-    doc.save(filepath)
+    if generate_pdf:
+        result['pdf_filename'] = metadata['pdf_filename']
+    if generate_docx:
+        result['docx_filename'] = metadata['docx_filename']
+    return result
+
+def _generate_and_store_document(session_id, form_data):
+    # Another worker may have finished the generation while we waited for the lock
+    stored = document_store.get(session_id)
+    if stored is None:
+        generated = generate_document(form_data, generate_pdf=False, generate_docx=False)
+        stored = document_store.add(session_id, generated['preview'], form_data)
+    return stored
+
+def _render_stored_document(session_id, generate_pdf, generate_docx):
+    stored = document_store.get(session_id)
+    missing_pdf, missing_docx = _missing_formats(stored['metadata'], generate_pdf, generate_docx)
+    if not (missing_pdf or missing_docx):
+        return stored['metadata']
+    files = render_document_files(stored['text'], stored['form_data'], missing_pdf, missing_docx)
+    return document_store.update_metadata(session_id, **files)['metadata']
+
+def _missing_formats(metadata, generate_pdf, generate_docx):
+    missing_pdf = generate_pdf and not _download_exists(metadata.get('pdf_filename'))
+    missing_docx = generate_docx and not _download_exists(metadata.get('docx_filename'))
+    return missing_pdf, missing_docx
+
+def _download_exists(filename):
+    return bool(filename) and os.path.exists(os.path.join(DOWNLOAD_FOLDER, filename))
 
 @app.route('/api/download/<filename>')
 # @limiter.limit("10 per minute")
 def download_file(filename):
-    return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+    return send_artifact(DOWNLOAD_FOLDER, filename, immutable=True)
+
+# Rendered files never change once written, so clients and CDNs may keep them for a year
+ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", 31536000))
+
+def send_artifact(folder, filename, immutable=False):
+    """Send a rendered file with a strong ETag and conditional/range request support.
+
+    Only URLs naming the content-hashed file (immutable=True) are cached for
+    ARTIFACT_MAX_AGE; session and revision URLs serve whatever was rendered
+    last, so they must be revalidated and never shared.
+    """
+    touch_artifact(folder, secure_filename(filename))
+    response = send_from_directory(folder, filename, as_attachment=True, conditional=True,
+                                   etag=artifact_etag(filename) or True,
+                                   max_age=ARTIFACT_MAX_AGE if immutable else None)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    try:
-        stripe.Account.retrieve()
-        openai_status = "ok"
-        try:
-            client.models.list()
-        except Exception as e:
-            openai_status = f"error: {str(e)}"
-        
-        return jsonify({
-            'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
-            'stripe': 'ok',
-            'openai': openai_status
-        })
-    except Exception as e:
+    """Dependency status from the background prober (no upstream calls per request)"""
+    checks = health_prober.snapshot()
+    stripe_check = checks['stripe']
+    openai_check = checks['openai']
+    if stripe_check['status'] not in (HEALTH_OK, 'pending'):
         return jsonify({
             'status': 'unhealthy',
-            'error': str(e),
-            'timestamp': datetime.now().isoformat()
+            'error': stripe_check['error'] or stripe_check['status'],
+            'timestamp': datetime.now().isoformat(),
+            'checks': checks
         }), 500
+    
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'stripe': stripe_check['status'],
+        'openai': openai_check['status'] if openai_check['status'] in (HEALTH_OK, 'pending')
+        else f"{openai_check['status']}: {openai_check['error']}",
+        'openai_circuit': llm_client.breaker.stats(),
+        'checks': checks,
+        'caches': {
+            'stripe_sessions': session_cache.stats(),
+            'validation_verdicts': validation_cache.stats()
+        },
+        'validation_classifier': classifier_tier.stats() if classifier_tier else None,
+        'storage_gc': storage_collector.stats(),
+        'token_budgets': token_budget.stats()
+    })
+
+@app.route('/api/health/live', methods=['GET'])
+def liveness_check():
+    """The process is up and serving requests"""
+    return jsonify({
+        'status': 'alive',
+        'prober_running': health_prober.alive(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """Ready when every dependency check passed recently"""
+    checks = health_prober.snapshot()
+    ready = health_prober.ready(checks)
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': checks,
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Per-stage latency, token and cache metrics in Prometheus text format (all workers combined)"""
+    body, content_type = metrics.render_latest()
+    return Response(body, mimetype=None, content_type=content_type)
+
+def profiles_unavailable():
+    """Error response unless profiling is enabled and the admin token was sent"""
+    if request_profiler is None:
+        return jsonify({'error': 'Profiling is not enabled'}), 404
+    if not request_profiler.is_admin(request.environ):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List the most recent request profiles"""
+    error = profiles_unavailable()
+    if error:
+        return error
+    return jsonify({'profiles': request_profiler.list_profiles()})
+
+@app.route('/api/profiles/<filename>', methods=['GET'])
+def download_profile(filename):
+    error = profiles_unavailable()
+    if error:
+        return error
+    return send_from_directory(request_profiler.folder, secure_filename(filename), as_attachment=True)
 
 def is_localhost():
     remote_addr = request.remote_addr
     return remote_addr == "127.0.0.1" or remote_addr == "localhost" or remote_addr.startswith("192.168.") or remote_addr.startswith("10.")
 
-@app.route('/api/preview-document', methods=['POST'])
-def preview_document():
-    if not is_localhost():
-        return jsonify({
-            "error": "This endpoint is only available in development mode",
-            "status": "error"
-        }), 403
+PREVIEW_SYSTEM_PROMPT = "You are a legal document generation assistant. Create professional, well-structured legal documents based on the provided requirements."
 
-    try:
-        data = request.json
-        
-        # Add state/province to location if available
-        location = data['country']
-        if data.get('state_province'):
-            location = f"{data['state_province']}, {data['country']}"
-        
-        # Create a prompt based on the form data
-        prompt = f"""Create a {data['document_type']} for {data['business_name']}, a {data['business_type']} in {location}.
+def build_preview_prompt(data):
+    """Build the prompt used for development previews"""
+    # Add state/province to location if available
+    location = data['country']
+    if data.get('state_province'):
+        location = f"{data['state_province']}, {data['country']}"
+    
+    # Create a prompt based on the form data
+    return f"""Create a {data['document_type']} for {data['business_name']}, a {data['business_type']} in {location}.
         Industry: {data['industry']}
         Protection Level: {data['protection_level']}
         Special Clauses:
@@ -488,19 +702,39 @@ def preview_document():
         
         Please generate a professional legal document based on these requirements."""
 
-        # Call OpenAI API with new syntax
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a legal document generation assistant. Create professional, well-structured legal documents based on the provided requirements."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2000,
-            temperature=0.7
-        )
+def preview_request(data):
+    """LLM request for a development preview (raises KeyError for missing form fields)"""
+    model = "gpt-4"
+    with metrics.stage('prompt_build'):
+        prompt = build_preview_prompt(trim_inputs(data, model))
+    messages = [
+        {"role": "system", "content": PREVIEW_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    budget = token_budget.plan('preview', known_document_type(data.get('document_type')), model, messages,
+                               default=2000, floor=500)
+    return {
+        'model': model,
+        'messages': messages,
+        'max_tokens': budget['max_tokens'],
+        'temperature': 0.7
+    }
+
+@app.route('/api/preview-document', methods=['POST'])
+def preview_document():
+    if not is_localhost():
+        return jsonify({
+            "error": "This endpoint is only available in development mode",
+            "status": "error"
+        }), 403
 
-        # Extract the generated document with new syntax
-        generated_text = response.choices[0].message.content
+    try:
+        data = request.json
+        set_metrics_document_type(data.get('document_type'))
+        llm_request = preview_request(data)
+        completion = CompletionResult()
+        generated_text = llm_client.complete(**llm_request, result=completion)
+        observe_output('preview', data.get('document_type'), llm_request, generated_text, completion)
 
         return jsonify({
             "preview": generated_text,
@@ -513,6 +747,100 @@ def preview_document():
             "status": "error"
         }), 500
 
+def sse_event(event, data):
+    """Format a Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/preview-document/stream', methods=['POST'])
+def stream_preview_document():
+    """Stream a development preview token by token as Server-Sent Events"""
+    if not is_localhost():
+        return jsonify({
+            "error": "This endpoint is only available in development mode",
+            "status": "error"
+        }), 403
+
+    data = request.json
+    set_metrics_document_type(data.get('document_type'))
+    try:
+        llm_request = preview_request(data)
+    except KeyError as e:
+        return jsonify({"error": f"Missing field: {str(e)}", "status": "error"}), 400
+
+    def events():
+        chunks = []
+        try:
+            completion = CompletionResult()
+            for delta in llm_client.stream(**llm_request, result=completion):
+                chunks.append(delta)
+                yield sse_event('chunk', {'delta': delta})
+            observe_output('preview', data.get('document_type'), llm_request, ''.join(chunks), completion)
+            yield sse_event('done', {
+                "preview": ''.join(chunks),
+                "status": "success"
+            })
+        except Exception as e:
+            app.logger.error(f"Preview stream error: {str(e)}")
+            yield sse_event('error', {"error": str(e), "status": "error"})
+
+    return sse_response(events())
+
+@app.route('/api/document-stream', methods=['GET'])
+def stream_session_document():
+    """Stream the paid document for a session as Server-Sent Events.
+
+    Documents that were already generated are sent as a single chunk. New
+    documents are streamed from the LLM, then stored and rendered once the
+    stream closes; the final `done` event carries the same result structure
+    as /api/payment-success.
+    """
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'No session_id provided'}), 400
+
+    try:
+        session = retrieve_checkout_session(session_id)
+        form_data = json.loads(session.metadata.get('form_data', '{}'))
+    except Exception as e:
+        return jsonify({'error': f'Invalid session: {str(e)}'}), 400
+    set_metrics_document_type(form_data.get('document_type'))
+
+    def events():
+        try:
+            stored = document_store.get(session_id)
+            if stored is None:
+                # Hold the session's generation lock so a concurrent job or request
+                # cannot store a different text than the one being streamed
+                with document_flight.lock(f"document:{session_id}"):
+                    stored = document_store.get(session_id)
+                    if stored is None:
+                        chunks = []
+                        llm_request = generation_request(form_data)
+                        completion = CompletionResult()
+                        for delta in llm_client.stream(**llm_request, result=completion):
+                            chunks.append(delta)
+                            yield sse_event('chunk', {'delta': delta})
+                        observe_output('generation', form_data.get('document_type'), llm_request, ''.join(chunks),
+                                       completion)
+                        stored = document_store.add(session_id, ''.join(chunks), form_data)
+                    else:
+                        yield sse_event('chunk', {'delta': stored['text']})
+            else:
+                yield sse_event('chunk', {'delta': stored['text']})
+
+            yield sse_event('done', get_session_document(session_id, form_data))
+        except Exception as e:
+            app.logger.error(f"Document stream error: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+
+    return sse_response(events())
+
 @app.route('/api/generate-test-document', methods=['POST'])
 def generate_test_document():
     if not is_localhost():
@@ -523,6 +851,7 @@ def generate_test_document():
         
     try:
         data = request.json
+        set_metrics_document_type(data.get('document_type'))
         document_result = generate_document(data, generate_pdf=True, generate_docx=False)
         
         if document_result.get('success'):
@@ -546,9 +875,10 @@ def document_details():
         return jsonify({'error': 'No session_id provided'}), 400
 
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = retrieve_checkout_session(session_id)
         form_data = json.loads(session.metadata.get('form_data', '{}'))
-        document_result = generate_document(form_data, generate_pdf=False, generate_docx=False)
+        set_metrics_document_type(form_data.get('document_type'))
+        document_result = get_session_document(session_id, form_data, generate_pdf=False, generate_docx=False)
         if document_result.get('success'):
             return jsonify({
                 'preview': document_result.get('preview')
@@ -565,12 +895,13 @@ def generate_pdf_on_demand():
         return jsonify({'error': 'No session_id provided'}), 400
 
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = retrieve_checkout_session(session_id)
         form_data = json.loads(session.metadata.get('form_data', '{}'))
-        document_result = generate_document(form_data, generate_pdf=True, generate_docx=False)
+        set_metrics_document_type(form_data.get('document_type'))
+        document_result = get_session_document(session_id, form_data, generate_pdf=True, generate_docx=False)
         if document_result.get('success'):
             filename = document_result.get('pdf_filename')
-            return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+            return send_artifact(DOWNLOAD_FOLDER, filename)
         else:
             return jsonify({'error': 'Failed to generate PDF'}), 500
     except Exception as e:
@@ -583,12 +914,13 @@ def generate_docx_on_demand():
         return jsonify({'error': 'No session_id provided'}), 400
 
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = retrieve_checkout_session(session_id)
         form_data = json.loads(session.metadata.get('form_data', '{}'))
-        document_result = generate_document(form_data, generate_pdf=False, generate_docx=True)
+        set_metrics_document_type(form_data.get('document_type'))
+        document_result = get_session_document(session_id, form_data, generate_pdf=False, generate_docx=True)
         if document_result.get('success'):
             filename = document_result.get('docx_filename')
-            return send_from_directory(DOWNLOAD_FOLDER, filename, as_attachment=True)
+            return send_artifact(DOWNLOAD_FOLDER, filename)
         else:
             return jsonify({'error': 'Failed to generate DOCX'}), 500
     except Exception as e:
@@ -597,75 +929,13 @@ def generate_docx_on_demand():
 # First, add a helper function for keyword-based validation
 def detect_document_type_change_keywords(original_type, comment):
     """Detect document type changes using keyword matching as a fallback method"""
-    # Clean up comment text and convert to lowercase for matching
-    comment_lower = comment.lower().strip()
-    
-    # Map of document types to their relevant keywords
-    document_keywords = {
-        "nda": ["non-disclosure", "nda", "confidentiality agreement", "secrecy agreement"],
-        "terms": ["terms of service", "terms of use", "tos", "terms and conditions", "service agreement"],
-        "privacy": ["privacy policy", "privacy notice", "data policy", "personal data", "gdpr", "ccpa"],
-        "contract": ["freelance contract", "contractor agreement", "freelancer agreement", "service contract"],
-        "employee": ["employment agreement", "employment contract", "staff contract", "labor contract", "work agreement"],
-        "partnership": ["partnership agreement", "partnership contract", "joint venture", "business partnership"]
-    }
-    
-    # Create a list of all document types except the original
-    other_doc_types = [doc_type for doc_type in document_keywords.keys() if doc_type != original_type]
-    
-    # Check if any keywords from other document types appear in the comment
-    for doc_type in other_doc_types:
-        for keyword in document_keywords[doc_type]:
-            if keyword in comment_lower:
-                return True, doc_type, f"Found keyword '{keyword}' suggesting a change to {doc_type}"
-    
-    # Special case for detecting phrases about changing document types
-    change_indicators = [
-        "change it to", "convert to", "make it a", "transform into", "instead make", 
-        "should be a", "replace with", "switch to", "change the document", "different document",
-        "document type", "type of document", "convert the", "need a different", "not a"
-    ]
-    
-    for indicator in change_indicators:
-        if indicator in comment_lower:
-            return True, "unknown", f"Found change indicator phrase: '{indicator}'"
-    
-    return False, "", ""
+    return document_type_change_detector.detect(original_type, comment)
 
-# Update the validate-revision-request endpoint
-@app.route('/api/validate-revision-request', methods=['POST'])
-def validate_revision_request():
-    """RAG-based validation to check if user is trying to change document type"""
-    try:
-        data = request.get_json()
-        session_id = data.get('sessionId')
-        comment = data.get('comment')
-        
-        if not session_id or not comment:
-            return jsonify({'error': 'Both sessionId and comment are required'}), 400
-            
-        # Retrieve the session to get the original document type
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            form_data = json.loads(session.metadata.get('form_data', '{}'))
-            original_document_type = form_data.get('document_type', '')
-            document_type_name = DOCUMENT_TYPES.get(original_document_type, "Custom Document")
-        except Exception as e:
-            return jsonify({'error': f'Invalid session: {str(e)}'}), 400
-        
-        # First perform keyword-based validation
-        is_changing, detected_type, explanation = detect_document_type_change_keywords(original_document_type, comment)
-        if is_changing:
-            return jsonify({
-                'is_valid': False,
-                'explanation': explanation,
-                'detected_target_type': detected_type,
-                'original_document_type': document_type_name,
-                'validation_method': 'keyword'
-            })
-            
-        # If no keywords detected, use LLM-based validation as a secondary check
-        prompt = f"""
+VALIDATION_SYSTEM_PROMPT = "You are a document validator assistant with expertise in legal documents. Your ONLY task is to detect document type change attempts."
+
+def build_validation_prompt(document_type_name, comment):
+    """Build the prompt asking the LLM whether a comment changes the document type"""
+    return f"""
 DOCUMENT TYPE VALIDATION TASK
 
 You are a document validator whose ONLY JOB is to prevent users from changing document types.
@@ -701,36 +971,125 @@ Return ONLY a valid JSON object with this exact format:
 }}
 """
 
-        # Generate the validation result using OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4",  # Using GPT-4 for better accuracy in validation
-            messages=[
-                {"role": "system", "content": "You are a document validator assistant with expertise in legal documents. Your ONLY task is to detect document type change attempts."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.2
-        )
+def validate_document_type_change(original_document_type, comment):
+    """Check whether a comment tries to change the document type.
+
+    Keyword matching runs first; otherwise a cached verdict for the same (or a
+    near-identical) comment is reused, then the local classifier settles
+    confident cases, and only uncertain comments are sent to gpt-4.
+    """
+    result = local_validation_verdict(original_document_type, comment)
+    if result is not None:
+        return result
+    llm_request = validation_request(original_document_type, comment)
+    completion = CompletionResult()
+    answer = llm_client.complete(**llm_request, result=completion)
+    observe_output('validation', original_document_type, llm_request, answer, completion)
+    return llm_validation_verdict(original_document_type, comment, answer)
+
+def local_validation_verdict(original_document_type, comment):
+    """Verdict from keywords, the verdict cache or the local classifier, or None if gpt-4 has to decide"""
+    is_changing, detected_type, explanation = detect_document_type_change_keywords(original_document_type, comment)
+    if is_changing:
+        return {
+            'is_changing_document_type': True,
+            'explanation': explanation,
+            'detected_target_type': detected_type,
+            'validation_method': 'keyword',
+            'cached': False
+        }
+
+    verdict = validation_cache.get(original_document_type, comment)
+    if verdict is not None:
+        return dict(verdict, validation_method='llm', cached=True)
+
+    if classifier_tier is not None:
+        is_changing, probability = classifier_tier.decide(original_document_type, comment)
+        if is_changing is not None:
+            return {
+                'is_changing_document_type': is_changing,
+                'explanation': f"Local classifier scored this request {probability:.2f} for a document type change",
+                'detected_target_type': "unknown" if is_changing else "",
+                'validation_method': 'classifier',
+                'cached': False
+            }
+    return None
+
+def validation_request(original_document_type, comment):
+    """LLM request asking gpt-4 whether a comment changes the document type"""
+    document_type_name = DOCUMENT_TYPES.get(original_document_type, "Custom Document")
+    model = "gpt-4"  # Using GPT-4 for better accuracy in validation
+    with metrics.stage('prompt_build'):
+        prompt = build_validation_prompt(document_type_name, token_budget.trim(comment, LLM_INPUT_TOKEN_LIMIT, model))
+    messages = [
+        {"role": "system", "content": VALIDATION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    budget = token_budget.plan('validation', known_document_type(original_document_type), model, messages,
+                               default=500, floor=100)
+    return {
+        'model': model,
+        'messages': messages,
+        'max_tokens': budget['max_tokens'],
+        'temperature': 0.2
+    }
+
+def llm_validation_verdict(original_document_type, comment, answer):
+    """Parse gpt-4's answer, then cache and log the verdict"""
+    # Parse the JSON response manually
+    try:
+        validation_result = json.loads(answer)
+    except json.JSONDecodeError:
+        # Fallback in case the response isn't valid JSON
+        app.logger.error(f"Failed to parse JSON response: {answer}")
+        # If we can't parse the JSON, be cautious and assume it might be a document change (not cached)
+        return {
+            'is_changing_document_type': True,
+            'explanation': "Could not validate the request properly, rejecting for safety.",
+            'detected_target_type': "unknown",
+            'validation_method': 'llm',
+            'cached': False
+        }
+
+    verdict = {
+        'is_changing_document_type': bool(validation_result.get('is_changing_document_type', True)),  # Default to True (invalid) if not specified
+        'explanation': validation_result.get('explanation', ''),
+        'detected_target_type': validation_result.get('detected_target_type', '')
+    }
+    validation_cache.set(original_document_type, comment, verdict)
+    validation_log.append(original_document_type, comment, verdict)
+    return dict(verdict, validation_method='llm', cached=False)
+
+# Update the validate-revision-request endpoint
+@app.route('/api/validate-revision-request', methods=['POST'])
+def validate_revision_request():
+    """RAG-based validation to check if user is trying to change document type"""
+    try:
+        data = request.get_json()
+        session_id = data.get('sessionId')
+        comment = data.get('comment')
         
-        # Parse the JSON response manually
+        if not session_id or not comment:
+            return jsonify({'error': 'Both sessionId and comment are required'}), 400
+            
+        # Retrieve the session to get the original document type
         try:
-            validation_result = json.loads(response.choices[0].message.content)
-        except json.JSONDecodeError:
-            # Fallback in case the response isn't valid JSON
-            app.logger.error(f"Failed to parse JSON response: {response.choices[0].message.content}")
-            # If we can't parse the JSON, be cautious and assume it might be a document change
-            validation_result = {
-                "is_changing_document_type": True,
-                "explanation": "Could not validate the request properly, rejecting for safety.",
-                "detected_target_type": "unknown"
-            }
+            session = retrieve_checkout_session(session_id)
+            form_data = json.loads(session.metadata.get('form_data', '{}'))
+            original_document_type = form_data.get('document_type', '')
+            document_type_name = DOCUMENT_TYPES.get(original_document_type, "Custom Document")
+        except Exception as e:
+            return jsonify({'error': f'Invalid session: {str(e)}'}), 400
+        set_metrics_document_type(original_document_type)
         
+        result = validate_document_type_change(original_document_type, comment)
         return jsonify({
-            'is_valid': not validation_result.get('is_changing_document_type', True),  # Default to True (invalid) if not specified
-            'explanation': validation_result.get('explanation', ''),
-            'detected_target_type': validation_result.get('detected_target_type', ''),
+            'is_valid': not result['is_changing_document_type'],
+            'explanation': result['explanation'],
+            'detected_target_type': result['detected_target_type'],
             'original_document_type': document_type_name,
-            'validation_method': 'llm'
+            'validation_method': result['validation_method'],
+            'cached': result['cached']
         })
             
     except Exception as e:
@@ -752,95 +1111,23 @@ def submit_document_feedback():
         if not bypass_validation:
             try:
                 # Retrieve the session to get the original document type
-                session = stripe.checkout.Session.retrieve(session_id)
+                session = retrieve_checkout_session(session_id)
                 form_data = json.loads(session.metadata.get('form_data', '{}'))
                 original_document_type = form_data.get('document_type', '')
                 document_type_name = DOCUMENT_TYPES.get(original_document_type, "Custom Document")
+                set_metrics_document_type(original_document_type)
                 
-                # First perform keyword-based validation
-                is_changing, detected_type, explanation = detect_document_type_change_keywords(original_document_type, comment)
-                if is_changing:
+                result = validate_document_type_change(original_document_type, comment)
+                if result['is_changing_document_type']:
                     return jsonify({
                         'success': False,
                         'validation_failed': True,
                         'message': 'Document type change detected',
-                        'explanation': explanation,
-                        'detected_target_type': detected_type,
+                        'explanation': result['explanation'],
+                        'detected_target_type': result['detected_target_type'],
                         'original_document_type': document_type_name,
-                        'validation_method': 'keyword'
-                    }), 400
-                
-                # Use LLM to check if the user is trying to change the document type
-                prompt = f"""
-DOCUMENT TYPE VALIDATION TASK
-
-You are a document validator whose ONLY JOB is to prevent users from changing document types.
-
-Original document type: {document_type_name}
-
-User's change request:
-```
-{comment}
-```
-
-INSTRUCTIONS (EXTREMELY IMPORTANT):
-1. Your ONLY task is to determine if the user is trying to change the document type
-2. You must be EXTREMELY STRICT in your analysis - any indication of changing document type should be flagged
-3. Pay special attention to any text that suggests changing the document from {document_type_name} to any other type
-4. Flag requests trying to convert their {document_type_name} to ANY other type of document
-5. Examples of document types: Non-Disclosure Agreement (NDA), Website Terms of Service, Privacy Policy, Freelance Contract, Employment Agreement, Partnership Agreement
-
-Examples of document type change attempts to catch:
-- "Can you turn this into a Freelance Contract instead?"
-- "I need this to be a Privacy Policy, not a Terms of Service"
-- "Please modify this to work as an Employment Agreement"
-- "Add sections that would make this function as a Partnership Agreement"
-- "I actually need a different type of document"
-
-This is CRITICAL: If there is ANY doubt, classify it as a document type change. False positives are preferred over false negatives.
-
-Return ONLY a valid JSON object with this exact format:
-{{
-  "is_changing_document_type": true/false,
-  "explanation": "Your detailed explanation",
-  "detected_target_type": "The document type they are trying to change to (if any)"
-}}
-"""
-
-                # Generate the validation result using OpenAI
-                response = client.chat.completions.create(
-                    model="gpt-4",  # Using GPT-4 for better accuracy in validation
-                    messages=[
-                        {"role": "system", "content": "You are a document validator assistant with expertise in legal documents. Your ONLY task is to detect document type change attempts."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=500,
-                    temperature=0.2
-                )
-                
-                # Parse the JSON response manually
-                try:
-                    validation_result = json.loads(response.choices[0].message.content)
-                except json.JSONDecodeError:
-                    # Fallback in case the response isn't valid JSON
-                    app.logger.error(f"Failed to parse JSON response: {response.choices[0].message.content}")
-                    # If we can't parse the JSON, be cautious and assume it might be a document change
-                    validation_result = {
-                        "is_changing_document_type": True,
-                        "explanation": "Could not validate the request properly, rejecting for safety.",
-                        "detected_target_type": "unknown"
-                    }
-                
-                # Check if the validation failed
-                if validation_result.get('is_changing_document_type', True):  # Default to True if not specified
-                    return jsonify({
-                        'success': False,
-                        'validation_failed': True,
-                        'message': 'Document type change detected',
-                        'explanation': validation_result.get('explanation', ''),
-                        'detected_target_type': validation_result.get('detected_target_type', ''),
-                        'original_document_type': document_type_name,
-                        'validation_method': 'llm'
+                        'validation_method': result['validation_method'],
+                        'cached': result['cached']
                     }), 400
             except Exception as validation_error:
                 app.logger.error(f"Validation error: {str(validation_error)}")
@@ -854,77 +1141,77 @@ Return ONLY a valid JSON object with this exact format:
         # Continue with document generation if validation passes
         # Retrieve the session to verify it exists
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = retrieve_checkout_session(session_id)
             form_data = json.loads(session.metadata.get('form_data', '{}'))
         except Exception as e:
             return jsonify({'error': f'Invalid session: {str(e)}'}), 400
+        set_metrics_document_type(form_data.get('document_type'))
             
         # Create a revision record
-        revision_id = uuid.uuid4().hex
-        feedback_file = os.path.join(DOWNLOAD_FOLDER, f"feedback_{revision_id}.json")
-        
-        revision_data = {
-            'session_id': session_id,
-            'revision_id': revision_id,
-            'comment': comment,
-            'timestamp': datetime.now().isoformat(),
-            'status': 'pending',
-            'form_data': form_data
-        }
-        
-        with open(feedback_file, 'w') as f:
-            json.dump(revision_data, f, indent=2)
+        revision_data = start_revision(session_id, comment, form_data)
             
         # Schedule or trigger document update process
         # For this implementation, we'll generate the updated document immediately
         try:
-            updated_document = generate_revised_document(revision_data)
-            
-            # Update the revision status
-            revision_data['status'] = 'completed'
-            revision_data['completed_at'] = datetime.now().isoformat()
-            
-            with open(feedback_file, 'w') as f:
-                json.dump(revision_data, f, indent=2)
+            generate_revised_document(revision_data)
+            finish_revision(revision_data)
                 
             return jsonify({
                 'success': True,
                 'message': 'Your document has been updated successfully',
-                'revision_id': revision_id
+                'revision_id': revision_data['revision_id']
             })
             
         except Exception as update_error:
             app.logger.error(f"Error updating document: {str(update_error)}")
             # Mark the revision as failed
-            revision_data['status'] = 'failed'
-            revision_data['error'] = str(update_error)
-            
-            with open(feedback_file, 'w') as f:
-                json.dump(revision_data, f, indent=2)
+            finish_revision(revision_data, error=str(update_error))
                 
             return jsonify({
                 'success': False,
                 'message': 'We received your feedback but could not generate an updated document. Our team will review it.',
-                'revision_id': revision_id
+                'revision_id': revision_data['revision_id']
             }), 500
             
     except Exception as e:
         app.logger.error(f"Error submitting feedback: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def generate_revised_document(revision_data):
-    """Generate an updated document based on user feedback"""
-    session_id = revision_data['session_id']
-    revision_id = revision_data['revision_id']
-    comment = revision_data['comment']
-    form_data = revision_data['form_data']
-    
-    # Get the original document text by generating it again
-    # In a production system, you might want to store and retrieve the original text
-    original_result = generate_document(form_data, generate_pdf=False, generate_docx=False)
-    original_text = original_result.get('preview', '')
-    
-    # Create a prompt for updating the document
+def start_revision(session_id, comment, form_data):
+    """Record a pending revision of a session's document and return its data"""
+    revision_data = {
+        'session_id': session_id,
+        'revision_id': uuid.uuid4().hex,
+        'comment': comment,
+        'timestamp': datetime.now().isoformat(),
+        'status': 'pending',
+        'form_data': form_data
+    }
+    with metrics.stage('revision_journal'):
+        revision_catalog.record(revision_data)
+    return revision_data
+
+def finish_revision(revision_data, error=None):
+    """Mark a revision completed, or failed with ``error``"""
+    if error is None:
+        revision_data['status'] = 'completed'
+        revision_data['completed_at'] = datetime.now().isoformat()
+        changes = {'status': 'completed', 'completed_at': revision_data['completed_at']}
+    else:
+        revision_data['status'] = 'failed'
+        revision_data['error'] = error
+        changes = {'status': 'failed', 'error': error}
+    with metrics.stage('revision_journal'):
+        revision_catalog.update(revision_data['revision_id'], **changes)
+
+REVISION_MODEL = "gpt-3.5-turbo"
+
+def complete_revision(messages, max_tokens, temperature):
+    """LLM call used by the revision engine, with max_tokens capped to what the prompt leaves of the context window"""
+    budget = token_budget.plan('revision', '', REVISION_MODEL, messages, default=max_tokens)
+    return llm_client.complete(REVISION_MODEL, messages, max_tokens=budget['max_tokens'], temperature=temperature)
+
+def full_revision_messages(original_text, comment):
     prompt = f"""
 I have a legal document that needs to be updated based on user feedback. 
 
@@ -941,49 +1228,97 @@ The user has requested the following changes:
 Please provide the complete updated document with the requested changes incorporated. 
 Return only the revised document text, properly formatted with all original sections and with the requested changes applied.
 """
+    return [
+        {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def full_revision_tokens(original_text):
+    # The whole document comes back, so size the output from its length rather than a fixed limit
+    return max(token_budget.rewrite_tokens(original_text, REVISION_MODEL), 1000)
 
-    # Generate the updated document using OpenAI
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a legal document revision assistant. Update documents precisely according to user feedback while maintaining their professional structure and format."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=4000,
+def revise_full_document(original_text, comment):
+    """Ask the LLM for the complete document with the requested changes applied"""
+    return complete_revision(
+        full_revision_messages(original_text, comment),
+        max_tokens=full_revision_tokens(original_text),
         temperature=0.7
     )
+
+def full_revision_fits(original_text, comment):
+    """Whether the document and its complete rewrite fit in one request"""
+    return token_budget.fits(REVISION_MODEL, full_revision_messages(original_text, comment),
+                             full_revision_tokens(original_text))
+
+# Documents too long for one full revision are revised section by section instead
+revision_engine = RevisionEngine(
+    complete_revision,
+    max_workers=int(os.getenv("REVISION_SECTION_WORKERS", 4)),
+    fits_full_revision=full_revision_fits
+)
+
+def generate_revised_document(revision_data):
+    """Generate an updated document based on user feedback"""
+    session_id = revision_data['session_id']
+    comment = token_budget.trim(revision_data['comment'], LLM_INPUT_TOKEN_LIMIT, REVISION_MODEL)
+    form_data = revision_data['form_data']
     
-    updated_text = response.choices[0].message.content
-    
-    # Save the updated document in various formats
-    document_type = form_data.get('document_type', 'document')
-    business_name = form_data.get('business_name', 'Business')
+    # Build on the session's latest revision, or on the stored original document
+    parent = revision_parent(session_id)
+    if parent is None:
+        original_result = get_session_document(session_id, form_data, generate_pdf=False, generate_docx=False)
+        parent = revision_parent(session_id, original_result.get('preview', ''))
+    parent_id, original_text = parent
     
-    # Generate PDF
-    pdf_filename = f"{document_type}_rev_{revision_id}.pdf"
-    pdf_filepath = os.path.join(REVISIONS_FOLDER, pdf_filename)
-    create_pdf(updated_text, pdf_filepath, business_name, DOCUMENT_TYPES.get(document_type, "Legal Document"))
+    # Rewrite only the sections the comment targets, or the whole document if it has to
+    revision = revision_engine.revise(
+        original_text,
+        comment,
+        DOCUMENT_TYPES.get(form_data.get('document_type'), "legal document"),
+        full_revision=revise_full_document
+    )
+    return save_revision(revision_data, parent_id, revision)
+
+def revision_parent(session_id, original_text=None):
+    """(version id, text) a session's next revision builds on, or None if the original document is needed first"""
+    parent = revision_lineage.latest(session_id)
+    if parent is not None:
+        parent_id = parent['version_id']
+    elif original_text is None:
+        return None
+    else:
+        parent_id = revision_lineage.ensure_base(session_id, original_text)
+    return parent_id, revision_lineage.text(parent_id)
+
+def save_revision(revision_data, parent_id, revision):
+    """Render a revision engine result and store it as a new version of the session's document"""
+    session_id = revision_data['session_id']
+    revision_id = revision_data['revision_id']
+    form_data = revision_data['form_data']
+    updated_text = revision['text']
+    app.logger.info(f"Revision {revision_id} applied in {revision['mode']} mode (sections: {revision['sections']})")
     
-    # Generate DOCX
-    docx_filename = f"{document_type}_rev_{revision_id}.docx"
-    docx_filepath = os.path.join(REVISIONS_FOLDER, docx_filename)
-    create_docx(updated_text, docx_filepath, business_name, DOCUMENT_TYPES.get(document_type, "Legal Document"))
+    # Save the updated document in various formats (rendered concurrently, reused if unchanged)
+    filenames = render_artifacts(updated_text, ['pdf', 'docx'], REVISIONS_FOLDER,
+                                 form_data.get('document_type', 'document'), form_data.get('business_name', 'Business'))
+    pdf_filename = filenames['pdf']
+    docx_filename = filenames['docx']
     
-    # Store revision info
+    # Store the revision as a delta against its parent version
     revision_info = {
         'session_id': session_id,
         'revision_id': revision_id,
-        'original_text': original_text,
-        'updated_text': updated_text,
+        'parent_id': parent_id,
         'pdf_filename': pdf_filename,
         'docx_filename': docx_filename,
+        'revision_mode': revision['mode'],
+        'revised_sections': revision['sections'],
         'timestamp': datetime.now().isoformat()
     }
+    revision_lineage.add_revision(revision_id, session_id, parent_id, updated_text, revision_info)
+    revision_catalog.update(revision_id, pdf_filename=pdf_filename, docx_filename=docx_filename)
     
-    revision_info_file = os.path.join(REVISIONS_FOLDER, f"revision_info_{revision_id}.json")
-    with open(revision_info_file, 'w') as f:
-        json.dump(revision_info, f, indent=2)
-    
+    revision_info['updated_text'] = updated_text
     return revision_info
 
 @app.route('/api/document-revisions/<session_id>', methods=['GET'])
@@ -994,36 +1329,70 @@ def get_document_revisions(session_id):
         
     try:
         # Verify the session exists
-        stripe.checkout.Session.retrieve(session_id)
+        retrieve_checkout_session(session_id)
         
-        # Find all revisions for this session
-        revisions = []
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
         
-        # Search in the downloads folder for feedback files
-        for file in os.listdir(DOWNLOAD_FOLDER):
-            if file.startswith("feedback_") and file.endswith(".json"):
-                try:
-                    with open(os.path.join(DOWNLOAD_FOLDER, file), 'r') as f:
-                        feedback_data = json.load(f)
-                        if feedback_data.get('session_id') == session_id:
-                            revisions.append({
-                                'revision_id': feedback_data.get('revision_id'),
-                                'status': feedback_data.get('status'),
-                                'timestamp': feedback_data.get('timestamp'),
-                                'comment': feedback_data.get('comment')
-                            })
-                except Exception as e:
-                    app.logger.error(f"Error reading feedback file {file}: {str(e)}")
+        # Look the revisions up in the catalog, newest first
+        rows, total = revision_catalog.list_for_session(session_id, limit=limit, offset=offset)
+        revisions = [{
+            'revision_id': row['revision_id'],
+            'status': row['status'],
+            'timestamp': row['timestamp'],
+            'comment': row['comment']
+        } for row in rows]
         
         return jsonify({
             'session_id': session_id,
-            'revisions': sorted(revisions, key=lambda x: x.get('timestamp', ''), reverse=True)
+            'revisions': revisions,
+            'total': total,
+            'limit': limit,
+            'offset': offset
         })
         
     except Exception as e:
         app.logger.error(f"Error retrieving revisions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/revision-status/<revision_id>', methods=['GET'])
+def get_revision_status(revision_id):
+    """Get the processing status of a revision"""
+    revision = revision_catalog.get(revision_id)
+    if revision is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    
+    return jsonify({
+        'revision_id': revision_id,
+        'session_id': revision['session_id'],
+        'status': revision['status'],
+        'timestamp': revision['timestamp'],
+        'completed_at': revision['completed_at'],
+        'error': revision['error']
+    })
+
+def load_revision(revision_id, include_text=True):
+    """Return a revision's info (filenames and, optionally, updated_text) or None.
+
+    Revisions live in the lineage store; revisions created before it existed
+    are still read from their revision_info_<id>.json file.
+    """
+    version = revision_lineage.get(revision_id)
+    if version is not None and version['parent_id'] is not None:
+        revision_info = dict(version['metadata'])
+        if include_text:
+            revision_info['updated_text'] = revision_lineage.text(revision_id)
+        return revision_info
+    
+    revision_info_file = os.path.join(REVISIONS_FOLDER, f"revision_info_{secure_filename(revision_id)}.json")
+    if not os.path.exists(revision_info_file):
+        return None
+    with open(revision_info_file, 'r') as f:
+        return json.load(f)
+
 @app.route('/api/revised-document/<revision_id>', methods=['GET'])
 def get_revised_document(revision_id):
     """Get the revised document preview"""
@@ -1031,15 +1400,11 @@ def get_revised_document(revision_id):
         return jsonify({'error': 'Revision ID is required'}), 400
         
     try:
-        # Look for the revision info file
-        revision_info_file = os.path.join(REVISIONS_FOLDER, f"revision_info_{revision_id}.json")
+        revision_info = load_revision(revision_id)
         
-        if not os.path.exists(revision_info_file):
+        if revision_info is None:
             return jsonify({'error': 'Revision not found'}), 404
             
-        with open(revision_info_file, 'r') as f:
-            revision_info = json.load(f)
-            
         return jsonify({
             'revision_id': revision_id,
             'preview': revision_info.get('updated_text')
@@ -1049,6 +1414,21 @@ def get_revised_document(revision_id):
         app.logger.error(f"Error retrieving revised document: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def rerender_revision(revision_id, fmt):
+    """Render a revision file again after the storage collector evicted it; returns the new filename or None"""
+    version = revision_lineage.get(revision_id)
+    revision = revision_catalog.get(revision_id)
+    if version is None or version['parent_id'] is None or revision is None:
+        return None
+    form_data = revision['form_data'] or {}
+    with document_flight.lock(f"revision-render:{revision_id}:{fmt}"):
+        filename = render_artifacts(revision_lineage.text(revision_id), [fmt], REVISIONS_FOLDER,
+                                    form_data.get('document_type', 'document'),
+                                    form_data.get('business_name', 'Business'))[fmt]
+    revision_lineage.update_metadata(revision_id, **{f"{fmt}_filename": filename})
+    revision_catalog.update(revision_id, **{f"{fmt}_filename": filename})
+    return filename
+
 @app.route('/api/download-revision/<format>/<revision_id>', methods=['GET'])
 def download_revised_document(format, revision_id):
     """Download a revised document in the specified format"""
@@ -1056,26 +1436,70 @@ def download_revised_document(format, revision_id):
         return jsonify({'error': 'Valid revision ID and format (pdf/docx) are required'}), 400
         
     try:
-        # Look for the revision info file
-        revision_info_file = os.path.join(REVISIONS_FOLDER, f"revision_info_{revision_id}.json")
+        revision_info = load_revision(revision_id, include_text=False)
         
-        if not os.path.exists(revision_info_file):
+        if revision_info is None:
             return jsonify({'error': 'Revision not found'}), 404
             
-        with open(revision_info_file, 'r') as f:
-            revision_info = json.load(f)
-            
         filename = revision_info.get(f'{format}_filename')
+        if filename and not os.path.exists(os.path.join(REVISIONS_FOLDER, filename)):
+            filename = rerender_revision(revision_id, format) or filename
         
         if not filename:
             return jsonify({'error': f'No {format.upper()} file found for this revision'}), 404
             
-        return send_from_directory(REVISIONS_FOLDER, filename, as_attachment=True)
+        return send_artifact(REVISIONS_FOLDER, filename)
         
     except Exception as e:
         app.logger.error(f"Error downloading revised document: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Report the status of a background job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    }
+    if job['status'] == 'completed':
+        response['result'] = job['result']
+    elif job['error']:
+        response['error'] = job['error']
+    return jsonify(response)
+
+def run_generate_document_job(payload):
+    """Job handler: generate and store the document for a paid session"""
+    # Finish well before the job's lease expires and another worker takes it over
+    metrics.set_context(endpoint='job:generate_document')
+    set_metrics_document_type(payload['form_data'].get('document_type'))
+    with app.app_context(), llm_deadline(job_queue.lease_seconds * 0.8):
+        return get_session_document(payload['session_id'], payload['form_data'])
+
+job_workers = JobWorkerPool(
+    job_queue,
+    {'generate_document': run_generate_document_job},
+    workers=int(os.getenv("JOB_WORKERS", 4))
+)
+
+# Start background services, except inside render processes that re-import this module
+if multiprocessing.parent_process() is None:
+    maintain_revision_journal()
+    render_service.start()
+    health_prober.start()
+    # STORAGE_GC_INTERVAL=0 disables the collector thread (run `python storage_gc.py` instead)
+    if storage_collector.interval > 0:
+        storage_collector.start()
+    # Set JOB_WORKERS=0 to keep web processes free and run worker.py separately
+    if job_workers.workers > 0:
+        job_workers.start()
+
 # Add OPTIONS handler for all routes
 @app.after_request
 def after_request(response):
@@ -0,0 +1,40 @@
+"""Content-addressed names for rendered PDF/DOCX files.
+
+A rendered file is named after a hash of everything that determines its
+bytes: the document text, format, title inputs (business name, document
+type), the date printed on it and the renderer/library versions. Rendering the
+same inputs again finds the existing file instead of building a new one, and
+since a name never gets different content, its hash doubles as a strong
+ETag and the file can be cached indefinitely by browsers and CDNs.
+"""
+import hashlib
+import re
+
+import docx
+import reportlab
+
+from renderers import RENDERER_VERSION
+
+KEY_LENGTH = 32
+ARTIFACT_PATTERN = re.compile(rf'_([0-9a-f]{{{KEY_LENGTH}}})\.(pdf|docx)$')
+VERSION = f"{RENDERER_VERSION}/reportlab-{reportlab.Version}/python-docx-{getattr(docx, '__version__', '')}"
+
+
+def artifact_key(text, fmt, business_name, document_type, date):
+    """Hash of the inputs that determine a rendered file's content."""
+    digest = hashlib.sha256()
+    for part in (VERSION, fmt, str(business_name), str(document_type), date, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:KEY_LENGTH]
+
+
+def artifact_filename(prefix, key, fmt):
+    """``<prefix>_<key>.<fmt>``; the prefix only keeps downloaded file names readable."""
+    return f"{prefix}_{key}.{fmt}"
+
+
+def artifact_etag(filename):
+    """The content key of a content-addressed file name, or None for other names."""
+    match = ARTIFACT_PATTERN.search(filename)
+    return match.group(1) if match else None
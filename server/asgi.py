@@ -0,0 +1,511 @@
+"""ASGI entry point that keeps LLM-bound work off worker threads.
+
+The routes that wait on OpenAI for seconds at a time (streams, previews,
+revision validation, document feedback and on-demand generation) are native
+async routes using AsyncOpenAI, and document generation jobs run as tasks on
+the event loop, so one worker process can have hundreds of generations in
+flight. Every other route is the Flask app, run in a thread pool through WSGI
+middleware. Stripe has no async client, so Stripe calls, the SQLite stores
+(token budgets included) and waits on the render processes run in the thread
+pool, never on the event loop.
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+# Generation jobs run on the event loop instead of in job worker threads
+os.environ["JOB_WORKERS"] = "0"
+
+from a2wsgi import WSGIMiddleware  # noqa: E402
+from limits import parse as parse_limit  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+from starlette.middleware import Middleware  # noqa: E402
+from starlette.middleware.cors import CORSMiddleware  # noqa: E402
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse  # noqa: E402
+from starlette.routing import Mount, Route  # noqa: E402
+
+import app as server  # noqa: E402
+import metrics  # noqa: E402
+from jobs import AsyncJobRunner  # noqa: E402
+from llm import AsyncLLMClient, CompletionResult, deadline as llm_deadline, set_deadline as set_llm_deadline  # noqa: E402
+
+async_client = AsyncOpenAI(api_key=server.client.api_key, base_url=server.client.base_url)
+# Shares the circuit breaker with the sync client used by the Flask routes
+async_llm = AsyncLLMClient(
+    async_client,
+    server.llm_client.breaker,
+    max_attempts=server.llm_client.max_attempts,
+    on_complete=metrics.observe_llm_call
+)
+
+DEFAULT_RATE_LIMITS = [parse_limit(limit) for limit in server.DEFAULT_RATE_LIMITS]
+# LLM_REQUEST_DEADLINE is sized for gunicorn's sync worker timeout, which doesn't apply to async
+# routes; they get the same budget as generation jobs so long document streams aren't cut off
+ASGI_LLM_DEADLINE = float(os.getenv("ASGI_LLM_DEADLINE", server.job_queue.lease_seconds * 0.8))
+
+
+def start_request(request, endpoint, *limits):
+    """Per-request setup done by Flask's before_request hooks and limiter; returns a 429 response if limited"""
+    set_llm_deadline(ASGI_LLM_DEADLINE)
+    metrics.set_context(endpoint=endpoint, document_type='')
+    if not server.limiter.enabled:
+        return None
+    client = request.client.host if request.client else '127.0.0.1'
+    for limit in DEFAULT_RATE_LIMITS + [parse_limit(limit) for limit in limits]:
+        if not server.limiter.limiter.hit(limit, endpoint, client):
+            return JSONResponse({'error': f"Rate limit exceeded: {limit}"}, status_code=429)
+    return None
+
+
+def is_localhost(request):
+    remote_addr = request.client.host if request.client else ''
+    return remote_addr in ("127.0.0.1", "localhost") or remote_addr.startswith(("192.168.", "10."))
+
+
+def sse_response(events):
+    return StreamingResponse(events, media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def retrieve_form_data(session_id):
+    session = await run_in_threadpool(server.retrieve_checkout_session, session_id)
+    return json.loads(session.metadata.get('form_data', '{}'))
+
+
+def session_document(session_id, form_data, generate_pdf=True, generate_docx=False):
+    """Document result for a session (renders missing files in the render pool); runs in a thread"""
+    with server.app.app_context():
+        return server.get_session_document(session_id, form_data, generate_pdf, generate_docx)
+
+
+async def stored_document(session_id, form_data):
+    """``server.get_session_document``'s stored text, generated with the async client the first time"""
+    stored = await run_in_threadpool(server.document_store.get, session_id)
+    if stored is None:
+        # Same lock as the sync routes and generation jobs, so only one text is ever stored
+        async with server.document_flight.async_lock(f"document:{session_id}"):
+            stored = await run_in_threadpool(server.document_store.get, session_id)
+            if stored is None:
+                text = await generate_document_text(form_data)
+                stored = await run_in_threadpool(server.document_store.add, session_id, text, form_data)
+    return stored
+
+
+async def generate_document_text(form_data):
+    llm_request = await run_in_threadpool(server.generation_request, form_data)
+    completion = CompletionResult()
+    text = await async_llm.complete(**llm_request, result=completion)
+    await run_in_threadpool(server.observe_output, 'generation', form_data.get('document_type'), llm_request, text,
+                            completion)
+    return text
+
+
+async def artifact_response(request, folder, filename):
+    """``server.send_artifact`` for session files: ETag, conditional and range requests, always revalidated"""
+    await run_in_threadpool(server.touch_artifact, folder, filename)
+    headers = {'Cache-Control': 'private, no-cache'}
+    etag = server.artifact_etag(filename)
+    if etag:
+        headers['ETag'] = f'"{etag}"'
+        if_none_match = [tag.strip().removeprefix('W/') for tag in request.headers.get('if-none-match', '').split(',')]
+        if headers['ETag'] in if_none_match or '*' in if_none_match:
+            return Response(status_code=304, headers=headers)
+    return FileResponse(os.path.join(folder, filename), headers=headers, filename=filename)
+
+
+async def validate_document_type_change(original_document_type, comment):
+    result = await run_in_threadpool(server.local_validation_verdict, original_document_type, comment)
+    if result is not None:
+        return result
+    llm_request = await run_in_threadpool(server.validation_request, original_document_type, comment)
+    completion = CompletionResult()
+    answer = await async_llm.complete(**llm_request, result=completion)
+    await run_in_threadpool(server.observe_output, 'validation', original_document_type, llm_request, answer,
+                            completion)
+    return await run_in_threadpool(server.llm_validation_verdict, original_document_type, comment, answer)
+
+
+async def validate_revision_request(request):
+    limited = start_request(request, 'validate_revision_request')
+    if limited:
+        return limited
+    try:
+        data = await request.json()
+        session_id = data.get('sessionId')
+        comment = data.get('comment')
+
+        if not session_id or not comment:
+            return JSONResponse({'error': 'Both sessionId and comment are required'}, status_code=400)
+
+        try:
+            form_data = await retrieve_form_data(session_id)
+            original_document_type = form_data.get('document_type', '')
+            document_type_name = server.DOCUMENT_TYPES.get(original_document_type, "Custom Document")
+        except Exception as e:
+            return JSONResponse({'error': f'Invalid session: {str(e)}'}, status_code=400)
+        server.set_metrics_document_type(original_document_type)
+
+        result = await validate_document_type_change(original_document_type, comment)
+        return JSONResponse({
+            'is_valid': not result['is_changing_document_type'],
+            'explanation': result['explanation'],
+            'detected_target_type': result['detected_target_type'],
+            'original_document_type': document_type_name,
+            'validation_method': result['validation_method'],
+            'cached': result['cached']
+        })
+
+    except Exception as e:
+        server.app.logger.error(f"Error validating revision request: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def preview_document(request):
+    limited = start_request(request, 'preview_document')
+    if limited:
+        return limited
+    if not is_localhost(request):
+        return JSONResponse({
+            "error": "This endpoint is only available in development mode",
+            "status": "error"
+        }, status_code=403)
+
+    try:
+        data = await request.json()
+        server.set_metrics_document_type(data.get('document_type'))
+        llm_request = await run_in_threadpool(server.preview_request, data)
+        completion = CompletionResult()
+        generated_text = await async_llm.complete(**llm_request, result=completion)
+        await run_in_threadpool(server.observe_output, 'preview', data.get('document_type'), llm_request,
+                                generated_text, completion)
+        return JSONResponse({
+            "preview": generated_text,
+            "status": "success"
+        })
+    except Exception as e:
+        return JSONResponse({
+            "error": str(e),
+            "status": "error"
+        }, status_code=500)
+
+
+async def stream_preview_document(request):
+    limited = start_request(request, 'stream_preview_document')
+    if limited:
+        return limited
+    if not is_localhost(request):
+        return JSONResponse({
+            "error": "This endpoint is only available in development mode",
+            "status": "error"
+        }, status_code=403)
+
+    data = await request.json()
+    server.set_metrics_document_type(data.get('document_type'))
+    try:
+        llm_request = await run_in_threadpool(server.preview_request, data)
+    except KeyError as e:
+        return JSONResponse({"error": f"Missing field: {str(e)}", "status": "error"}, status_code=400)
+
+    async def events():
+        chunks = []
+        try:
+            completion = CompletionResult()
+            async for delta in async_llm.stream(**llm_request, result=completion):
+                chunks.append(delta)
+                yield server.sse_event('chunk', {'delta': delta})
+            await run_in_threadpool(server.observe_output, 'preview', data.get('document_type'), llm_request,
+                                    ''.join(chunks), completion)
+            yield server.sse_event('done', {
+                "preview": ''.join(chunks),
+                "status": "success"
+            })
+        except Exception as e:
+            server.app.logger.error(f"Preview stream error: {str(e)}")
+            yield server.sse_event('error', {"error": str(e), "status": "error"})
+
+    return sse_response(events())
+
+
+async def stream_session_document(request):
+    limited = start_request(request, 'stream_session_document')
+    if limited:
+        return limited
+    session_id = request.query_params.get('session_id')
+    if not session_id:
+        return JSONResponse({'error': 'No session_id provided'}, status_code=400)
+
+    try:
+        form_data = await retrieve_form_data(session_id)
+    except Exception as e:
+        return JSONResponse({'error': f'Invalid session: {str(e)}'}, status_code=400)
+    server.set_metrics_document_type(form_data.get('document_type'))
+
+    async def events():
+        try:
+            stored = await run_in_threadpool(server.document_store.get, session_id)
+            if stored is None:
+                # Same lock as the sync route and generation jobs, so only one text is ever stored
+                async with server.document_flight.async_lock(f"document:{session_id}"):
+                    stored = await run_in_threadpool(server.document_store.get, session_id)
+                    if stored is None:
+                        chunks = []
+                        llm_request = await run_in_threadpool(server.generation_request, form_data)
+                        completion = CompletionResult()
+                        async for delta in async_llm.stream(**llm_request, result=completion):
+                            chunks.append(delta)
+                            yield server.sse_event('chunk', {'delta': delta})
+                        await run_in_threadpool(server.observe_output, 'generation', form_data.get('document_type'),
+                                                llm_request, ''.join(chunks), completion)
+                        stored = await run_in_threadpool(server.document_store.add, session_id, ''.join(chunks),
+                                                         form_data)
+                    else:
+                        yield server.sse_event('chunk', {'delta': stored['text']})
+            else:
+                yield server.sse_event('chunk', {'delta': stored['text']})
+
+            yield server.sse_event('done', await run_in_threadpool(session_document, session_id, form_data))
+        except Exception as e:
+            server.app.logger.error(f"Document stream error: {str(e)}")
+            yield server.sse_event('error', {'error': str(e)})
+
+    return sse_response(events())
+
+
+async def generate_test_document(request):
+    limited = start_request(request, 'generate_test_document')
+    if limited:
+        return limited
+    if not is_localhost(request):
+        return JSONResponse({
+            "error": "This endpoint is only available in development mode",
+            "status": "error"
+        }, status_code=403)
+
+    try:
+        data = await request.json()
+        server.set_metrics_document_type(data.get('document_type'))
+        text = await generate_document_text(data)
+        result = {
+            'success': True,
+            'preview': text
+        }
+        result.update(await run_in_threadpool(server.render_document_files, text, data, True, False))
+        return JSONResponse(result)
+    except Exception as e:
+        return JSONResponse({
+            "error": str(e),
+            "status": "error"
+        }, status_code=500)
+
+
+async def document_details(request):
+    limited = start_request(request, 'document_details')
+    if limited:
+        return limited
+    session_id = request.query_params.get('session_id')
+    if not session_id:
+        return JSONResponse({'error': 'No session_id provided'}, status_code=400)
+
+    try:
+        form_data = await retrieve_form_data(session_id)
+        server.set_metrics_document_type(form_data.get('document_type'))
+        stored = await stored_document(session_id, form_data)
+        return JSONResponse({
+            'preview': stored['text']
+        })
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+def session_file_endpoint(fmt):
+    """Route sending a session's document as ``fmt``, generating and rendering it first if needed"""
+    async def endpoint(request):
+        limited = start_request(request, f'generate_{fmt}_on_demand')
+        if limited:
+            return limited
+        session_id = request.query_params.get('session_id')
+        if not session_id:
+            return JSONResponse({'error': 'No session_id provided'}, status_code=400)
+
+        try:
+            form_data = await retrieve_form_data(session_id)
+            server.set_metrics_document_type(form_data.get('document_type'))
+            await stored_document(session_id, form_data)
+            result = await run_in_threadpool(session_document, session_id, form_data, fmt == 'pdf', fmt == 'docx')
+            return await artifact_response(request, server.DOWNLOAD_FOLDER, result[f'{fmt}_filename'])
+        except Exception as e:
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    return endpoint
+
+
+async def complete_revision(messages, max_tokens, temperature):
+    """``server.complete_revision`` with the async client"""
+    budget = await run_in_threadpool(server.token_budget.plan, 'revision', '', server.REVISION_MODEL, messages,
+                                     default=max_tokens)
+    return await async_llm.complete(server.REVISION_MODEL, messages, max_tokens=budget['max_tokens'],
+                                    temperature=temperature)
+
+
+async def revise_full_document(original_text, comment):
+    max_tokens = await run_in_threadpool(server.full_revision_tokens, original_text)
+    return await complete_revision(server.full_revision_messages(original_text, comment), max_tokens=max_tokens,
+                                   temperature=0.7)
+
+
+async def generate_revised_document(revision_data):
+    """``server.generate_revised_document`` with the LLM calls on the event loop"""
+    session_id = revision_data['session_id']
+    form_data = revision_data['form_data']
+    comment = await run_in_threadpool(server.token_budget.trim, revision_data['comment'], server.LLM_INPUT_TOKEN_LIMIT,
+                                      server.REVISION_MODEL)
+
+    parent = await run_in_threadpool(server.revision_parent, session_id)
+    if parent is None:
+        stored = await stored_document(session_id, form_data)
+        parent = await run_in_threadpool(server.revision_parent, session_id, stored['text'])
+    parent_id, original_text = parent
+
+    revision = await server.revision_engine.revise_async(
+        complete_revision,
+        original_text,
+        comment,
+        server.DOCUMENT_TYPES.get(form_data.get('document_type'), "legal document"),
+        full_revision=revise_full_document
+    )
+    return await run_in_threadpool(server.save_revision, revision_data, parent_id, revision)
+
+
+async def submit_document_feedback(request):
+    limited = start_request(request, 'submit_document_feedback')
+    if limited:
+        return limited
+    try:
+        data = await request.json()
+        session_id = data.get('sessionId')
+        comment = data.get('comment')
+        bypass_validation = data.get('bypassValidation', False)
+
+        if not session_id or not comment:
+            return JSONResponse({'error': 'Both sessionId and comment are required'}, status_code=400)
+
+        if not bypass_validation:
+            try:
+                form_data = await retrieve_form_data(session_id)
+                original_document_type = form_data.get('document_type', '')
+                document_type_name = server.DOCUMENT_TYPES.get(original_document_type, "Custom Document")
+                server.set_metrics_document_type(original_document_type)
+
+                result = await validate_document_type_change(original_document_type, comment)
+                if result['is_changing_document_type']:
+                    return JSONResponse({
+                        'success': False,
+                        'validation_failed': True,
+                        'message': 'Document type change detected',
+                        'explanation': result['explanation'],
+                        'detected_target_type': result['detected_target_type'],
+                        'original_document_type': document_type_name,
+                        'validation_method': result['validation_method'],
+                        'cached': result['cached']
+                    }, status_code=400)
+            except Exception as validation_error:
+                server.app.logger.error(f"Validation error: {str(validation_error)}")
+                return JSONResponse({
+                    'success': False,
+                    'validation_failed': True,
+                    'message': f'Validation error: {str(validation_error)}',
+                }, status_code=400)
+
+        try:
+            form_data = await retrieve_form_data(session_id)
+        except Exception as e:
+            return JSONResponse({'error': f'Invalid session: {str(e)}'}, status_code=400)
+        server.set_metrics_document_type(form_data.get('document_type'))
+
+        revision_data = await run_in_threadpool(server.start_revision, session_id, comment, form_data)
+        try:
+            await generate_revised_document(revision_data)
+            await run_in_threadpool(server.finish_revision, revision_data)
+            return JSONResponse({
+                'success': True,
+                'message': 'Your document has been updated successfully',
+                'revision_id': revision_data['revision_id']
+            })
+        except Exception as update_error:
+            server.app.logger.error(f"Error updating document: {str(update_error)}")
+            await run_in_threadpool(server.finish_revision, revision_data, error=str(update_error))
+            return JSONResponse({
+                'success': False,
+                'message': 'We received your feedback but could not generate an updated document. Our team will review it.',
+                'revision_id': revision_data['revision_id']
+            }, status_code=500)
+
+    except Exception as e:
+        server.app.logger.error(f"Error submitting feedback: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def generate_document_job(payload):
+    """Async job handler: same result as run_generate_document_job, with the LLM call on the event loop"""
+    session_id = payload['session_id']
+    form_data = payload['form_data']
+    metrics.set_context(endpoint='job:generate_document')
+    server.set_metrics_document_type(form_data.get('document_type'))
+    with llm_deadline(server.job_queue.lease_seconds * 0.8):
+        await stored_document(session_id, form_data)
+    return await run_in_threadpool(session_document, session_id, form_data)
+
+
+job_runner = AsyncJobRunner(
+    server.job_queue,
+    {'generate_document': generate_document_job},
+    concurrency=int(os.getenv("ASYNC_JOB_CONCURRENCY", 200))
+)
+
+
+@asynccontextmanager
+async def lifespan(_):
+    runner = asyncio.create_task(job_runner.run())
+    try:
+        yield
+    finally:
+        runner.cancel()
+        await async_client.close()
+
+
+def async_route(path, endpoint, methods):
+    # Flask-CORS covers the Flask routes; these need the same policy
+    return Route(path, endpoint, methods=methods + ['OPTIONS'], middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=server.CORS_ORIGINS,
+        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_headers=["Content-Type", "Authorization"],
+        expose_headers=["Content-Type", "Authorization"],
+        allow_credentials=True,
+        max_age=600
+    )])
+
+
+app = Starlette(
+    routes=[
+        async_route('/api/validate-revision-request', validate_revision_request, ['POST']),
+        async_route('/api/preview-document', preview_document, ['POST']),
+        async_route('/api/preview-document/stream', stream_preview_document, ['POST']),
+        async_route('/api/document-stream', stream_session_document, ['GET']),
+        async_route('/api/generate-test-document', generate_test_document, ['POST']),
+        async_route('/api/document-details', document_details, ['GET']),
+        async_route('/api/generate-pdf', session_file_endpoint('pdf'), ['GET']),
+        async_route('/api/generate-docx', session_file_endpoint('docx'), ['GET']),
+        async_route('/api/document-feedback', submit_document_feedback, ['POST']),
+        # Everything else, including /api/payment-success (which enqueues the async jobs above)
+        Mount('/', WSGIMiddleware(server.app, workers=int(os.getenv("ASGI_WSGI_THREADS", 16))))
+    ],
+    lifespan=lifespan
+)
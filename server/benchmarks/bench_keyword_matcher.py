@@ -0,0 +1,112 @@
+"""Micro-benchmark: compiled keyword matcher vs the per-keyword substring scan.
+
+Run from the server directory:
+
+    python benchmarks/bench_keyword_matcher.py [--repeat 200]
+
+Uses the production keyword tables. Checks that the legacy scan, the regex
+engine and (when pyahocorasick is installed) the Aho-Corasick engine give the
+same verdicts on random comments, then reports the time per comment for
+1KB-50KB comments with no match, an early match and a late match.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import keyword_matcher  # noqa: E402
+from keyword_matcher import (DOCUMENT_CHANGE_INDICATORS as CHANGE_INDICATORS,  # noqa: E402
+                             DOCUMENT_TYPE_KEYWORDS as DOCUMENT_KEYWORDS, DocumentTypeChangeDetector)
+
+PROSE = ("Please update the payment section so that invoices are due within thirty days of receipt, "
+         "clarify that the receiving party may share information with its advisers, and make the "
+         "termination clause mutual with two weeks written notice. ")
+
+
+def legacy_detect(original_type, comment):
+    """detect_document_type_change_keywords as it was: one substring scan per keyword."""
+    comment_lower = comment.lower().strip()
+    for doc_type in [doc_type for doc_type in DOCUMENT_KEYWORDS if doc_type != original_type]:
+        for keyword in DOCUMENT_KEYWORDS[doc_type]:
+            if keyword in comment_lower:
+                return True, doc_type, f"Found keyword '{keyword}' suggesting a change to {doc_type}"
+    for indicator in CHANGE_INDICATORS:
+        if indicator in comment_lower:
+            return True, "unknown", f"Found change indicator phrase: '{indicator}'"
+    return False, "", ""
+
+
+def random_comment(rng):
+    phrases = [keyword for keywords in DOCUMENT_KEYWORDS.values() for keyword in keywords] + CHANGE_INDICATORS
+    words = PROSE.split() + ["terms", "of", "nd", "a", "not", "partner", "ship", "privacy", "data", "CCPA", "Tos"]
+    parts = []
+    for _ in range(rng.randint(0, 40)):
+        parts.append(rng.choice(phrases) if rng.random() < 0.05 else rng.choice(words))
+    separator = rng.choice([" ", "", "\n"])
+    return separator.join(parts)
+
+
+def check_equivalence(detector, count, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        comment = random_comment(rng)
+        original_type = rng.choice(list(DOCUMENT_KEYWORDS) + ["unknown"])
+        expected = legacy_detect(original_type, comment)
+        actual = detector.detect(original_type, comment)
+        if expected != actual:
+            raise AssertionError(f"Mismatch for {comment!r} ({original_type}): {expected} != {actual}")
+
+
+def time_per_call(fn, comment, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn("nda", comment)
+    return (time.perf_counter() - start) / repeat
+
+
+def detectors():
+    """One detector per available engine."""
+    engines = {}
+    aho = keyword_matcher.ahocorasick
+    try:
+        keyword_matcher.ahocorasick = None
+        engines['regex'] = DocumentTypeChangeDetector(DOCUMENT_KEYWORDS, CHANGE_INDICATORS)
+    finally:
+        keyword_matcher.ahocorasick = aho
+    if aho is not None:
+        engines['aho-corasick'] = DocumentTypeChangeDetector(DOCUMENT_KEYWORDS, CHANGE_INDICATORS)
+    return engines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--check', type=int, default=20000, help="random comments to compare")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engines = detectors()
+    print(f"compile ({', '.join(engines)}): {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    for name, detector in engines.items():
+        check_equivalence(detector, args.check)
+        print(f"equivalence: {args.check} random comments match ({name})")
+
+    print(f"{'case':<22}{'legacy':>12}" + ''.join(f"{name:>14}{'speedup':>9}" for name in engines))
+    for size in (1_000, 10_000, 50_000):
+        body = (PROSE * (size // len(PROSE) + 1))[:size]
+        cases = {
+            'no match': body,
+            'early match': "switch to a privacy policy. " + body,
+            'late match': body + " turn this into a joint venture.",
+        }
+        for name, comment in cases.items():
+            legacy = time_per_call(legacy_detect, comment, args.repeat)
+            row = f"{name + f' {size // 1000}KB':<22}{legacy * 1e6:>10.1f}us"
+            for detector in engines.values():
+                compiled = time_per_call(detector.detect, comment, args.repeat)
+                row += f"{compiled * 1e6:>12.1f}us{legacy / compiled:>8.2f}x"
+            print(row)
@@ -0,0 +1,178 @@
+"""Micro-benchmark: create_pdf as shipped vs the baseline create_pdf.
+
+Run from the server directory:
+
+    python benchmarks/bench_pdf_styles.py [--repeat 3]
+
+"Before" is the baseline create_pdf copied verbatim from the original app.py
+(styles built per call and per bullet/signature line, lines classified while
+rendering); "after" is renderers.create_pdf with the shared style registry and
+the block IR, parsing included. Reports the per-page render time for 5-, 20-
+and 100-page documents.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader  # noqa: E402
+from reportlab.lib import colors  # noqa: E402
+from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_RIGHT  # noqa: E402
+from reportlab.lib.pagesizes import letter  # noqa: E402
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet  # noqa: E402
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer  # noqa: E402
+
+import document_ir  # noqa: E402
+from renderers import create_pdf  # noqa: E402
+
+SECTION = """ARTICLE {n}. OBLIGATIONS OF THE PARTIES
+The Receiving Party shall hold and maintain the Confidential Information in strict confidence for the sole and exclusive benefit of the Disclosing Party, and shall not use it for any purpose other than the evaluation of the business relationship described in this Agreement.
+- The Receiving Party shall restrict access to employees with a need to know.
+- The Receiving Party shall not copy or reverse engineer any materials.
+- The Receiving Party shall promptly notify the Disclosing Party of any unauthorised disclosure.
+Nothing in this Agreement grants any licence under any patent, trademark or copyright, and all Confidential Information remains the property of the Disclosing Party.
+Signature: ______________________  Date: _______________
+"""
+
+
+def baseline_create_pdf(text, filepath, business_name, document_type):
+    """create_pdf from the baseline app.py, verbatim: styles built per call (and per bullet/signature line),
+    lines classified inline while rendering."""
+    doc = SimpleDocTemplate(filepath, pagesize=letter,
+                          rightMargin=72, leftMargin=72,
+                          topMargin=72, bottomMargin=72)
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'Title',
+        parent=styles['Heading1'],
+        fontSize=16,
+        alignment=TA_CENTER,
+        spaceAfter=20,
+        textColor=colors.navy,
+        fontName='Helvetica-Bold'
+    )
+    
+    normal_style = ParagraphStyle(
+        'Normal',
+        parent=styles['Normal'],
+        fontSize=11,
+        alignment=TA_JUSTIFY,
+        firstLineIndent=20,
+        leading=14,
+        spaceBefore=6,
+        spaceAfter=6
+    )
+    
+    header_style = ParagraphStyle(
+        'Header',
+        parent=styles['Heading2'],
+        fontSize=13,
+        spaceAfter=10,
+        spaceBefore=15,
+        textColor=colors.navy,
+        fontName='Helvetica-Bold',
+        borderWidth=1,
+        borderColor=colors.lightgrey,
+        borderPadding=5,
+        borderRadius=2
+    )
+    
+    content = []
+    
+    content.append(Paragraph(f"{document_type.upper()}", title_style))
+    content.append(Paragraph(f"For: {business_name}", title_style))
+    content.append(Spacer(1, 20))
+    
+    date_style = ParagraphStyle(
+        'Date',
+        parent=styles['Normal'],
+        fontSize=11,
+        alignment=TA_RIGHT,
+        textColor=colors.darkgrey
+    )
+    content.append(Paragraph(f"Date: {datetime.now().strftime('%B %d, %Y')}", date_style))
+    content.append(Spacer(1, 20))
+    
+    paragraphs = text.split('\n')
+    for para in paragraphs:
+        if para.strip():
+            if para.strip().startswith('#'):
+                header_text = para.replace('#', '').strip()
+                content.append(Paragraph(header_text, header_style))
+            elif para.strip().isupper() and len(para.strip()) > 3:
+                content.append(Paragraph(para.strip(), header_style))
+            elif para.strip().startswith(('•', '-', '*')):
+                bullet_style = ParagraphStyle(
+                    'Bullet',
+                    parent=normal_style,
+                    leftIndent=30,
+                    firstLineIndent=0,
+                    spaceBefore=3,
+                    spaceAfter=3
+                )
+                content.append(Paragraph(para.strip(), bullet_style))
+            elif "signature" in para.lower() or "sign" in para.lower() or "date:" in para.lower():
+                sig_style = ParagraphStyle(
+                    'Signature',
+                    parent=normal_style,
+                    spaceBefore=15,
+                    spaceAfter=15
+                )
+                content.append(Paragraph(para, sig_style))
+            else:
+                content.append(Paragraph(para, normal_style))
+            
+            if para.strip().startswith('#') or para.strip().isupper():
+                content.append(Spacer(1, 10))
+            else:
+                content.append(Spacer(1, 6))
+    
+    doc.build(content)
+
+
+def uncached_create_pdf(text, filepath, business_name, document_type):
+    """create_pdf as shipped, including parsing (the parse cache would otherwise hide it)."""
+    document_ir._cache.clear()
+    create_pdf(text, filepath, business_name, document_type)
+
+
+def document_with_pages(pages, folder):
+    """Build synthetic text that renders to roughly ``pages`` pages."""
+    probe = os.path.join(folder, 'probe.pdf')
+    create_pdf(SECTION.format(n=1) * 50, probe, 'Acme Ltd', 'Non-Disclosure Agreement (NDA)')
+    sections_per_page = 50 / len(PdfReader(probe).pages)
+    return ''.join(SECTION.format(n=n) for n in range(1, max(1, round(pages * sections_per_page)) + 1))
+
+
+def best_time(render, text, filepath, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render(text, filepath, 'Acme Ltd', 'Non-Disclosure Agreement (NDA)')
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'pages':>5}  {'before ms/page':>14}  {'after ms/page':>13}  {'speedup':>7}")
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, 'bench.pdf')
+        for target in (5, 20, 100):
+            text = document_with_pages(target, folder)
+            before = best_time(baseline_create_pdf, text, filepath, args.repeat)
+            pages = len(PdfReader(filepath).pages)
+            after = best_time(uncached_create_pdf, text, filepath, args.repeat)
+            print(f"{pages:>5}  {before / pages * 1000:>14.2f}  {after / pages * 1000:>13.2f}  {before / after:>6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Rendering benchmark suite for create_pdf and create_docx.
+
+Renders synthetic documents of several sizes, heading/bullet densities and
+languages, and reports wall time, CPU time, peak Python memory and output
+size per format. Runs fully offline. Run from the server directory:
+
+    python benchmarks/bench_rendering.py --output results.json
+    python benchmarks/bench_rendering.py --compare results.json --threshold 0.15
+
+With --compare, cases whose median (``--metric``, default cpu_ms) is more than
+``--threshold`` slower than the baseline are listed and the exit status is 1,
+so runs from two commits can be checked against each other.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx  # noqa: E402
+import reportlab  # noqa: E402
+
+import document_ir  # noqa: E402
+from renderers import create_docx, create_pdf  # noqa: E402
+
+RENDERERS = {'pdf': create_pdf, 'docx': create_docx}
+
+# Vocabulary per language; non-Latin scripts exercise font/encoding paths (the
+# built-in PDF fonts have no CJK/Arabic glyphs, so those render as blanks but still cost layout time)
+WORDS = {
+    'en': "agreement party shall confidential information obligation term notice payment services law "
+          "provided written consent breach remedy period termination rights".split(),
+    'de': "Vereinbarung Partei vertrauliche Informationen Verpflichtung Kündigung Zahlung Dienstleistungen "
+          "Gesetz schriftlich Zustimmung Verletzung Frist Rechte Gewährleistung".split(),
+    'ru': "соглашение сторона конфиденциальная информация обязательство срок уведомление оплата услуги "
+          "закон письменное согласие нарушение право расторжение".split(),
+    'el': "συμφωνία μέρος εμπιστευτικές πληροφορίες υποχρέωση όρος ειδοποίηση πληρωμή υπηρεσίες "
+          "νόμος γραπτή συναίνεση παραβίαση δικαιώματα".split(),
+    'ar': "اتفاقية الطرف معلومات سرية التزام مدة إشعار الدفع الخدمات القانون موافقة خطية خرق الحقوق".split(),
+    'zh': "协议 当事方 保密 信息 义务 期限 通知 付款 服务 法律 书面 同意 违约 权利 终止".split(),
+}
+
+# name -> (sections, paragraphs per section, bullets per section, language)
+CASES = {
+    'short_en': (5, 3, 2, 'en'),
+    'medium_en': (20, 3, 2, 'en'),
+    'long_en': (100, 3, 2, 'en'),
+    'heading_dense_en': (60, 1, 0, 'en'),
+    'bullet_heavy_en': (20, 1, 12, 'en'),
+    'medium_de': (20, 3, 2, 'de'),
+    'medium_ru': (20, 3, 2, 'ru'),
+    'medium_el': (20, 3, 2, 'el'),
+    'medium_ar': (20, 3, 2, 'ar'),
+    'medium_zh': (20, 3, 2, 'zh'),
+}
+
+
+def synthetic_document(sections, paragraphs, bullets, language='en', seed=1):
+    """Generate a document in the format the LLM returns: title, headings, paragraphs, bullets, signatures."""
+    rng = random.Random(seed)
+    words = WORDS[language]
+    separator = '' if language == 'zh' else ' '
+
+    def sentence(length):
+        return separator.join(rng.choice(words) for _ in range(length)).capitalize() + '.'
+
+    lines = [f"# {sentence(4)[:-1].upper()}", ""]
+    for number in range(1, sections + 1):
+        lines += [f"{number}. {sentence(3)[:-1].upper()}", ""]
+        for _ in range(paragraphs):
+            text = ' '.join(sentence(rng.randint(8, 20)) for _ in range(rng.randint(2, 5)))
+            # Some bold terms, as the LLM emits them
+            if rng.random() < 0.3:
+                text = f"**{sentence(2)[:-1]}** {text}"
+            lines += [text, ""]
+        lines += [f"- {sentence(rng.randint(6, 14))}" for _ in range(bullets)]
+        if bullets:
+            lines.append("")
+    lines += ["Signature: ______________________  Date: _______________", ""]
+    return '\n'.join(lines)
+
+
+def measure(render, text, filepath, repeat):
+    """Median wall/CPU time over ``repeat`` cold renders, then one traced run for peak memory."""
+    walls, cpus = [], []
+    for _ in range(repeat):
+        document_ir._cache.clear()
+        wall, cpu = time.perf_counter(), time.process_time()
+        render(text, filepath, 'Acme Holdings Ltd', 'Non-Disclosure Agreement (NDA)')
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+
+    document_ir._cache.clear()
+    tracemalloc.start()
+    render(text, filepath, 'Acme Holdings Ltd', 'Non-Disclosure Agreement (NDA)')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'wall_ms': round(statistics.median(walls) * 1000, 2),
+        'cpu_ms': round(statistics.median(cpus) * 1000, 2),
+        'peak_kb': round(peak / 1024, 1),
+        'output_bytes': os.path.getsize(filepath)
+    }
+
+
+def run(cases, formats, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        # Warm up imports and the style registry so the first case isn't penalised
+        warmup = synthetic_document(2, 1, 1)
+        for fmt in formats:
+            RENDERERS[fmt](warmup, os.path.join(folder, f"warmup.{fmt}"), 'Acme', 'NDA')
+        for name in cases:
+            sections, paragraphs, bullets, language = CASES[name]
+            text = synthetic_document(sections, paragraphs, bullets, language)
+            results[name] = {'text_chars': len(text)}
+            for fmt in formats:
+                results[name][fmt] = measure(RENDERERS[fmt], text, os.path.join(folder, f"{name}.{fmt}"), repeat)
+                print(f"{name:<18} {fmt:<5} {results[name][fmt]}", file=sys.stderr)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'reportlab': reportlab.Version,
+        'python_docx': getattr(docx, '__version__', None)
+    }
+
+
+def compare(results, baseline, metric, threshold):
+    """Return the (case, format, baseline, current) rows that regressed by more than ``threshold``."""
+    regressions = []
+    for name, formats in results.items():
+        for fmt, current in formats.items():
+            if not isinstance(current, dict):
+                continue
+            before = baseline.get('results', {}).get(name, {}).get(fmt)
+            if before and before.get(metric) and current[metric] > before[metric] * (1 + threshold):
+                regressions.append((name, fmt, before[metric], current[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--formats', nargs='+', choices=sorted(RENDERERS), default=['pdf', 'docx'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON from an earlier run")
+    parser.add_argument('--metric', choices=('cpu_ms', 'wall_ms', 'peak_kb'), default='cpu_ms')
+    parser.add_argument('--threshold', type=float, default=0.15, help="allowed slowdown, e.g. 0.15 = 15%%")
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': run(args.cases, args.formats, args.repeat)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.metric, args.threshold)
+        print(f"Compared with {baseline['environment'].get('commit')} on {args.metric} "
+              f"(threshold {args.threshold:.0%})", file=sys.stderr)
+        for name, fmt, before, after in regressions:
+            print(f"REGRESSION {name} {fmt}: {before} -> {after} ({after / before - 1:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compare the sync (gunicorn app:app) and async (asgi:app) deployments under the same load.
+
+Starts the fake OpenAI/Stripe services, then for each deployment starts the
+server, runs the load test at each concurrency level and stops it again.
+Prints throughput and p50/p99 latency per deployment and concurrency. Run
+from the server directory:
+
+    python benchmarks/compare_serving.py --scenario stream --concurrency 8 32 128 --duration 20
+
+Both deployments use the same number of worker processes (``--workers``).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import SCENARIOS, LoadTest  # noqa: E402
+
+SERVER_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEPLOYMENTS = {
+    'sync': ['gunicorn', 'app:app'],
+    'async': ['gunicorn', 'asgi:app', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/api/health/live", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def start_server(deployment, args, data_folder):
+    env = dict(
+        os.environ,
+        LLM_BACKEND='fake',
+        STRIPE_BACKEND='fake',
+        FAKE_SERVICES_URL=f"http://127.0.0.1:{args.fake_port}",
+        DATA_FOLDER=data_folder,
+        RATELIMIT_ENABLED='false',
+        GUNICORN_TIMEOUT=str(args.timeout)
+    )
+    command = DEPLOYMENTS[deployment] + [
+        '--bind', f"127.0.0.1:{args.port}",
+        '--workers', str(args.workers),
+        '--timeout', str(args.timeout)
+    ]
+    return subprocess.Popen(command, cwd=SERVER_FOLDER, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def run(args):
+    url = f"http://127.0.0.1:{args.port}"
+    fake = subprocess.Popen(
+        [sys.executable, 'fake_services.py', '--port', str(args.fake_port), '--latency', args.latency,
+         '--tokens-per-second', str(args.tokens_per_second)],
+        cwd=SERVER_FOLDER, stdout=subprocess.DEVNULL
+    )
+    results = []
+    try:
+        for deployment in args.deployments:
+            for concurrency in args.concurrency:
+                # Fresh data folder so documents generated in one run aren't reused by the next
+                with tempfile.TemporaryDirectory() as data_folder:
+                    server = start_server(deployment, args, data_folder)
+                    try:
+                        wait_until_up(url)
+                        report = LoadTest(url, args.request_timeout).run(args.scenario, concurrency, args.duration)
+                    finally:
+                        server.terminate()
+                        server.wait(30)
+                for endpoint, stats in report['endpoints'].items():
+                    results.append(dict(stats, deployment=deployment, concurrency=concurrency, endpoint=endpoint))
+                    print(f"{deployment:<6} c={concurrency:<4} {endpoint:<26} {stats['throughput_rps']:>7} rps  "
+                          f"p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms  errors {stats['errors']}",
+                          file=sys.stderr)
+    finally:
+        fake.terminate()
+        fake.wait(10)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, default='stream')
+    parser.add_argument('--deployments', nargs='+', choices=sorted(DEPLOYMENTS), default=['sync', 'async'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[8, 32, 128])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=int, default=60, help="gunicorn worker timeout")
+    parser.add_argument('--request-timeout', type=float, default=120)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--fake-port', type=int, default=8010)
+    parser.add_argument('--latency', default='lognormal:800,0.5', help="fake OpenAI time to first token")
+    parser.add_argument('--tokens-per-second', type=float, default=60)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'scenario': args.scenario, 'workers': args.workers, 'results': results}, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,190 @@
+"""Closed-loop load test against a running server.
+
+Start the fake upstreams and the server, then run the load:
+
+    python fake_services.py --latency lognormal:800,0.5 &
+    LLM_BACKEND=fake STRIPE_BACKEND=fake RATELIMIT_ENABLED=false gunicorn app:app --workers 2 --threads 8 &
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --scenario revision --concurrency 16 --duration 30
+
+Scenarios:
+  checkout   create a checkout session
+  document   create a session and poll /api/payment-success until the document is ready
+  stream     create a session and read the whole /api/document-stream response
+  validate   validate a revision comment for an existing session
+  revision   validate and submit a revision comment (full revision pipeline)
+
+Reports throughput, latency percentiles and errors per endpoint.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+FORM_DATA = {
+    'document_type': 'nda',
+    'business_name': 'Acme Holdings Ltd',
+    'business_type': 'Limited company',
+    'industry': 'Software',
+    'country': 'United Kingdom',
+    'state_province': 'England',
+    'language': 'English',
+    'protection_level': 'Standard',
+    'additional_instructions': ''
+}
+COMMENTS = [
+    "Extend the confidentiality period to five years",
+    "Add a clause requiring return of all materials within 10 days",
+    "Change the governing law to the State of New York",
+    "Include a clause about injunctive relief for breaches",
+]
+
+
+class LoadTest:
+    def __init__(self, url, timeout=120):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def request(self, name, method, path, ok=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.record(name, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.record(name, time.perf_counter() - start, None if response.status_code in ok else response.status_code)
+        return response
+
+    def record(self, name, seconds, error):
+        with self._lock:
+            if error is None:
+                self.latencies[name].append(seconds)
+            else:
+                self.errors[(name, error)] += 1
+
+    def create_session(self):
+        response = self.request('create-checkout-session', 'POST', '/api/create-checkout-session',
+                                json={'formData': FORM_DATA})
+        return response.json()['sessionId'] if response is not None and response.ok else None
+
+    def wait_for_document(self, session_id):
+        while True:
+            response = self.request('payment-success', 'GET', '/api/payment-success', ok=(200, 202),
+                                    params={'session_id': session_id})
+            if response is None or response.status_code != 202:
+                return response is not None and response.ok
+            time.sleep(0.5)
+
+    def checkout(self, _):
+        self.create_session()
+
+    def document(self, _):
+        session_id = self.create_session()
+        if session_id:
+            self.wait_for_document(session_id)
+
+    def stream(self, _):
+        session_id = self.create_session()
+        if session_id:
+            # Holds the connection for the whole generation, like the streaming frontend
+            start = time.perf_counter()
+            try:
+                response = self.http.get(f"{self.url}/api/document-stream", params={'session_id': session_id},
+                                         timeout=self.timeout)
+            except requests.RequestException as e:
+                self.record('document-stream', time.perf_counter() - start, type(e).__name__)
+                return
+            error = None
+            if not response.ok:
+                error = response.status_code
+            elif b'event: done' not in response.content:
+                error = 'incomplete'
+            self.record('document-stream', time.perf_counter() - start, error)
+
+    def validate(self, session_id):
+        self.request('validate-revision-request', 'POST', '/api/validate-revision-request',
+                     json={'sessionId': session_id, 'comment': random.choice(COMMENTS)})
+
+    def revision(self, session_id):
+        comment = random.choice(COMMENTS)
+        self.request('validate-revision-request', 'POST', '/api/validate-revision-request',
+                     json={'sessionId': session_id, 'comment': comment})
+        self.request('document-feedback', 'POST', '/api/document-feedback',
+                     json={'sessionId': session_id, 'comment': comment})
+
+    def run(self, scenario, concurrency, duration):
+        session_id = None
+        if scenario in ('validate', 'revision'):
+            # Shared session with its document generated up front
+            session_id = self.create_session()
+            if not session_id or not self.wait_for_document(session_id):
+                sys.exit("Could not prepare a session with a generated document")
+            self.latencies.clear()
+            self.errors.clear()
+
+        action = getattr(self, scenario)
+        deadline = time.monotonic() + duration
+
+        def loop():
+            while time.monotonic() < deadline:
+                action(session_id)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=loop, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | {name for name, _ in self.errors}):
+            samples = sorted(self.latencies.get(name, []))
+            errors = {str(error): count for (endpoint, error), count in self.errors.items() if endpoint == name}
+            endpoints[name] = {
+                'requests': len(samples) + sum(errors.values()),
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(samples, 50) * 1000, 1) if samples else None,
+                'p95_ms': round(percentile(samples, 95) * 1000, 1) if samples else None,
+                'p99_ms': round(percentile(samples, 99) * 1000, 1) if samples else None,
+                'mean_ms': round(statistics.mean(samples) * 1000, 1) if samples else None,
+                'errors': errors
+            }
+        return {'elapsed_seconds': round(elapsed, 1), 'endpoints': endpoints}
+
+
+SCENARIOS = ('checkout', 'document', 'stream', 'validate', 'revision')
+
+
+def percentile(samples, pct):
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Closed-loop load test")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='validate')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    result = LoadTest(args.url, args.timeout).run(args.scenario, args.concurrency, args.duration)
+    print(json.dumps(dict(result, scenario=args.scenario, concurrency=args.concurrency), indent=2))
@@ -0,0 +1,291 @@
+"""Local classifier for document-type change requests.
+
+A logistic regression over hashed word n-grams that scores how likely a
+revision comment is trying to change the document type. It runs on the CPU
+in well under a millisecond, so validation only escalates to gpt-4 when the
+score falls inside the uncertainty band. Long comments are scored whole and
+sentence by sentence, and the highest score decides: a request to change the
+type appended to harmless edits must not be diluted by them.
+
+The model is a small JSON file (models/comment_classifier.json). Retrain it
+from the seed examples and the verdicts logged by the server with:
+
+    python comment_classifier.py train [--data models/validation_seed.jsonl data/validation_log.jsonl]
+    python comment_classifier.py eval [--band 0.1 0.9] data/validation_log.jsonl
+
+Training scores every example with a model that did not see it (k-fold), and
+calibrates the band on those held-out scores: ``low`` is as high as it can be
+while no held-out type change would have been accepted, and ``high`` as low
+as it can be while at most ``max_reject_error`` of held-out rejections would
+have been wrong. The band and the held-out report are saved in the model's
+metadata, and the server uses that band unless one is configured.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import zlib
+from datetime import datetime
+
+from verdict_cache import normalize_comment
+
+MODEL_VERSION = 1
+DEFAULT_BUCKETS = 1 << 18
+MODELS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_MODEL_PATH = os.path.join(MODELS_FOLDER, 'comment_classifier.json')
+SEED_DATA_PATH = os.path.join(MODELS_FOLDER, 'validation_seed.jsonl')
+_SENTENCE_END = re.compile(r'(?<=[.!?;])\s+|\n+')
+
+
+def features(document_type, comment, buckets=DEFAULT_BUCKETS):
+    """Hashed word unigram/bigram features, plus the same n-grams paired with the original document type."""
+    words = normalize_comment(comment).split()
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])] + ['<bias>']
+    indexes = set()
+    for gram in grams:
+        indexes.add(zlib.crc32(gram.encode('utf-8')) % buckets)
+        indexes.add(zlib.crc32(f"{document_type}|{gram}".encode('utf-8')) % buckets)
+    return indexes
+
+
+def _sigmoid(score):
+    if score < -30:
+        return 0.0
+    if score > 30:
+        return 1.0
+    return 1 / (1 + math.exp(-score))
+
+
+class CommentClassifier:
+    def __init__(self, weights, buckets=DEFAULT_BUCKETS, metadata=None):
+        self.weights = weights
+        self.buckets = buckets
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        with open(path, 'r') as f:
+            model = json.load(f)
+        if model.get('version') != MODEL_VERSION:
+            raise ValueError(f"Unsupported comment classifier model version: {model.get('version')}")
+        weights = {int(index): weight for index, weight in model['weights'].items()}
+        return cls(weights, model['buckets'], model.get('metadata'))
+
+    def save(self, path):
+        model = {
+            'version': MODEL_VERSION,
+            'buckets': self.buckets,
+            'metadata': self.metadata,
+            'weights': {str(index): round(weight, 5) for index, weight in sorted(self.weights.items())
+                        if abs(weight) >= 1e-4}
+        }
+        with open(path, 'w') as f:
+            json.dump(model, f, separators=(',', ':'))
+
+    def predict(self, document_type, comment):
+        """Return the probability that the comment asks for a different document type."""
+        score = sum(self.weights.get(index, 0.0) for index in features(document_type, comment, self.buckets))
+        return _sigmoid(score)
+
+    def predict_max(self, document_type, comment):
+        """Highest probability over the whole comment and each of its sentences."""
+        sentences = [sentence for sentence in _SENTENCE_END.split(comment) if sentence.strip()]
+        probability = self.predict(document_type, comment)
+        if len(sentences) > 1:
+            probability = max([probability] + [self.predict(document_type, sentence) for sentence in sentences])
+        return probability
+
+    @classmethod
+    def train(cls, examples, buckets=DEFAULT_BUCKETS, epochs=30, learning_rate=0.1, l2=1e-3, seed=13):
+        """Fit on (document_type, comment, label) examples with AdaGrad-scaled SGD."""
+        rows = [(features(document_type, comment, buckets), 1.0 if label else 0.0)
+                for document_type, comment, label in examples]
+        weights = {}
+        squared_gradients = {}
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(rows)
+            for indexes, label in rows:
+                error = _sigmoid(sum(weights.get(index, 0.0) for index in indexes)) - label
+                for index in indexes:
+                    weight = weights.get(index, 0.0)
+                    gradient = error + l2 * weight
+                    squared_gradients[index] = squared_gradients.get(index, 0.0) + gradient * gradient
+                    if gradient:  # A saturated score gives exactly 0 and would divide by zero below
+                        weights[index] = weight - learning_rate * gradient / math.sqrt(squared_gradients[index])
+        return cls(weights, buckets, {'examples': len(rows), 'trained_at': datetime.now().isoformat()})
+
+
+class ClassifierTier:
+    """Decides confidently classified comments locally and counts how many LLM calls that avoids."""
+
+    def __init__(self, classifier, low=0.1, high=0.9, on_count=None):
+        """
+        low/high: comments whose highest score (whole or any sentence, see ``predict_max``) is
+        at or below ``low`` are accepted and at or above ``high`` are rejected locally;
+        anything in between is escalated to the LLM
+        on_count: optional callback(counter name) for exporting the counters
+        """
+        self.classifier = classifier
+        self.low = low
+        self.high = high
+        self._lock = threading.Lock()
+        self.counters = {'accepted': 0, 'rejected': 0, 'escalated': 0}
+        self.on_count = on_count
+
+    def decide(self, document_type, comment):
+        """Return (is_changing or None when uncertain, probability)."""
+        probability = self.classifier.predict_max(document_type, comment)
+        if probability <= self.low:
+            decision, counter = False, 'accepted'
+        elif probability >= self.high:
+            decision, counter = True, 'rejected'
+        else:
+            decision, counter = None, 'escalated'
+        with self._lock:
+            self.counters[counter] += 1
+        if self.on_count is not None:
+            self.on_count(counter)
+        return decision, probability
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        total = sum(stats.values())
+        stats['llm_calls_avoided'] = round((stats['accepted'] + stats['rejected']) / total, 4) if total else 0.0
+        stats['band'] = [self.low, self.high]
+        return stats
+
+
+class VerdictLog:
+    """Appends LLM verdicts as JSONL rows usable as training data."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, document_type, comment, verdict):
+        row = {
+            'document_type': document_type,
+            'comment': comment,
+            'is_changing_document_type': verdict['is_changing_document_type'],
+            'detected_target_type': verdict.get('detected_target_type', ''),
+            'timestamp': datetime.now().isoformat()
+        }
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(row) + '\n')
+
+
+def load_examples(paths):
+    """Read JSONL rows with document_type, comment and is_changing_document_type."""
+    examples = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Skipping missing file {path}")
+            continue
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                if row.get('comment') and 'is_changing_document_type' in row:
+                    examples.append((row.get('document_type', ''), row['comment'],
+                                     bool(row['is_changing_document_type'])))
+    return examples
+
+
+def evaluate(classifier, examples, low, high):
+    """Accuracy overall and on confident predictions, and the share of LLM calls avoided."""
+    return evaluate_scores([(classifier.predict_max(document_type, comment), label)
+                            for document_type, comment, label in examples], low, high)
+
+
+def evaluate_scores(scored, low, high):
+    """``evaluate`` for (probability, label) pairs."""
+    correct = confident = confident_correct = accepted_changes = 0
+    for probability, label in scored:
+        correct += (probability >= 0.5) == label
+        if probability <= low or probability >= high:
+            confident += 1
+            confident_correct += (probability >= high) == label
+            accepted_changes += probability <= low and label
+    total = len(scored) or 1
+    return {
+        'examples': len(scored),
+        'accuracy': round(correct / total, 4),
+        'llm_calls_avoided': round(confident / total, 4),
+        'confident_accuracy': round(confident_correct / confident, 4) if confident else None,
+        'accepted_changes': accepted_changes
+    }
+
+
+def cross_validate(examples, folds=5, seed=7, **train_options):
+    """(probability, label) for every example, each scored by a model trained on the other folds."""
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    scored = []
+    for fold in range(folds):
+        held_out = examples[fold::folds]
+        classifier = CommentClassifier.train([example for index, example in enumerate(examples)
+                                              if index % folds != fold], **train_options)
+        scored += [(classifier.predict_max(document_type, comment), label)
+                   for document_type, comment, label in held_out]
+    return scored
+
+
+def calibrate_band(scored, max_reject_error=0.02):
+    """(low, high) such that no scored type change is accepted and few rejections are wrong."""
+    probabilities = sorted(scored)
+    # Accept only below the lowest-scored type change
+    changes = [probability for probability, label in probabilities if label]
+    low = max((probability for probability, label in probabilities
+               if not label and (not changes or probability < changes[0])), default=0.0)
+    high, wrong = 1.0, 0
+    for count, (probability, label) in enumerate(reversed(probabilities), 1):
+        wrong += not label
+        if probability <= low:
+            break
+        if wrong / count <= max_reject_error:
+            high = probability
+    return round(low, 6), round(max(high, low + 1e-6), 6)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Comment classifier training and evaluation")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    default_data = [SEED_DATA_PATH, os.path.join(os.getenv("DATA_FOLDER", "data"), "validation_log.jsonl")]
+
+    train_parser = subcommands.add_parser('train', help="Train a model from labelled comments")
+    train_parser.add_argument('--data', nargs='+', default=default_data)
+    train_parser.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    train_parser.add_argument('--folds', type=int, default=5, help="folds for the held-out scores")
+    train_parser.add_argument('--band', nargs=2, type=float, help="skip calibration and use this band")
+    train_parser.add_argument('--max-reject-error', type=float, default=0.02)
+    train_parser.add_argument('--epochs', type=int, default=30)
+
+    eval_parser = subcommands.add_parser('eval', help="Evaluate a model on labelled comments")
+    eval_parser.add_argument('data', nargs='+')
+    eval_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    eval_parser.add_argument('--band', nargs=2, type=float, default=[0.1, 0.9])
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        examples = load_examples(args.data)
+        scored = cross_validate(examples, folds=args.folds, epochs=args.epochs)
+        band = args.band or calibrate_band(scored, args.max_reject_error)
+        report = evaluate_scores(scored, *band)
+        # The band is chosen on these same scores; calibrating on half and checking on the other half shows the bias
+        check = evaluate_scores(scored[1::2], *calibrate_band(scored[::2], args.max_reject_error))
+        print(f"Held-out ({args.folds}-fold) at band {band[0]} {band[1]}: {report}")
+        print(f"Band calibrated on half, evaluated on the other half: {check}")
+        print(f"Held-out at band 0.1 0.9: {evaluate_scores(scored, 0.1, 0.9)}")
+        classifier = CommentClassifier.train(examples, epochs=args.epochs)
+        classifier.metadata.update(band=list(band), holdout=dict(report, folds=args.folds), calibration_check=check)
+        classifier.save(args.output)
+        print(f"Trained on {len(examples)} examples, saved to {args.output}")
+    else:
+        print(evaluate(CommentClassifier.load(args.model), load_examples(args.data), *args.band))
@@ -0,0 +1,56 @@
+"""SQLite helpers shared by the server's local persistence layers."""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def connect(path, synchronous='NORMAL'):
+    """Open a SQLite connection tuned for concurrent use by several gunicorn workers.
+
+    With ``synchronous='NORMAL'`` a power loss may drop the last commits; ``FULL``
+    syncs the WAL on every commit.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class SQLiteDatabase:
+    """A SQLite file with one connection per thread (and per process after a fork)."""
+
+    def __init__(self, path, schema="", synchronous='NORMAL'):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        if schema:
+            self.connection().executescript(schema)
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = connect(self.path, self.synchronous)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """Run a block inside BEGIN IMMEDIATE so read-modify-write cycles are atomic."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
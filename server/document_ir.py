@@ -0,0 +1,96 @@
+"""Intermediate representation of generated document text shared by all renderers.
+
+The LLM returns loosely formatted text (markdown headings, ALL CAPS section
+titles, bullets, signature lines and **bold** spans). ``parse_document`` turns
+it into a tuple of typed blocks in a single pass so every renderer formats the
+same structure, and caches the result by text hash so re-renders and
+revisions of the same text skip parsing.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+TITLE = 'title'
+HEADING = 'heading'
+BULLET = 'bullet'
+SIGNATURE = 'signature'
+BODY = 'body'
+
+# text is the plain text of the block; spans is a tuple of (text, bold) runs
+Block = namedtuple('Block', ['kind', 'text', 'spans'])
+
+BULLET_PREFIXES = ('• ', '- ', '* ', '•')
+SIGNATURE_PATTERN = re.compile(r'\bsign(?:ature|atures|ed|ing)?\b|\bdate:', re.IGNORECASE)
+# Bold runs must start and end with a real character so signature blanks (____) stay literal
+BOLD_PATTERN = re.compile(r'\*\*(?=[^*\s])(.+?)(?<=[^*\s])\*\*|__(?=[^_\s])(.+?)(?<=[^_\s])__')
+
+CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def document_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def parse_document(text):
+    """Return the cached block tuple for ``text``, parsing it on first use."""
+    key = document_hash(text)
+    with _cache_lock:
+        blocks = _cache.get(key)
+        if blocks is not None:
+            _cache.move_to_end(key)
+            return blocks
+
+    blocks = _parse(text)
+    with _cache_lock:
+        _cache[key] = blocks
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return blocks
+
+
+def parse_inline(text):
+    """Split a line into (text, bold) runs on **bold** / __bold__ markers."""
+    spans = []
+    position = 0
+    for match in BOLD_PATTERN.finditer(text):
+        if match.start() > position:
+            spans.append((text[position:match.start()], False))
+        spans.append((match.group(1) or match.group(2), True))
+        position = match.end()
+    if position < len(text):
+        spans.append((text[position:], False))
+    return tuple(spans)
+
+
+def classify_line(line, first=False):
+    """Return (kind, text) for one stripped, non-empty line."""
+    if line.startswith('#'):
+        heading = line.lstrip('#').strip()
+        if first and not line.startswith('##'):
+            return TITLE, heading
+        return HEADING, heading
+    if line.isupper() and len(line) > 3:
+        return HEADING, line
+    if line.startswith(BULLET_PREFIXES) and not line.startswith('**'):
+        return BULLET, line.lstrip('•-* ')
+    if SIGNATURE_PATTERN.search(line):
+        return SIGNATURE, line
+    return BODY, line
+
+
+def _parse(text):
+    blocks = []
+    for raw_line in text.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            continue
+        kind, content = classify_line(line, first=not blocks)
+        spans = parse_inline(content)
+        if kind in (TITLE, HEADING):
+            # Headings are bold already; drop markers rather than nesting bold runs
+            spans = ((''.join(span for span, _ in spans), True),)
+        blocks.append(Block(kind, ''.join(span for span, _ in spans), spans))
+    return tuple(blocks)
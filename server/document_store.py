@@ -0,0 +1,106 @@
+"""Persistent store for generated documents, keyed by Stripe checkout session id.
+
+The first generation for a paid session is stored here so follow-up endpoints
+(document details, PDF/DOCX downloads and revisions) read the same text back
+instead of asking the LLM to write a new document.
+"""
+import json
+from datetime import datetime
+
+from db import SQLiteDatabase
+
+
+class DocumentStore:
+    """Interface for document stores. Documents are plain dicts:
+
+    {'session_id', 'text', 'form_data', 'metadata', 'created_at', 'updated_at'}
+    """
+
+    def get(self, session_id):
+        """Return the stored document for a session, or None."""
+        raise NotImplementedError
+
+    def add(self, session_id, text, form_data=None, metadata=None):
+        """Store a document unless one already exists and return the stored document.
+
+        The first writer wins, so concurrent generations for the same session
+        all end up serving the same text.
+        """
+        raise NotImplementedError
+
+    def update_metadata(self, session_id, **metadata):
+        """Merge keys into a stored document's metadata and return the document."""
+        raise NotImplementedError
+
+    def metadata_since(self, since):
+        """Return the metadata of documents created or updated at or after ``since`` (a datetime)."""
+        raise NotImplementedError
+
+
+class SQLiteDocumentStore(DocumentStore):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        session_id TEXT PRIMARY KEY,
+        text TEXT NOT NULL,
+        form_data TEXT NOT NULL,
+        metadata TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_documents_updated ON documents (updated_at);
+    """
+
+    def __init__(self, path):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+
+    def get(self, session_id):
+        row = self.db.execute("SELECT * FROM documents WHERE session_id = ?", (session_id,)).fetchone()
+        return self._to_document(row) if row else None
+
+    def add(self, session_id, text, form_data=None, metadata=None):
+        now = datetime.now().isoformat()
+        self.db.execute(
+            "INSERT OR IGNORE INTO documents (session_id, text, form_data, metadata, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, text, json.dumps(form_data or {}), json.dumps(metadata or {}), now, now)
+        )
+        return self.get(session_id)
+
+    def update_metadata(self, session_id, **metadata):
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT metadata FROM documents WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            merged = json.loads(row['metadata'])
+            merged.update(metadata)
+            conn.execute(
+                "UPDATE documents SET metadata = ?, updated_at = ? WHERE session_id = ?",
+                (json.dumps(merged), datetime.now().isoformat(), session_id)
+            )
+        return self.get(session_id)
+
+    def metadata_since(self, since):
+        rows = self.db.execute("SELECT metadata FROM documents WHERE updated_at >= ?", (since.isoformat(),))
+        return [json.loads(row['metadata']) for row in rows]
+
+    @staticmethod
+    def _to_document(row):
+        return {
+            'session_id': row['session_id'],
+            'text': row['text'],
+            'form_data': json.loads(row['form_data']),
+            'metadata': json.loads(row['metadata']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+
+def create_document_store(url):
+    """Build a document store from a URL such as ``sqlite:///path/to/documents.db``.
+
+    Only SQLite is implemented today; a remote backend can be added here
+    without touching the endpoints.
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteDocumentStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported document store URL: {url}")
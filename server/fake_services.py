@@ -0,0 +1,276 @@
+"""Local stand-ins for the OpenAI and Stripe APIs, for offline load testing.
+
+Serves the parts of both APIs the server uses, over real HTTP so the OpenAI
+and Stripe client libraries run unchanged:
+
+    POST /v1/chat/completions         (with "stream": true as Server-Sent Events)
+    GET  /v1/models
+    POST /v1/checkout/sessions        (sessions are created already paid)
+    GET  /v1/checkout/sessions/<id>
+    GET  /v1/account
+
+Run it, then start the server with LLM_BACKEND=fake and STRIPE_BACKEND=fake:
+
+    python fake_services.py --port 8010 --latency lognormal:800,0.5 --tokens-per-second 60 --error-rate 0.02
+
+Latency specs (milliseconds): ``fixed:300``, ``uniform:200,900``,
+``normal:500,100`` or ``lognormal:<median>,<sigma>``.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DOCUMENT_SECTION = """{number}. {heading}
+
+{party} shall perform its obligations under this Agreement diligently, in good faith and in accordance with applicable law. Each party shall bear its own costs unless otherwise agreed in writing, and no failure to exercise any right shall operate as a waiver of that right.
+
+- Obligations under this section survive termination of this Agreement.
+- Notices shall be given in writing to the addresses set out above.
+"""
+HEADINGS = ["DEFINITIONS", "SCOPE OF SERVICES", "CONFIDENTIALITY", "PAYMENT TERMS", "TERM AND TERMINATION",
+            "INTELLECTUAL PROPERTY", "LIMITATION OF LIABILITY", "GOVERNING LAW", "DISPUTE RESOLUTION", "MISCELLANEOUS"]
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a callable returning seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def fake_answer(messages, max_tokens):
+    """A plausible reply for the prompts the server sends."""
+    prompt = ' '.join(str(message.get('content', '')) for message in messages)
+    if 'is_changing_document_type' in prompt:
+        return json.dumps({
+            'is_changing_document_type': False,
+            'explanation': "The request edits the existing document.",
+            'detected_target_type': ""
+        })
+    if '"sections"' in prompt and 'insert_after' in prompt:
+        return json.dumps({'sections': [1], 'insert_after': None})
+
+    sections = ["LEGAL AGREEMENT", "", "This Agreement is entered into by and between the parties named below.", ""]
+    length = 0
+    budget = max_tokens * 4
+    for index in range(100):
+        section = DOCUMENT_SECTION.format(number=index + 1, heading=HEADINGS[index % len(HEADINGS)],
+                                          party="The Company" if index % 2 else "The Client")
+        if length + len(section) > budget:
+            break
+        sections.append(section)
+        length += len(section)
+    sections.append("Signature: ______________________  Date: _______________")
+    return '\n'.join(sections)
+
+
+class FakeServices:
+    def __init__(self, latency='lognormal:600,0.5', tokens_per_second=80.0, error_rate=0.0, timeout_rate=0.0,
+                 max_completion_tokens=1500, stripe_latency='fixed:80'):
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.max_completion_tokens = max_completion_tokens
+        self.stripe_latency = parse_latency(stripe_latency)
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.counters = {'completions': 0, 'streams': 0, 'errors': 0, 'stripe_requests': 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def inject_failure(self):
+        """Return (status, error body), sleep past client timeouts, or return None for a normal reply."""
+        roll = random.random()
+        if roll < self.timeout_rate:
+            time.sleep(600)
+        if roll < self.timeout_rate + self.error_rate:
+            self.count('errors')
+            if random.random() < 0.5:
+                return 429, {'error': {'message': "Rate limit reached (injected)", 'type': 'rate_limit_error'}}
+            return 500, {'error': {'message': "The server had an error (injected)", 'type': 'server_error'}}
+        return None
+
+    def create_session(self, form):
+        session_id = f"cs_test_fake_{uuid.uuid4().hex}"
+        metadata = {key[len('metadata['):-1]: values[0] for key, values in form.items()
+                    if key.startswith('metadata[') and key.endswith(']')}
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'payment_status': 'paid',
+            'status': 'complete',
+            'mode': form.get('mode', ['payment'])[0],
+            'metadata': metadata,
+            'url': f"https://checkout.stripe.test/pay/{session_id}"
+        }
+        with self._lock:
+            self.sessions[session_id] = session
+        return session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    services = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/v1/models':
+            self.send_json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model', 'owned_by': 'fake'}
+                                                            for model in ('gpt-4', 'gpt-3.5-turbo')]})
+        elif path == '/v1/account':
+            self.stripe_reply(200, {'id': 'acct_fake', 'object': 'account'})
+        elif path.startswith('/v1/checkout/sessions/'):
+            session = self.services.sessions.get(path.rsplit('/', 1)[1])
+            if session is None:
+                self.stripe_reply(404, {'error': {'type': 'invalid_request_error', 'param': 'id',
+                                                  'message': "No such checkout.session"}})
+            else:
+                self.stripe_reply(200, session)
+        elif path == '/stats':
+            self.send_json(200, dict(self.services.counters, sessions=len(self.services.sessions)))
+        else:
+            self.send_json(404, {'error': {'message': f"Unknown path {path}"}})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if path == '/v1/chat/completions':
+            self.chat_completion(json.loads(body or b'{}'))
+        elif path == '/v1/checkout/sessions':
+            self.stripe_reply(200, self.services.create_session(parse_qs(body.decode('utf-8'))))
+        else:
+            self.send_json(404, {'error': {'message': f"Unknown path {path}"}})
+
+    def chat_completion(self, payload):
+        services = self.services
+        failure = services.inject_failure()
+        if failure is not None:
+            self.send_json(*failure)
+            return
+
+        messages = payload.get('messages', [])
+        max_tokens = min(payload.get('max_tokens') or services.max_completion_tokens, services.max_completion_tokens)
+        answer = fake_answer(messages, max_tokens)
+        words = answer.split(' ')
+        prompt_tokens = sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+        completion_tokens = estimate_tokens(answer)
+        finish_reason = 'length' if completion_tokens >= max_tokens else 'stop'
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        token_delay = 1 / services.tokens_per_second if services.tokens_per_second > 0 else 0.0
+        time.sleep(services.latency())
+
+        if not payload.get('stream'):
+            services.count('completions')
+            time.sleep(completion_tokens * token_delay)
+            self.send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer},
+                             'finish_reason': finish_reason}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}
+            })
+            return
+
+        services.count('streams')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            # Send roughly one word per token-interval batch
+            for index in range(0, len(words), 4):
+                delta = ' '.join(words[index:index + 4]) + (' ' if index + 4 < len(words) else '')
+                self.send_event(self.chunk(completion_id, payload, {'content': delta}, None))
+                time.sleep(estimate_tokens(delta) * token_delay)
+            self.send_event(self.chunk(completion_id, payload, {}, finish_reason))
+            if (payload.get('stream_options') or {}).get('include_usage'):
+                usage_chunk = self.chunk(completion_id, payload, {}, None)
+                usage_chunk['choices'] = []
+                usage_chunk['usage'] = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                                        'total_tokens': prompt_tokens + completion_tokens}
+                self.send_event(usage_chunk)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    @staticmethod
+    def chunk(completion_id, payload, delta, finish_reason):
+        return {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+
+    def send_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def stripe_reply(self, status, data):
+        self.services.count('stripe_requests')
+        time.sleep(self.services.stripe_latency())
+        self.send_json(status, data)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(services, host='127.0.0.1', port=8010):
+    handler = type('FakeServicesHandler', (Handler,), {'services': services})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake OpenAI and Stripe APIs for load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument('--latency', default='lognormal:600,0.5', help="time to first token")
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--max-completion-tokens', type=int, default=1500)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of completions failing with 429/500")
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help="share of completions that never answer")
+    parser.add_argument('--stripe-latency', default='fixed:80')
+    args = parser.parse_args()
+
+    server = serve(FakeServices(args.latency, args.tokens_per_second, args.error_rate, args.timeout_rate,
+                                args.max_completion_tokens, args.stripe_latency), args.host, args.port)
+    print(f"Fake OpenAI/Stripe APIs listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,22 @@
+"""Gunicorn settings loaded automatically from the server directory.
+
+Prepares the shared directory prometheus_client uses to aggregate metrics
+across worker processes, and drops a worker's live gauges when it exits.
+"""
+import os
+import shutil
+
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.getenv("DATA_FOLDER", "data"), "prometheus")
+)
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this run's totals
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,107 @@
+"""Background dependency checks for the health endpoints.
+
+Upstream dependencies (Stripe, OpenAI) are probed on an interval by a daemon
+thread, each with a timeout, and the latest result is kept in memory. Health
+endpoints answer from that snapshot instead of calling upstreams on every
+poll, and report how old each result is.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+OK = 'ok'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+PENDING = 'pending'
+
+
+class HealthProber:
+    def __init__(self, checks, interval=30, timeout=5, stale_after=None):
+        """
+        checks: mapping of name -> callable that raises when the dependency is unhealthy
+        stale_after: seconds after which a result no longer counts for readiness (default 3 intervals)
+        """
+        self.checks = dict(checks)
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after or interval * 3
+        self._results = {name: {'status': PENDING, 'latency_ms': None, 'error': None, 'checked_at': None,
+                                'checked_monotonic': None} for name in self.checks}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.checks)), thread_name_prefix='health-check')
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._executor.shutdown(wait=False)
+
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def probe(self):
+        """Run every check once (checks still running from a previous round are not restarted)."""
+        futures = {}
+        for name, check in self.checks.items():
+            previous = self._running.get(name)
+            if previous is not None and not previous.done():
+                self._record(name, TIMEOUT, None, f"Still running after {self.timeout}s")
+                continue
+            futures[name] = (time.monotonic(), self._executor.submit(check))
+            self._running[name] = futures[name][1]
+
+        for name, (started, future) in futures.items():
+            remaining = max(0.0, started + self.timeout - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except TimeoutError:
+                self._record(name, TIMEOUT, None, f"No response within {self.timeout}s")
+            except Exception as e:
+                self._record(name, ERROR, time.monotonic() - started, str(e))
+            else:
+                self._record(name, OK, time.monotonic() - started, None)
+
+    def snapshot(self):
+        """Latest result per check, with its age and whether it is stale."""
+        now = time.monotonic()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+        for result in results.values():
+            checked = result.pop('checked_monotonic')
+            result['age_seconds'] = round(now - checked, 1) if checked is not None else None
+            result['stale'] = checked is None or now - checked > self.stale_after
+        return results
+
+    def ready(self, snapshot=None):
+        """True when every check passed recently."""
+        snapshot = snapshot or self.snapshot()
+        return all(result['status'] == OK and not result['stale'] for result in snapshot.values())
+
+    def _record(self, name, status, latency, error):
+        if status != OK:
+            logger.error(f"Health check {name} {status}: {error}")
+        with self._lock:
+            self._results[name] = {
+                'status': status,
+                'latency_ms': round(latency * 1000, 1) if latency is not None else None,
+                'error': error,
+                'checked_at': datetime.now().isoformat(),
+                'checked_monotonic': time.monotonic()
+            }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.probe()
+            except Exception as e:
+                logger.error(f"Health probe failed: {str(e)}")
+            self._stopping.wait(self.interval)
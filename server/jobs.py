@@ -0,0 +1,267 @@
+"""Persistent background job queue for long-running work such as document generation.
+
+Jobs live in a SQLite table so every gunicorn worker (and the standalone
+``worker.py`` process) shares one queue. Workers lease a job while running
+it; if a process dies mid-job the lease expires and another worker picks the
+job up again, until ``max_attempts`` leases have been used.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from db import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class JobQueue:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT,
+        available_at REAL NOT NULL,
+        lease_expires_at REAL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (key, created_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=2, retry_failed_after=60):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_failed_after = retry_failed_after
+        self._wakeup = threading.Condition()
+
+    def enqueue(self, kind, key, payload):
+        """Queue a job unless one for the same key is already queued, running or done.
+
+        Jobs that failed less than ``retry_failed_after`` seconds ago are returned
+        as-is so clients polling for the result see the failure instead of
+        silently starting over.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE key = ? AND kind = ? ORDER BY created_at DESC LIMIT 1",
+                (key, kind)
+            ).fetchone()
+            if row is not None and (row['status'] != FAILED or self._failed_recently(row, now)):
+                return self._to_job(row)
+
+            job_id = uuid.uuid4().hex
+            timestamp = datetime.now().isoformat()
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, key, payload, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, key, json.dumps(payload), QUEUED, now, timestamp, timestamp)
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def latest(self, kind, key):
+        row = self.db.execute(
+            "SELECT * FROM jobs WHERE key = ? AND kind = ? ORDER BY created_at DESC LIMIT 1",
+            (key, kind)
+        ).fetchone()
+        return self._to_job(row) if row else None
+
+    def claim(self):
+        """Lease the oldest runnable job, including jobs whose previous lease expired.
+
+        A job whose lease expired on its last attempt (its worker crashed or was
+        killed every time) is marked failed instead of being leased again.
+        """
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (FAILED, "Worker stopped before finishing the job", datetime.now().isoformat(),
+                 RUNNING, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) "
+                "OR (status = ? AND lease_expires_at < ?) ORDER BY available_at LIMIT 1",
+                (QUEUED, now, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (RUNNING, now + self.lease_seconds, datetime.now().isoformat(), row['job_id'])
+            )
+        return self.get(row['job_id'])
+
+    def complete(self, job_id, result):
+        self.db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE job_id = ?",
+            (COMPLETED, json.dumps(result), datetime.now().isoformat(), job_id)
+        )
+
+    def fail(self, job_id, error, retry_delay=1):
+        """Record a failed attempt, re-queueing the job while attempts remain."""
+        job = self.get(job_id)
+        if job is not None and job['attempts'] < self.max_attempts:
+            status, available_at = QUEUED, time.time() + retry_delay * 2 ** (job['attempts'] - 1)
+        else:
+            status, available_at = FAILED, time.time()
+        self.db.execute(
+            "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_expires_at = NULL, updated_at = ? "
+            "WHERE job_id = ?",
+            (status, error, available_at, datetime.now().isoformat(), job_id)
+        )
+
+    def wait_for_work(self, timeout):
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def _failed_recently(self, row, now):
+        failed_at = datetime.fromisoformat(row['updated_at']).timestamp()
+        return now - failed_at < self.retry_failed_after
+
+    @staticmethod
+    def _to_job(row):
+        return {
+            'job_id': row['job_id'],
+            'kind': row['kind'],
+            'key': row['key'],
+            'payload': json.loads(row['payload']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+
+class JobWorkerPool:
+    """A pool of daemon threads that run queued jobs with the registered handlers."""
+
+    def __init__(self, queue, handlers, workers=4, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        with self.queue._wakeup:
+            self.queue._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+            if job is None:
+                self.queue.wait_for_work(self.poll_interval)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            self.queue.fail(job['job_id'], f"No handler registered for job kind '{job['kind']}'")
+            return
+        try:
+            result = handler(job['payload'])
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} ({job['kind']}) failed on attempt {job['attempts']}: {str(e)}")
+            self.queue.fail(job['job_id'], str(e))
+            return
+        self.queue.complete(job['job_id'], result)
+
+
+class AsyncJobRunner:
+    """Runs queued jobs as tasks on an event loop, so slow I/O-bound jobs don't each hold a thread.
+
+    Handlers are coroutine functions. Queue access (SQLite) runs in threads;
+    at most ``concurrency`` jobs are in flight at once.
+    """
+
+    def __init__(self, queue, handlers, concurrency=200, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self._tasks = set()
+
+    async def run(self):
+        """Claim and start jobs until cancelled."""
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+            if job is None:
+                slots.release()
+                # Woken early by jobs enqueued from this process
+                await asyncio.to_thread(self.queue.wait_for_work, self.poll_interval)
+                continue
+            task = asyncio.create_task(self.run_job(job, slots))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def run_job(self, job, slots):
+        self.in_flight += 1
+        try:
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                await asyncio.to_thread(self.queue.fail, job['job_id'],
+                                        f"No handler registered for job kind '{job['kind']}'")
+                return
+            try:
+                result = await handler(job['payload'])
+            except Exception as e:
+                logger.error(f"Job {job['job_id']} ({job['kind']}) failed on attempt {job['attempts']}: {str(e)}")
+                await asyncio.to_thread(self.queue.fail, job['job_id'], str(e))
+                return
+            await asyncio.to_thread(self.queue.complete, job['job_id'], result)
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'concurrency': self.concurrency}
@@ -0,0 +1,141 @@
+"""Compiled keyword matching for document type change detection.
+
+All keywords are compiled once into a single multi-pattern automaton that
+finds every keyword occurring in a comment in one pass over the text, with
+the same (overlapping, plain substring) semantics as ``keyword in text``.
+Precedence between keywords is then resolved from the set of matches.
+
+The automaton is pyahocorasick's Aho-Corasick automaton when it is installed.
+Otherwise the keywords are compiled into one regular expression shaped like
+their prefix trie, which finds the longest keyword starting at the leftmost
+position where any keyword starts; the search resumes one character later so
+overlapping keywords are found too. The shorter keywords starting at the same
+position are exactly that keyword's prefixes that are keywords too. This
+fallback is correct but slower than the substring scans it replaced.
+"""
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # The regular expression below is used instead
+    ahocorasick = None
+
+# Keywords that identify each document type in a revision comment (extend alongside app.DOCUMENT_TYPES)
+DOCUMENT_TYPE_KEYWORDS = {
+    "nda": ["non-disclosure", "nda", "confidentiality agreement", "secrecy agreement"],
+    "terms": ["terms of service", "terms of use", "tos", "terms and conditions", "service agreement"],
+    "privacy": ["privacy policy", "privacy notice", "data policy", "personal data", "gdpr", "ccpa"],
+    "contract": ["freelance contract", "contractor agreement", "freelancer agreement", "service contract"],
+    "employee": ["employment agreement", "employment contract", "staff contract", "labor contract", "work agreement"],
+    "partnership": ["partnership agreement", "partnership contract", "joint venture", "business partnership"]
+}
+
+# Phrases that suggest a comment asks for a different kind of document
+DOCUMENT_CHANGE_INDICATORS = [
+    "change it to", "convert to", "make it a", "transform into", "instead make",
+    "should be a", "replace with", "switch to", "change the document", "different document",
+    "document type", "type of document", "convert the", "need a different", "not a"
+]
+
+
+def trie_pattern(keywords):
+    """Regular expression matching any of ``keywords``, preferring the longest one at each position."""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy: a longer keyword through this node is tried before stopping at a shorter one
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Finds which of a fixed set of keywords occur in a text."""
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keyword for keyword in keywords if keyword))
+        self._automaton = None
+        self._pattern = None
+        if not self.keywords:
+            return
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        else:
+            self._pattern = re.compile(trie_pattern(self.keywords))
+            keyword_set = set(self.keywords)
+            self._prefixes = {keyword: frozenset(keyword[:end] for end in range(1, len(keyword) + 1)
+                                                 if keyword[:end] in keyword_set)
+                              for keyword in self.keywords}
+
+    @property
+    def engine(self):
+        return 'aho-corasick' if self._automaton is not None else 'regex'
+
+    def find_all(self, text):
+        """Return the set of keywords that occur in ``text``."""
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        if self._pattern is None:
+            return set()
+        found = set()
+        match = self._pattern.search(text)
+        while match is not None:
+            found.update(self._prefixes[match.group()])
+            match = self._pattern.search(text, match.start() + 1)
+        return found
+
+    def first(self, text, keywords):
+        """Return the first of ``keywords`` (in the given order) that occurs in ``text``, or None."""
+        found = self.find_all(text)
+        return next((keyword for keyword in keywords if keyword in found), None) if found else None
+
+
+class DocumentTypeChangeDetector:
+    """Detects comments asking to change a document into another document type.
+
+    ``document_keywords`` maps document type -> keywords and ``change_indicators``
+    lists generic phrases. Precedence follows table order: keywords of earlier
+    document types win, then earlier keywords, then change indicators.
+    """
+
+    def __init__(self, document_keywords, change_indicators):
+        self.document_keywords = {doc_type: tuple(keywords) for doc_type, keywords in document_keywords.items()}
+        self.change_indicators = tuple(change_indicators)
+        self.matcher = KeywordMatcher(
+            [keyword for keywords in self.document_keywords.values() for keyword in keywords]
+            + list(self.change_indicators)
+        )
+        self._order = {}
+
+    def detect(self, original_type, comment):
+        """Return (is_changing, detected_type, explanation) for a comment."""
+        comment_lower = comment.lower().strip()
+        key = original_type if original_type in self.document_keywords else None
+        order = self._order.get(key)
+        if order is None:
+            # Keywords in precedence order, without the original document type's own keywords
+            order = [(keyword, doc_type) for doc_type, keywords in self.document_keywords.items()
+                     if doc_type != original_type for keyword in keywords]
+            order += [(indicator, None) for indicator in self.change_indicators]
+            order = self._order.setdefault(key, (dict(reversed(order)), [keyword for keyword, _ in order]))
+        doc_types, keywords = order
+
+        keyword = self.matcher.first(comment_lower, keywords)
+        if keyword is None:
+            return False, "", ""
+        doc_type = doc_types[keyword]
+        if doc_type is None:
+            return True, "unknown", f"Found change indicator phrase: '{keyword}'"
+        return True, doc_type, f"Found keyword '{keyword}' suggesting a change to {doc_type}"
@@ -0,0 +1,330 @@
+"""Single call layer for OpenAI chat completions.
+
+Every call runs against a deadline: the time left is passed to the OpenAI
+client as its timeout, retries back off with full jitter but never sleep past
+the deadline, and a circuit breaker fails fast while OpenAI keeps failing.
+Web requests get a deadline shorter than the gunicorn worker timeout (see
+``set_deadline``); code outside a request falls back to ``default_timeout``.
+``AsyncLLMClient`` does the same for ``openai.AsyncOpenAI`` in the ASGI app.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+
+# Errors worth retrying: the request may succeed a moment later
+RETRYABLE_ERRORS = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                    openai.InternalServerError)
+# Don't start an attempt with less time than this left
+MIN_ATTEMPT_SECONDS = 1.0
+
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+
+class LLMError(Exception):
+    pass
+
+
+class DeadlineExceeded(LLMError):
+    pass
+
+
+class CircuitOpen(LLMError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+def set_deadline(seconds):
+    """Set the deadline for LLM calls made from the current context (e.g. a web request)."""
+    _deadline.set(Deadline(seconds))
+
+
+@contextmanager
+def deadline(seconds):
+    """Run a block with its own LLM deadline, restoring the previous one afterwards."""
+    token = _deadline.set(Deadline(seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one trial call through after ``reset_timeout``."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpen("OpenAI is unavailable, try again shortly")
+                self.state = self.HALF_OPEN
+            elif self.state == self.HALF_OPEN:
+                # A trial call is already in flight
+                raise CircuitOpen("OpenAI is unavailable, try again shortly")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class CompletionResult:
+    """What the API reported about a finished completion; ``complete`` and ``stream`` fill one in when given."""
+
+    def __init__(self):
+        self.finish_reason = None
+        self.completion_tokens = None
+
+    def record(self, finish_reason, usage):
+        self.finish_reason = finish_reason
+        self.completion_tokens = getattr(usage, 'completion_tokens', None)
+
+
+class LLMClient:
+    def __init__(self, client, breaker=None, max_attempts=3, default_timeout=120, base_delay=1.0, max_delay=8.0,
+                 on_complete=None):
+        """
+        client: an openai.OpenAI client
+        default_timeout: deadline (seconds) for calls made outside a deadline context
+        on_complete: optional callback(model, seconds, usage, error) run after each call, retries included
+        """
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.default_timeout = default_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_complete = on_complete
+
+    def complete(self, model, messages, max_tokens, temperature, result=None):
+        """Return the text of a chat completion, retrying transient errors within the deadline.
+
+        result: optional ``CompletionResult`` that receives the finish reason and output token count
+        """
+        start = time.perf_counter()
+        try:
+            response = self._call(lambda timeout: self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ))
+        except Exception as e:
+            self._completed(model, start, None, e)
+            raise
+        self._completed(model, start, getattr(response, 'usage', None), None)
+        if result is not None:
+            result.record(response.choices[0].finish_reason, getattr(response, 'usage', None))
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, max_tokens, temperature, result=None):
+        """Yield the text deltas of a streamed chat completion.
+
+        Opening the stream is retried like ``complete``; once text has been
+        sent a failure is raised, since the caller has already used it.
+        ``result`` is filled in once the stream has finished.
+        """
+        deadline = current_deadline() or Deadline(self.default_timeout)
+        start = time.perf_counter()
+        usage = None
+        finish_reason = None
+        error = None
+        try:
+            stream = self._call(lambda timeout: self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                # The last chunk then carries token usage
+                stream_options={'include_usage': True}
+            ), deadline)
+        except Exception as e:
+            self._completed(model, start, None, e)
+            raise
+        try:
+            for chunk in stream:
+                # The client timeout applies per read, so check the overall deadline as chunks arrive
+                if deadline.remaining() <= 0:
+                    raise DeadlineExceeded("The OpenAI stream did not finish before the deadline")
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except RETRYABLE_ERRORS as e:
+            error = e
+            self.breaker.record_failure()
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            stream.close()
+            self._completed(model, start, usage, error)
+            if result is not None and error is None:
+                result.record(finish_reason, usage)
+
+    def _completed(self, model, start, usage, error):
+        if self.on_complete is not None:
+            self.on_complete(model, time.perf_counter() - start, usage, error)
+
+    def _client(self, timeout):
+        # Retries are handled here, so the client's own retries are turned off
+        return self.client.with_options(timeout=timeout, max_retries=0)
+
+    def _call(self, request, deadline=None):
+        deadline = deadline or current_deadline() or Deadline(self.default_timeout)
+        attempt = 0
+        while True:
+            remaining = deadline.remaining()
+            if remaining < MIN_ATTEMPT_SECONDS:
+                raise DeadlineExceeded("No time left for the OpenAI request")
+            self.breaker.before_call()
+            attempt += 1
+            try:
+                result = request(remaining)
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._retry_delay(e, attempt, deadline))
+                continue
+            except openai.APIStatusError:
+                # Client errors (bad request, auth) won't improve with retries and don't mean OpenAI is down
+                self.breaker.record_success()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Record a retryable failure and return the backoff, or raise if no attempt is left."""
+        self.breaker.record_failure()
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if attempt >= self.max_attempts or deadline.remaining() - delay < MIN_ATTEMPT_SECONDS:
+            raise LLMError(f"OpenAI request failed after {attempt} attempts: {str(error)}") from error
+        return delay
+
+
+class AsyncLLMClient(LLMClient):
+    """``LLMClient`` for an ``openai.AsyncOpenAI`` client; the circuit breaker can be shared with the sync client."""
+
+    async def complete(self, model, messages, max_tokens, temperature, result=None):
+        start = time.perf_counter()
+        try:
+            response = await self._call(lambda timeout: self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            ))
+        except Exception as e:
+            self._completed(model, start, None, e)
+            raise
+        self._completed(model, start, getattr(response, 'usage', None), None)
+        if result is not None:
+            result.record(response.choices[0].finish_reason, getattr(response, 'usage', None))
+        return response.choices[0].message.content
+
+    async def stream(self, model, messages, max_tokens, temperature, result=None):
+        deadline = current_deadline() or Deadline(self.default_timeout)
+        start = time.perf_counter()
+        usage = None
+        finish_reason = None
+        error = None
+        try:
+            stream = await self._call(lambda timeout: self._client(timeout).chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={'include_usage': True}
+            ), deadline)
+        except Exception as e:
+            self._completed(model, start, None, e)
+            raise
+        try:
+            async for chunk in stream:
+                if deadline.remaining() <= 0:
+                    raise DeadlineExceeded("The OpenAI stream did not finish before the deadline")
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except RETRYABLE_ERRORS as e:
+            error = e
+            self.breaker.record_failure()
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await stream.close()
+            self._completed(model, start, usage, error)
+            if result is not None and error is None:
+                result.record(finish_reason, usage)
+
+    async def _call(self, request, deadline=None):
+        deadline = deadline or current_deadline() or Deadline(self.default_timeout)
+        attempt = 0
+        while True:
+            remaining = deadline.remaining()
+            if remaining < MIN_ATTEMPT_SECONDS:
+                raise DeadlineExceeded("No time left for the OpenAI request")
+            self.breaker.before_call()
+            attempt += 1
+            try:
+                result = await request(remaining)
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, deadline))
+                continue
+            except openai.APIStatusError:
+                self.breaker.record_success()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,170 @@
+"""Prometheus metrics for request stages, LLM tokens, caches and file storage.
+
+Each stage of a request (Stripe retrieve, prompt build, LLM call, PDF/DOCX
+render, file write) is timed into one histogram labelled by stage, endpoint,
+document type and model. Endpoint and document type come from a context set
+per request or job, so code deep in the call stack doesn't need to pass them.
+
+With several gunicorn workers, PROMETHEUS_MULTIPROC_DIR must be set before
+this module is imported (gunicorn.conf.py does it) so /metrics aggregates
+every worker's samples.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client import multiprocess
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# USD per 1K prompt/completion tokens, for the estimated cost counter
+MODEL_PRICES = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+}
+
+STAGE_SECONDS = Histogram(
+    'lexgen_stage_duration_seconds', "Time spent in each request stage",
+    ['stage', 'endpoint', 'document_type', 'model'], buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    'lexgen_stage_errors_total', "Stage executions that raised",
+    ['stage', 'endpoint', 'document_type', 'model']
+)
+LLM_TOKENS = Counter(
+    'lexgen_llm_tokens_total', "OpenAI tokens used, from response usage",
+    ['kind', 'endpoint', 'document_type', 'model']
+)
+LLM_COST = Counter(
+    'lexgen_llm_cost_usd_total', "Estimated OpenAI cost from token usage and MODEL_PRICES",
+    ['endpoint', 'document_type', 'model']
+)
+FILE_BYTES = Counter(
+    'lexgen_file_write_bytes_total', "Bytes written for generated files",
+    ['format', 'endpoint', 'document_type']
+)
+CACHE_EVENTS = Counter(
+    'lexgen_cache_events_total', "Cache lookups by outcome",
+    ['cache', 'event']
+)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+LLM_BUDGET_TOKENS = Histogram(
+    'lexgen_llm_budget_tokens', "Prompt tokens counted and max_tokens chosen per LLM request",
+    ['part', 'request', 'document_type', 'model'], buckets=TOKEN_BUCKETS
+)
+LLM_BUDGETS = Counter(
+    'lexgen_llm_budgets_total', "Token budgets chosen, by where max_tokens came from and whether it fit",
+    ['request', 'source', 'fits']
+)
+STORAGE_DELETED_FILES = Counter(
+    'lexgen_storage_gc_deleted_files_total', "Files deleted by the storage collector",
+    ['folder', 'reason']
+)
+STORAGE_DELETED_BYTES = Counter(
+    'lexgen_storage_gc_deleted_bytes_total', "Bytes deleted by the storage collector",
+    ['folder', 'reason']
+)
+# Only one worker collects per round, so report its latest reading rather than a sum over workers
+STORAGE_FILES = Gauge(
+    'lexgen_storage_files', "Managed files in each folder after the latest collection",
+    ['folder'], multiprocess_mode='mostrecent'
+)
+STORAGE_BYTES = Gauge(
+    'lexgen_storage_bytes', "Bytes of managed files in each folder after the latest collection",
+    ['folder'], multiprocess_mode='mostrecent'
+)
+
+_context = contextvars.ContextVar('metrics_context', default={})
+
+
+def set_context(**labels):
+    """Set labels (endpoint, document_type) for metrics recorded from the current context."""
+    _context.set({**_context.get(), **labels})
+
+
+def _labels(model=''):
+    context = _context.get()
+    return context.get('endpoint', 'background'), context.get('document_type', ''), model or ''
+
+
+@contextmanager
+def stage(name, model=''):
+    """Time a block into the stage histogram (and count it as an error if it raises)."""
+    endpoint, document_type, model = _labels(model)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(name, endpoint, document_type, model).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(name, endpoint, document_type, model).observe(time.perf_counter() - start)
+
+
+def observe_stage(name, seconds, model=''):
+    endpoint, document_type, model = _labels(model)
+    STAGE_SECONDS.labels(name, endpoint, document_type, model).observe(seconds)
+
+
+def observe_llm_call(model, seconds, usage, error):
+    """LLMClient hook: one observation per completed (or failed) OpenAI request."""
+    endpoint, document_type, model = _labels(model)
+    STAGE_SECONDS.labels('llm', endpoint, document_type, model).observe(seconds)
+    if error is not None:
+        STAGE_ERRORS.labels('llm', endpoint, document_type, model).inc()
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    LLM_TOKENS.labels('prompt', endpoint, document_type, model).inc(prompt_tokens)
+    LLM_TOKENS.labels('completion', endpoint, document_type, model).inc(completion_tokens)
+    prices = MODEL_PRICES.get(model)
+    if prices:
+        LLM_COST.labels(endpoint, document_type, model).inc(
+            prompt_tokens / 1000 * prices[0] + completion_tokens / 1000 * prices[1]
+        )
+
+
+def observe_render(fmt, stats):
+    """RenderService hook: render and file write timings for one output file."""
+    endpoint, document_type, _ = _labels()
+    STAGE_SECONDS.labels(f"{fmt}_render", endpoint, document_type, '').observe(stats['render_seconds'])
+    STAGE_SECONDS.labels('file_write', endpoint, document_type, '').observe(stats['write_seconds'])
+    FILE_BYTES.labels(fmt, endpoint, document_type).inc(stats['bytes'])
+
+
+def observe_token_budget(budget):
+    """TokenBudget hook: the prompt size and max_tokens chosen for one request."""
+    labels = (budget['kind'], budget['document_type'], budget['model'])
+    LLM_BUDGET_TOKENS.labels('prompt', *labels).observe(budget['prompt_tokens'])
+    LLM_BUDGET_TOKENS.labels('max_tokens', *labels).observe(budget['max_tokens'])
+    LLM_BUDGETS.labels(budget['kind'], budget['source'], str(budget['fits']).lower()).inc()
+
+
+def cache_counter(cache):
+    """Hook for the caches' hit/miss counters."""
+    return lambda event: CACHE_EVENTS.labels(cache, event).inc()
+
+
+def observe_storage_gc(report):
+    """StorageCollector hook: deletions and remaining folder sizes from one collection."""
+    for folder, result in report['folders'].items():
+        if not report['dry_run']:
+            for deleted in result['deleted']:
+                STORAGE_DELETED_FILES.labels(folder, deleted['reason']).inc()
+                STORAGE_DELETED_BYTES.labels(folder, deleted['reason']).inc(deleted['bytes'])
+        STORAGE_FILES.labels(folder).set(result['remaining_files'] if not report['dry_run'] else result['files'])
+        STORAGE_BYTES.labels(folder).set(result['remaining_bytes'] if not report['dry_run'] else result['bytes'])
+
+
+def render_latest():
+    """Return (body, content type) for the /metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
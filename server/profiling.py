@@ -0,0 +1,211 @@
+"""Opt-in profiling of individual web requests.
+
+``ProfilingMiddleware`` wraps the WSGI app only when profiling is enabled, so
+a disabled profiler adds no code to the request path. A request is profiled
+when it carries the admin token header or is picked by the sampling rate.
+The profile covers the request's handling and the iteration of its response
+(so streamed responses are included), and is written to the profile folder as:
+
+    pstats     deterministic cProfile output (``python -m pstats``, snakeviz)
+    collapsed  wall-clock stack samples in the collapsed format read by
+               flamegraph.pl and speedscope
+
+Only the request's own thread is profiled: with RENDER_WORKERS > 0 PDF/DOCX
+rendering runs in the render processes and shows up as waiting on a future,
+so profile with RENDER_WORKERS=0 to see inside the renderers.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PSTATS = 'pstats'
+COLLAPSED = 'collapsed'
+EXTENSIONS = {PSTATS: '.prof', COLLAPSED: '.collapsed'}
+
+
+class StackSampler:
+    """Samples one thread's stack on an interval and counts identical stacks."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _Profile:
+    """One profiled request: cProfile toggled around each step, or a sampler running throughout."""
+
+    def __init__(self, fmt, interval):
+        self.fmt = fmt
+        self.started = time.perf_counter()
+        if fmt == COLLAPSED:
+            self.profiler = StackSampler(threading.get_ident(), interval)
+            self.profiler.start()
+        else:
+            self.profiler = cProfile.Profile()
+
+    def run(self, func, *args):
+        if self.fmt == COLLAPSED:
+            return func(*args)
+        self.profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            self.profiler.disable()
+
+    def finish(self, path):
+        if self.fmt == COLLAPSED:
+            self.profiler.stop()
+            self.profiler.write(path)
+        else:
+            self.profiler.dump_stats(path)
+
+
+class _ProfiledResponse:
+    """Response iterable that keeps profiling while the server consumes it, then saves the profile."""
+
+    def __init__(self, iterable, profile, on_close):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._profile = profile
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._profile.run(next, self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._profile.run(self._iterable.close)
+        finally:
+            self._on_close()
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, folder, token=None, sample_rate=0.0, fmt=PSTATS, keep=100, interval=0.005,
+                 header='X-Profile-Token', exclude=('/api/profiles',)):
+        """
+        token: admin token; requests sending it in ``header`` are always profiled
+        sample_rate: share (0-1) of all other requests to profile
+        fmt: default output format, ``pstats`` or ``collapsed`` (requests may ask via X-Profile-Format)
+        keep: number of most recent profiles kept in ``folder``
+        interval: seconds between stack samples for the collapsed format
+        """
+        self.app = app
+        self.folder = folder
+        self.token = token
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.keep = keep
+        self.interval = interval
+        self.environ_header = 'HTTP_' + header.upper().replace('-', '_')
+        self.exclude = tuple(exclude)
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        if not self.should_profile(environ):
+            return self.app(environ, start_response)
+
+        fmt = environ.get('HTTP_X_PROFILE_FORMAT', self.fmt)
+        profile = _Profile(fmt if fmt in EXTENSIONS else self.fmt, self.interval)
+        status = []
+
+        def profiled_start_response(status_line, headers, exc_info=None):
+            status.append(status_line.split(' ', 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        def save():
+            try:
+                self._save(profile, environ, status[0] if status else 'error')
+            except Exception as e:
+                logger.error(f"Failed to save request profile: {str(e)}")
+
+        try:
+            response = profile.run(self.app, environ, profiled_start_response)
+        except Exception:
+            save()
+            raise
+        return _ProfiledResponse(response, profile, save)
+
+    def should_profile(self, environ):
+        if environ.get('PATH_INFO', '').startswith(self.exclude):
+            return False
+        if self.is_admin(environ):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def is_admin(self, environ):
+        supplied = environ.get(self.environ_header)
+        return bool(self.token and supplied and hmac.compare_digest(supplied, self.token))
+
+    def list_profiles(self):
+        """Most recent profiles first, as dicts with filename, size_bytes and created_at."""
+        profiles = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and entry.name.endswith(tuple(EXTENSIONS.values())):
+                stat = entry.stat()
+                profiles.append({
+                    'filename': entry.name,
+                    'size_bytes': stat.st_size,
+                    'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+        profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+        return profiles
+
+    def _save(self, profile, environ, status):
+        elapsed_ms = int((time.perf_counter() - profile.started) * 1000)
+        path = re.sub(r'[^A-Za-z0-9]+', '-', environ.get('PATH_INFO', '')).strip('-') or 'root'
+        filename = (f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{environ.get('REQUEST_METHOD', 'GET')}_"
+                    f"{path[:60]}_{status}_{elapsed_ms}ms_{uuid.uuid4().hex[:6]}{EXTENSIONS[profile.fmt]}")
+        profile.finish(os.path.join(self.folder, filename))
+        logger.info(f"Saved request profile {filename}")
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            for profile in self.list_profiles()[self.keep:]:
+                try:
+                    os.remove(os.path.join(self.folder, profile['filename']))
+                except FileNotFoundError:
+                    pass
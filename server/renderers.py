@@ -0,0 +1,226 @@
+"""PDF and DOCX renderers for generated legal documents.
+
+Kept free of Flask/OpenAI imports so render worker processes stay light.
+"""
+from copy import copy
+from datetime import datetime
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib import colors
+from docx import Document
+from docx.shared import Pt, Inches, RGBColor
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from document_ir import TITLE, HEADING, BULLET, SIGNATURE, BODY, parse_document
+
+# Bump whenever rendered output changes, so content-addressed artifacts are rendered again
+RENDERER_VERSION = "1"
+
+
+def document_date():
+    """The date printed under the title."""
+    return datetime.now().strftime('%B %d, %Y')
+
+
+# PDF colour themes. Styles are built once per theme and copied for each render.
+PDF_THEMES = {
+    'default': {
+        'accent': colors.navy,
+        'muted': colors.darkgrey,
+        'border': colors.lightgrey
+    }
+}
+
+# Document types (by display name) that render with a theme other than the default
+DOCUMENT_TYPE_THEMES = {}
+
+
+def pdf_styles(document_type=None, theme=None):
+    """Return a render's paragraph styles for a document type and theme.
+
+    The styles are built once per theme and shared, so callers get shallow
+    copies: changing an attribute of one only affects the caller's render.
+    """
+    theme = theme or DOCUMENT_TYPE_THEMES.get(document_type, 'default')
+    return {kind: copy(style) for kind, style in _theme_styles(theme).items()}
+
+
+@lru_cache(maxsize=None)
+def _theme_styles(theme):
+    """The shared styles for a theme; never handed out, see ``pdf_styles``."""
+    palette = PDF_THEMES[theme]
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'Title',
+        parent=styles['Heading1'],
+        fontSize=16,
+        alignment=TA_CENTER,
+        spaceAfter=20,
+        textColor=palette['accent'],
+        fontName='Helvetica-Bold'
+    )
+    
+    normal_style = ParagraphStyle(
+        'Normal',
+        parent=styles['Normal'],
+        fontSize=11,
+        alignment=TA_JUSTIFY,
+        firstLineIndent=20,
+        leading=14,
+        spaceBefore=6,
+        spaceAfter=6
+    )
+    
+    header_style = ParagraphStyle(
+        'Header',
+        parent=styles['Heading2'],
+        fontSize=13,
+        spaceAfter=10,
+        spaceBefore=15,
+        textColor=palette['accent'],
+        fontName='Helvetica-Bold',
+        borderWidth=1,
+        borderColor=palette['border'],
+        borderPadding=5,
+        borderRadius=2
+    )
+    
+    date_style = ParagraphStyle(
+        'Date',
+        parent=styles['Normal'],
+        fontSize=11,
+        alignment=TA_RIGHT,
+        textColor=palette['muted']
+    )
+    
+    bullet_style = ParagraphStyle(
+        'Bullet',
+        parent=normal_style,
+        leftIndent=30,
+        firstLineIndent=0,
+        spaceBefore=3,
+        spaceAfter=3
+    )
+    
+    sig_style = ParagraphStyle(
+        'Signature',
+        parent=normal_style,
+        spaceBefore=15,
+        spaceAfter=15
+    )
+    
+    return {
+        'date': date_style,
+        TITLE: title_style,
+        HEADING: header_style,
+        BULLET: bullet_style,
+        SIGNATURE: sig_style,
+        BODY: normal_style
+    }
+
+
+def create_pdf(text, filepath, business_name, document_type, theme=None, date=None):
+    doc = SimpleDocTemplate(filepath, pagesize=letter,
+                          rightMargin=72, leftMargin=72,
+                          topMargin=72, bottomMargin=72)
+    styles = pdf_styles(document_type, theme)
+    title_style = styles[TITLE]
+    
+    content = []
+    
+    content.append(Paragraph(f"{document_type.upper()}", title_style))
+    content.append(Paragraph(f"For: {business_name}", title_style))
+    content.append(Spacer(1, 20))
+    
+    content.append(Paragraph(f"Date: {date or document_date()}", styles['date']))
+    content.append(Spacer(1, 20))
+    
+    for block in parse_document(text):
+        if block.kind == BULLET:
+            content.append(Paragraph(pdf_markup(block), styles[BULLET], bulletText='•'))
+        else:
+            content.append(Paragraph(pdf_markup(block), styles[block.kind]))
+        
+        if block.kind in (TITLE, HEADING):
+            content.append(Spacer(1, 10))
+        else:
+            content.append(Spacer(1, 6))
+    
+    doc.build(content)
+
+
+def create_docx(text, filepath, business_name, document_type, date=None):
+    doc = Document()
+    
+    # Set document margins (1 inch on all sides)
+    sections = doc.sections
+    for section in sections:
+        section.top_margin = Inches(1)
+        section.bottom_margin = Inches(1)
+        section.left_margin = Inches(1)
+        section.right_margin = Inches(1)
+    
+    # Add title
+    title = doc.add_paragraph()
+    title_run = title.add_run(document_type.upper())
+    title_run.bold = True
+    title_run.font.size = Pt(16)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Add business name
+    business = doc.add_paragraph()
+    business_run = business.add_run(f"For: {business_name}")
+    business_run.bold = True
+    business_run.font.size = Pt(14)
+    business.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Add date
+    date_paragraph = doc.add_paragraph()
+    date_paragraph.add_run(f"Date: {date or document_date()}")
+    date_paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+    
+    # Add document text
+    for block in parse_document(text):
+        if block.kind in (TITLE, HEADING):
+            header = doc.add_paragraph()
+            header_run = header.add_run(block.text)
+            header_run.bold = True
+            if block.kind == TITLE:
+                header_run.font.size = Pt(16)
+                header.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            else:
+                header_run.font.size = Pt(14)
+                header.style = 'Heading 2'
+        
+        elif block.kind == BULLET:
+            add_docx_runs(doc.add_paragraph(style='List Bullet'), block)
+        
+        elif block.kind == SIGNATURE:
+            p = doc.add_paragraph()
+            p.add_run(block.text).bold = True
+            p.paragraph_format.space_after = Pt(20)
+        
+        else:
+            add_docx_runs(doc.add_paragraph(), block)
+    
+    doc.save(filepath)
+
+
+def pdf_markup(block):
+    """Escape a block's runs for reportlab's paragraph markup, keeping bold spans."""
+    parts = []
+    for span, bold in block.spans:
+        span = escape(span)
+        parts.append(f"<b>{span}</b>" if bold else span)
+    return ''.join(parts)
+
+
+def add_docx_runs(paragraph, block):
+    for span, bold in block.spans:
+        paragraph.add_run(span).bold = bold
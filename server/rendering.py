@@ -0,0 +1,138 @@
+"""Render service that runs PDF and DOCX rendering in a warm process pool.
+
+Rendering is CPU-bound and holds the GIL, so doing it on the request thread
+stalls every other request in the worker. The pool's processes import
+reportlab and python-docx (and render a throwaway document) when they start,
+so the first real render doesn't pay the import cost. When both formats are
+needed they render concurrently, so latency is max(pdf, docx) instead of the sum.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import renderers
+
+logger = logging.getLogger(__name__)
+
+RENDERERS = {
+    'pdf': renderers.create_pdf,
+    'docx': renderers.create_docx
+}
+
+
+class RenderQueueFull(Exception):
+    """Raised when too many renders are already queued for the pool."""
+
+
+def _warm_up():
+    # Exercise both renderers once so fonts, styles and templates are loaded
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, render in RENDERERS.items():
+            render("WARM UP\nBody text.", os.path.join(tmp, f"warmup.{fmt}"), "Warm Up", "Warm Up")
+
+
+def _render(fmt, text, filepath, business_name, document_type, date=None):
+    """Render into memory, then write the file, timing each step separately."""
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    RENDERERS[fmt](text, buffer, business_name, document_type, date=date)
+    rendered = time.perf_counter()
+    data = buffer.getbuffer()
+    # Write under a temporary name so a concurrent reader never sees a partial file
+    partial = f"{filepath}.{os.getpid()}.{threading.get_ident()}.partial"
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, filepath)
+    return {'render_seconds': rendered - start, 'write_seconds': time.perf_counter() - rendered, 'bytes': len(data)}
+
+
+class RenderService:
+    def __init__(self, workers=2, max_queue=16, queue_timeout=30, on_render=None):
+        """
+        workers: render processes per web process (0 renders inline on the calling thread)
+        max_queue: maximum renders submitted to the pool at once
+        queue_timeout: seconds to wait for a queue slot before raising RenderQueueFull
+        on_render: optional callback(format, timings) run on the calling thread after each file is written
+        """
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.on_render = on_render
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._pool_lock = threading.Lock()
+        self._pool = None
+
+    def start(self):
+        """Spawn the pool's processes up front instead of on the first render."""
+        if self.workers <= 0:
+            return
+        try:
+            # Don't wait for the warm-up: spawning is enough to get it going
+            pool = self._get_pool()
+            for _ in range(self.workers):
+                pool.submit(os.getpid)
+        except Exception as e:
+            # Not fatal: the pool is created again on the first render
+            logger.error(f"Failed to start render pool: {str(e)}")
+            self._reset_pool()
+
+    def render(self, text, outputs, business_name, document_type, date=None):
+        """Render ``text`` into each ``{format: filepath}`` entry of ``outputs`` concurrently."""
+        if self.workers <= 0:
+            for fmt, filepath in outputs.items():
+                self._rendered(fmt, _render(fmt, text, filepath, business_name, document_type, date))
+            return outputs
+
+        acquired = 0
+        try:
+            for _ in outputs:
+                if not self._slots.acquire(timeout=self.queue_timeout):
+                    raise RenderQueueFull("Too many documents are being rendered, please try again shortly")
+                acquired += 1
+            try:
+                self._render_in_pool(text, outputs, business_name, document_type, date)
+            except BrokenProcessPool:
+                # A render process died (e.g. OOM); replace the pool and retry once
+                logger.error("Render pool is broken, restarting it")
+                self._reset_pool()
+                self._render_in_pool(text, outputs, business_name, document_type, date)
+        finally:
+            for _ in range(acquired):
+                self._slots.release()
+        return outputs
+
+    def shutdown(self):
+        self._reset_pool()
+
+    def _render_in_pool(self, text, outputs, business_name, document_type, date=None):
+        pool = self._get_pool()
+        futures = {fmt: pool.submit(_render, fmt, text, filepath, business_name, document_type, date)
+                   for fmt, filepath in outputs.items()}
+        for fmt, future in futures.items():
+            self._rendered(fmt, future.result())
+
+    def _rendered(self, fmt, timings):
+        if self.on_render is not None:
+            self.on_render(fmt, timings)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned (not forked) children: the web process runs threads and holds sqlite handles
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up
+                )
+            return self._pool
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,281 @@
+"""Indexed catalog of document revisions, kept as an append-only event journal.
+
+Every change to a revision (recorded, completed, failed, files rendered) is
+appended to ``revision_events`` and applied to the ``revisions`` table in the
+same transaction, so each write is one small durable commit and reads query
+the materialized current state instead of parsing JSON files. The journal is
+the source of truth: ``rebuild`` replays it into the revisions table, and
+``compact`` folds the events of long-finished revisions into one snapshot.
+Revisions left pending by a crashed worker are marked failed by ``recover``.
+
+Replaces scanning DOWNLOAD_FOLDER and parsing every feedback_*.json file to
+list a session's revisions. Existing JSON files can be imported once with:
+
+    python revision_catalog.py import [--db data/revisions.db] [folder ...]
+
+and the journal compacted or replayed with ``compact [--days 30]`` and ``rebuild``.
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+from db import SQLiteDatabase
+
+FIELDS = ('session_id', 'status', 'comment', 'timestamp', 'completed_at', 'error',
+          'pdf_filename', 'docx_filename')
+
+RECORDED = 'recorded'
+UPDATED = 'updated'
+SNAPSHOT = 'snapshot'
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class RevisionCatalog:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS revisions (
+        revision_id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        comment TEXT,
+        timestamp TEXT NOT NULL,
+        completed_at TEXT,
+        error TEXT,
+        pdf_filename TEXT,
+        docx_filename TEXT,
+        form_data TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_revisions_session ON revisions (session_id, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_revisions_timestamp ON revisions (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_revisions_status ON revisions (status, timestamp);
+    CREATE TABLE IF NOT EXISTS revision_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        revision_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_revision_events_revision ON revision_events (revision_id, seq);
+    """
+
+    def __init__(self, path):
+        # Each event is a single commit; FULL syncs it to disk before the request continues
+        self.db = SQLiteDatabase(path, self.SCHEMA, synchronous='FULL')
+        self._snapshot_unjournaled()
+
+    def record(self, revision_data):
+        """Insert or update a revision from a feedback/revision dict."""
+        values = {field: revision_data.get(field) for field in FIELDS}
+        values['timestamp'] = values['timestamp'] or datetime.now().isoformat()
+        values['status'] = values['status'] or 'pending'
+        values['form_data'] = revision_data.get('form_data')
+        with self.db.transaction() as conn:
+            self._append(conn, revision_data['revision_id'], RECORDED, values)
+
+    def update(self, revision_id, **fields):
+        """Update selected columns (status, completed_at, error, pdf_filename, docx_filename).
+
+        Journaled as an event named after the new status, or ``updated``.
+        """
+        values = {field: value for field, value in fields.items() if field in FIELDS and field != 'session_id'}
+        if not values:
+            return
+        with self.db.transaction() as conn:
+            if conn.execute("SELECT 1 FROM revisions WHERE revision_id = ?", (revision_id,)).fetchone() is None:
+                return
+            self._append(conn, revision_id, values.get('status') or UPDATED, values)
+
+    def get(self, revision_id):
+        row = self.db.execute("SELECT * FROM revisions WHERE revision_id = ?", (revision_id,)).fetchone()
+        return self._to_revision(row) if row else None
+
+    def events(self, revision_id):
+        """Return a revision's journal, oldest first, as dicts with seq, event, data and created_at."""
+        rows = self.db.execute(
+            "SELECT seq, event, data, created_at FROM revision_events WHERE revision_id = ? ORDER BY seq",
+            (revision_id,)
+        ).fetchall()
+        return [dict(row, data=json.loads(row['data'])) for row in rows]
+
+    def list_for_session(self, session_id, limit=50, offset=0):
+        """Return (revisions, total) for a session, newest first."""
+        rows = self.db.execute(
+            "SELECT * FROM revisions WHERE session_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            (session_id, limit, offset)
+        ).fetchall()
+        total = self.db.execute("SELECT COUNT(*) FROM revisions WHERE session_id = ?", (session_id,)).fetchone()[0]
+        return [self._to_revision(row) for row in rows], total
+
+    def list_since(self, since):
+        """Return revisions requested or completed at or after ``since`` (a datetime), oldest first."""
+        since = since.isoformat()
+        rows = self.db.execute(
+            "SELECT * FROM revisions WHERE timestamp >= ? OR completed_at >= ? ORDER BY timestamp",
+            (since, since)
+        ).fetchall()
+        return [self._to_revision(row) for row in rows]
+
+    def import_files(self, folders):
+        """Import feedback_*.json and revision_info_*.json files; returns the number imported."""
+        imported = 0
+        for folder in folders:
+            if not os.path.isdir(folder):
+                continue
+            for file in sorted(os.listdir(folder)):
+                if not file.endswith(".json") or not file.startswith(("feedback_", "revision_info_")):
+                    continue
+                try:
+                    with open(os.path.join(folder, file), 'r') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping unreadable file {file}: {str(e)}")
+                    continue
+                if not data.get('revision_id') or not data.get('session_id'):
+                    continue
+                if file.startswith("revision_info_"):
+                    # Revision info files only carry the rendered filenames
+                    if self.get(data['revision_id']) is None:
+                        self.record(dict(data, status='completed', completed_at=data.get('timestamp')))
+                    else:
+                        self.update(data['revision_id'], pdf_filename=data.get('pdf_filename'),
+                                    docx_filename=data.get('docx_filename'))
+                else:
+                    self.record(data)
+                imported += 1
+        return imported
+
+    def recover(self, stale_before):
+        """Mark revisions still pending since before ``stale_before`` (a datetime) as failed.
+
+        A revision is generated within its request, so one left pending that long
+        belongs to a worker that crashed or was killed. Returns the number recovered.
+        """
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT revision_id FROM revisions WHERE status = 'pending' AND timestamp < ?",
+                (stale_before.isoformat(),)
+            ).fetchall()
+            for row in rows:
+                self._append(conn, row['revision_id'], 'failed',
+                             {'status': 'failed', 'error': 'Interrupted before the revision completed'})
+        return len(rows)
+
+    def compact(self, finished_before, batch_size=500):
+        """Fold the events of revisions finished before ``finished_before`` into one snapshot each.
+
+        Returns the number of revisions compacted.
+        """
+        compacted = 0
+        while True:
+            with self.db.transaction() as conn:
+                rows = conn.execute(
+                    "SELECT r.* FROM revisions r WHERE r.status IN (?, ?) AND COALESCE(r.completed_at, r.timestamp) < ? "
+                    "AND (SELECT COUNT(*) FROM revision_events e WHERE e.revision_id = r.revision_id) > 1 LIMIT ?",
+                    FINISHED_STATUSES + (finished_before.isoformat(), batch_size)
+                ).fetchall()
+                for row in rows:
+                    conn.execute("DELETE FROM revision_events WHERE revision_id = ?", (row['revision_id'],))
+                    self._append(conn, row['revision_id'], SNAPSHOT, self._snapshot(row))
+            compacted += len(rows)
+            if len(rows) < batch_size:
+                return compacted
+
+    def rebuild(self):
+        """Rebuild the revisions table by replaying the journal; returns the number of revisions."""
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM revisions")
+            for row in conn.execute("SELECT revision_id, event, data FROM revision_events ORDER BY seq").fetchall():
+                self._apply(conn, row['revision_id'], row['event'], json.loads(row['data']))
+            return conn.execute("SELECT COUNT(*) FROM revisions").fetchone()[0]
+
+    def _snapshot_unjournaled(self):
+        """Give revisions recorded before the journal existed a snapshot event, so rebuilds keep them."""
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM revisions r WHERE NOT EXISTS "
+                "(SELECT 1 FROM revision_events e WHERE e.revision_id = r.revision_id)"
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "INSERT INTO revision_events (revision_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                    (row['revision_id'], SNAPSHOT, json.dumps(self._snapshot(row)), datetime.now().isoformat())
+                )
+
+    def _append(self, conn, revision_id, event, data):
+        conn.execute(
+            "INSERT INTO revision_events (revision_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+            (revision_id, event, json.dumps(data), datetime.now().isoformat())
+        )
+        self._apply(conn, revision_id, event, data)
+
+    @staticmethod
+    def _apply(conn, revision_id, event, data):
+        """Apply one journal event to the revisions table."""
+        if event in (RECORDED, SNAPSHOT):
+            form_data = data.get('form_data')
+            params = (revision_id, data.get('session_id'), data.get('status'), data.get('comment'),
+                      data.get('timestamp'), data.get('completed_at'), data.get('error'),
+                      data.get('pdf_filename'), data.get('docx_filename'),
+                      json.dumps(form_data) if form_data is not None else None)
+            if event == SNAPSHOT:
+                conn.execute("INSERT OR REPLACE INTO revisions (revision_id, session_id, status, comment, timestamp, "
+                             "completed_at, error, pdf_filename, docx_filename, form_data) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", params)
+            else:
+                conn.execute(
+                    "INSERT INTO revisions (revision_id, session_id, status, comment, timestamp, completed_at, "
+                    "error, pdf_filename, docx_filename, form_data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (revision_id) DO UPDATE SET status = excluded.status, "
+                    "completed_at = COALESCE(excluded.completed_at, completed_at), "
+                    "error = COALESCE(excluded.error, error), "
+                    "pdf_filename = COALESCE(excluded.pdf_filename, pdf_filename), "
+                    "docx_filename = COALESCE(excluded.docx_filename, docx_filename)",
+                    params
+                )
+            return
+        columns = [field for field in data if field in FIELDS and field != 'session_id']
+        if columns:
+            conn.execute(
+                f"UPDATE revisions SET {', '.join(f'{column} = ?' for column in columns)} WHERE revision_id = ?",
+                tuple(data[column] for column in columns) + (revision_id,)
+            )
+
+    @staticmethod
+    def _snapshot(row):
+        snapshot = {field: row[field] for field in FIELDS}
+        snapshot['form_data'] = json.loads(row['form_data']) if row['form_data'] else None
+        return snapshot
+
+    @staticmethod
+    def _to_revision(row):
+        revision = {field: row[field] for field in FIELDS}
+        revision['revision_id'] = row['revision_id']
+        revision['form_data'] = json.loads(row['form_data']) if row['form_data'] else None
+        return revision
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Revision catalog maintenance")
+    db_parser = argparse.ArgumentParser(add_help=False)
+    db_parser.add_argument('--db', default=os.path.join(os.getenv("DATA_FOLDER", "data"), "revisions.db"))
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    import_parser = subcommands.add_parser('import', parents=[db_parser],
+                                           help="Import existing feedback/revision JSON files")
+    import_parser.add_argument('folders', nargs='*',
+                               default=[os.path.join("static", "downloads"), os.path.join("static", "revisions")])
+    compact_parser = subcommands.add_parser('compact', parents=[db_parser],
+                                            help="Fold the events of finished revisions into snapshots")
+    compact_parser.add_argument('--days', type=float, default=30, help="only revisions finished this long ago")
+    subcommands.add_parser('rebuild', parents=[db_parser], help="Rebuild the revisions table from the event journal")
+    args = parser.parse_args()
+
+    catalog = RevisionCatalog(args.db)
+    if args.command == 'import':
+        count = catalog.import_files(args.folders)
+        print(f"Imported {count} files into {args.db}")
+    elif args.command == 'compact':
+        count = catalog.compact(datetime.fromtimestamp(datetime.now().timestamp() - args.days * 86400))
+        print(f"Compacted {count} revisions in {args.db}")
+    else:
+        count = catalog.rebuild()
+        print(f"Rebuilt {count} revisions in {args.db}")
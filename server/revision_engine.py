@@ -0,0 +1,341 @@
+"""Section-targeted document revisions.
+
+Instead of sending the whole document to the LLM and asking for all of it
+back, the document is split into sections at its headings, the sections the
+user's comment is about are identified (locally first, with a small LLM call
+listing only the headings as a fallback), and only those sections are
+rewritten, concurrently, before being spliced back into the original text.
+Comments that apply to the whole document fall back to a full revision.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from document_ir import HEADING, TITLE, classify_line
+
+logger = logging.getLogger(__name__)
+
+# Phrases that mean the change applies everywhere, so a full revision is needed
+GLOBAL_PATTERN = re.compile(
+    r"\b(throughout|entire|whole document|all sections|every section|everywhere|overall|"
+    r"whole agreement|entire agreement|tone|translate|rewrite|shorten|simplify the document)\b",
+    re.IGNORECASE
+)
+# "section 3", "article IV", "clause 2.1", "paragraph 5"
+REFERENCE_PATTERN = re.compile(r"\b(?:section|article|clause|paragraph|part)\s+([0-9]+|[ivxlc]+)\b", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[a-zA-Z][a-zA-Z'-]{2,}")
+STOPWORDS = frozenset("""
+    the and for with this that from into your our their there these those which what when where who will
+    shall should would could must may can about above below under over more less some such only also than
+    then them they have has had not any all each other its it's are was were been being please make change
+    update add remove include section clause article paragraph agreement document party parties
+""".split())
+ROMAN = {'i': 1, 'ii': 2, 'iii': 3, 'iv': 4, 'v': 5, 'vi': 6, 'vii': 7, 'viii': 8, 'ix': 9, 'x': 10,
+         'xi': 11, 'xii': 12, 'xiii': 13, 'xiv': 14, 'xv': 15, 'xvi': 16, 'xvii': 17, 'xviii': 18, 'xix': 19, 'xx': 20}
+LEADING_NUMBER = re.compile(r"^(?:section|article|clause|part)?\s*([0-9]+|[ivxlc]+)[.):\s]", re.IGNORECASE)
+
+SECTION_SYSTEM_PROMPT = ("You are a legal document revision assistant. Update documents precisely according to "
+                         "user feedback while maintaining their professional structure and format.")
+
+
+def split_sections(text):
+    """Split document text at heading lines.
+
+    Returns a list of dicts with 'heading' ('' for the preamble) and 'text'
+    (the raw lines of the section, heading included), so joining the texts
+    gives back the original document exactly.
+    """
+    sections = []
+    current = []
+    heading = ''
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped and classify_line(stripped)[0] in (HEADING, TITLE) and any(l.strip() for l in current):
+            sections.append({'heading': heading, 'text': '\n'.join(current)})
+            current = []
+            heading = ''
+        if stripped and not heading and classify_line(stripped)[0] in (HEADING, TITLE):
+            heading = classify_line(stripped)[1]
+        current.append(line)
+    sections.append({'heading': heading, 'text': '\n'.join(current)})
+    for index, section in enumerate(sections):
+        section['index'] = index
+        section['number'] = _heading_number(section['heading'])
+    return sections
+
+
+def join_sections(sections):
+    return '\n'.join(section['text'] for section in sections)
+
+
+def find_target_sections(sections, comment):
+    """Identify the sections a comment targets without calling the LLM.
+
+    Returns 'all' for document-wide changes, a sorted list of section indexes,
+    or None when the comment can't be matched locally with confidence.
+
+    A local answer is only given when it accounts for every section the comment
+    mentions: sections referenced by number, or else the one section whose
+    heading the comment names. A comment naming several headings (or a heading
+    besides the sections it references) may cover several topics, so it is left
+    to the LLM locator rather than risk silently dropping one of its changes.
+    """
+    if GLOBAL_PATTERN.search(comment):
+        return 'all'
+
+    referenced = set()
+    for reference in REFERENCE_PATTERN.findall(comment):
+        number = _to_number(reference)
+        referenced.update(section['index'] for section in sections if section['number'] == number)
+
+    comment_words = _significant_words(comment)
+    heading_matches = {
+        section['index'] for section in sections
+        if comment_words & _significant_words(section['heading'])
+    }
+
+    if referenced:
+        return sorted(referenced) if heading_matches <= referenced else None
+    if len(heading_matches) == 1:
+        return sorted(heading_matches)
+    return None
+
+
+class RevisionEngine:
+    def __init__(self, complete, max_workers=4, fits_full_revision=None):
+        """
+        complete: callable(messages, max_tokens, temperature) -> str used for every LLM call
+        fits_full_revision: optional callable(text, comment) -> bool; document-wide changes to
+                            documents it rejects are applied to every section separately
+        """
+        self.complete = complete
+        self.max_workers = max_workers
+        self.fits_full_revision = fits_full_revision
+
+    def revise(self, text, comment, document_type_name="legal document", full_revision=None):
+        """Apply a user's comment to a document.
+
+        Returns {'text', 'mode' ('sections' or 'full'), 'sections' (indexes rewritten)}.
+        ``full_revision(text, comment)`` is used when the change spans the document.
+        """
+        sections = split_sections(text)
+        targets = find_target_sections(sections, comment) if len(sections) > 1 else 'all'
+        insert_after = None
+        if targets is None:
+            targets, insert_after = self._locate_with_llm(sections, comment)
+        if (targets == 'all' and len(sections) > 1 and self.fits_full_revision is not None
+                and not self.fits_full_revision(text, comment)):
+            targets = [section['index'] for section in sections]
+
+        if targets == 'all' or (not targets and insert_after is None):
+            if full_revision is None:
+                raise ValueError("The requested change needs a full revision")
+            return {'text': full_revision(text, comment), 'mode': 'full', 'sections': []}
+
+        headings = [section['heading'] for section in sections if section['heading']]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Section calls run with the caller's context (e.g. its request deadline)
+            def submit(fn, *args):
+                return executor.submit(contextvars.copy_context().run, fn, *args)
+
+            new_section_future = None
+            if insert_after is not None:
+                new_section_future = submit(self._write_new_section, sections, insert_after, comment, document_type_name)
+            section_futures = [
+                submit(self._revise_section, sections[index], comment, document_type_name, headings)
+                for index in targets
+            ]
+            revised = {index: future.result() for index, future in zip(targets, section_futures)}
+            new_section = new_section_future.result() if new_section_future else None
+
+        return {'text': _splice(sections, revised, insert_after, new_section), 'mode': 'sections', 'sections': targets}
+
+    async def revise_async(self, complete, text, comment, document_type_name="legal document", full_revision=None):
+        """``revise`` for coroutines, with the LLM calls made on the event loop.
+
+        ``complete`` and ``full_revision`` are async versions of the engine's
+        ``complete`` and of ``revise``'s ``full_revision``. Section calls run
+        concurrently, at most ``max_workers`` at a time.
+        """
+        sections = split_sections(text)
+        targets = find_target_sections(sections, comment) if len(sections) > 1 else 'all'
+        insert_after = None
+        if targets is None:
+            try:
+                answer = await complete(**self._locate_request(sections, comment))
+                targets, insert_after = self._parse_location(sections, answer)
+            except Exception as e:
+                logger.error(f"Could not locate revision sections, revising the full document: {str(e)}")
+                targets = 'all'
+        if (targets == 'all' and len(sections) > 1 and self.fits_full_revision is not None
+                and not await asyncio.to_thread(self.fits_full_revision, text, comment)):
+            targets = [section['index'] for section in sections]
+
+        if targets == 'all' or (not targets and insert_after is None):
+            if full_revision is None:
+                raise ValueError("The requested change needs a full revision")
+            return {'text': await full_revision(text, comment), 'mode': 'full', 'sections': []}
+
+        headings = [section['heading'] for section in sections if section['heading']]
+        slots = asyncio.Semaphore(self.max_workers)
+
+        async def call(request):
+            async with slots:
+                return _strip_fences(await complete(**request))
+
+        async def revise_section(section):
+            request = self._section_request(section, comment, document_type_name, headings)
+            return _keep_heading(section, await call(request))
+
+        calls = [revise_section(sections[index]) for index in targets]
+        if insert_after is not None:
+            calls.append(call(self._new_section_request(sections, insert_after, comment, document_type_name)))
+        results = await asyncio.gather(*calls)
+        revised = dict(zip(targets, results))
+        new_section = results[-1] if insert_after is not None else None
+
+        return {'text': _splice(sections, revised, insert_after, new_section), 'mode': 'sections', 'sections': targets}
+
+    def _locate_with_llm(self, sections, comment):
+        try:
+            return self._parse_location(sections, self.complete(**self._locate_request(sections, comment)))
+        except Exception as e:
+            logger.error(f"Could not locate revision sections, revising the full document: {str(e)}")
+            return 'all', None
+
+    def _locate_request(self, sections, comment):
+        outline = '\n'.join(f"{section['index']}: {section['heading'] or '(preamble)'}" for section in sections)
+        prompt = f"""A user asked for a change to a legal document. The document's sections are:
+{outline}
+
+User's change request:
+```
+{comment}
+```
+
+Return ONLY a JSON object: {{"sections": [indexes of the sections to rewrite], "insert_after": index after which a new section must be added, or null}}.
+Use {{"sections": "all"}} if the change affects the whole document."""
+        return {'messages': [{"role": "user", "content": prompt}], 'max_tokens': 100, 'temperature': 0}
+
+    def _parse_location(self, sections, answer):
+        located = json.loads(_strip_fences(answer))
+        targets = located.get('sections')
+        if targets == 'all' or not isinstance(targets, list):
+            return 'all', None
+        valid = sorted({index for index in targets if isinstance(index, int) and 0 <= index < len(sections)})
+        insert_after = located.get('insert_after')
+        if not isinstance(insert_after, int) or not 0 <= insert_after < len(sections):
+            insert_after = None
+        return valid, insert_after
+
+    def _revise_section(self, section, comment, document_type_name, headings):
+        request = self._section_request(section, comment, document_type_name, headings)
+        return _keep_heading(section, _strip_fences(self.complete(**request)))
+
+    def _section_request(self, section, comment, document_type_name, headings):
+        prompt = f"""Below is one section of a {document_type_name}. The document's section headings are: {', '.join(headings)}.
+
+Section to revise:
+```
+{section['text']}
+```
+
+The user has requested the following changes:
+```
+{comment}
+```
+
+Return only the revised section text, keeping its heading and formatting. Do not add content from other sections."""
+        return {
+            'messages': [
+                {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            'max_tokens': section_max_tokens(section['text']),
+            'temperature': 0.7
+        }
+
+    def _write_new_section(self, sections, insert_after, comment, document_type_name):
+        request = self._new_section_request(sections, insert_after, comment, document_type_name)
+        return _strip_fences(self.complete(**request))
+
+    def _new_section_request(self, sections, insert_after, comment, document_type_name):
+        prompt = f"""A {document_type_name} needs a new section after the section titled "{sections[insert_after]['heading'] or 'preamble'}".
+
+The user has requested:
+```
+{comment}
+```
+
+Write only the new section, starting with an ALL CAPS heading, in the same style as a professional legal document."""
+        return {
+            'messages': [
+                {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            'max_tokens': 800,
+            'temperature': 0.7
+        }
+
+
+def _splice(sections, revised, insert_after, new_section):
+    """Document text with the revised sections swapped in and the new section (if any) inserted"""
+    updated = []
+    for section in sections:
+        if section['index'] in revised:
+            # Keep the blank lines that separated the section from the next one
+            text = revised[section['index']] + _trailing_blank_lines(section['text'])
+            updated.append(dict(section, text=text))
+        else:
+            updated.append(section)
+        if section['index'] == insert_after and new_section:
+            text = new_section + (_trailing_blank_lines(section['text']) or '\n')
+            updated.append({'heading': '', 'text': text, 'index': None, 'number': None})
+    return join_sections(updated)
+
+
+def section_max_tokens(text):
+    """Room for a rewritten section: roughly twice its size (~4 chars per token), within limits."""
+    return min(4000, max(300, len(text) // 2))
+
+
+def _keep_heading(section, revised):
+    # The model sometimes drops the heading; put the original back so the document structure survives
+    if not section['heading']:
+        return revised
+    first_line = next((line.strip() for line in revised.split('\n') if line.strip()), '')
+    if first_line and classify_line(first_line)[0] in (HEADING, TITLE):
+        return revised
+    original_heading_line = next(line for line in section['text'].split('\n') if line.strip())
+    return f"{original_heading_line}\n{revised}"
+
+
+def _trailing_blank_lines(text):
+    stripped = text.rstrip()
+    return '\n' * text[len(stripped):].count('\n')
+
+
+def _strip_fences(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip('\n')
+
+
+def _significant_words(text):
+    return {word.lower().strip("'-") for word in WORD_PATTERN.findall(text)} - STOPWORDS
+
+
+def _to_number(token):
+    token = token.lower()
+    return int(token) if token.isdigit() else ROMAN.get(token)
+
+
+def _heading_number(heading):
+    match = LEADING_NUMBER.match(heading + ' ')
+    return _to_number(match.group(1)) if match else None
@@ -0,0 +1,162 @@
+"""Revision lineage: every version of a session's document and how it was derived.
+
+The base document and each revision are versions in a tree. A revision
+records its parent (the previous revision, or the base document) and stores
+only a compressed line delta against it, so disk use per revision is about
+the size of the edit. Every ``SNAPSHOT_INTERVAL`` generations a full
+compressed snapshot is stored to keep rebuilds short.
+"""
+import difflib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from db import SQLiteDatabase
+
+FULL = 'full'
+DELTA = 'delta'
+SNAPSHOT_INTERVAL = 8
+
+
+def base_version_id(session_id):
+    return f"base-{session_id}"
+
+
+def make_delta(old_text, new_text):
+    """Encode new_text as [start, end, replacement_lines] edits over old_text's lines."""
+    old_lines = old_text.split('\n')
+    new_lines = new_text.split('\n')
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [[i1, i2, new_lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_delta(old_text, delta):
+    lines = old_text.split('\n')
+    # Apply from the end so earlier indexes stay valid
+    for start, end, replacement in reversed(delta):
+        lines[start:end] = replacement
+    return '\n'.join(lines)
+
+
+class RevisionLineage:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS versions (
+        version_id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        parent_id TEXT,
+        depth INTEGER NOT NULL,
+        storage TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        metadata TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_versions_session ON versions (session_id, created_at);
+    """
+
+    def __init__(self, path, cache_size=64):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.cache_size = cache_size
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure_base(self, session_id, text, metadata=None):
+        """Record the base document for a session if it isn't already."""
+        version_id = base_version_id(session_id)
+        if self.get(version_id) is None:
+            self._insert(version_id, session_id, None, 0, FULL, text, metadata)
+        return version_id
+
+    def add_revision(self, version_id, session_id, parent_id, text, metadata=None):
+        """Store a revision as a delta against its parent (or as a snapshot every few generations)."""
+        parent = self.get(parent_id)
+        if parent is None:
+            raise KeyError(f"Unknown parent version {parent_id}")
+        depth = parent['depth'] + 1
+        if depth % SNAPSHOT_INTERVAL == 0:
+            self._insert(version_id, session_id, parent_id, depth, FULL, text, metadata)
+        else:
+            delta = make_delta(self.text(parent_id), text)
+            self._insert(version_id, session_id, parent_id, depth, DELTA, delta, metadata)
+        self._remember(version_id, text)
+        return version_id
+
+    def update_metadata(self, version_id, **metadata):
+        with self.db.transaction() as conn:
+            row = conn.execute("SELECT metadata FROM versions WHERE version_id = ?", (version_id,)).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row['metadata'])
+            merged.update(metadata)
+            conn.execute("UPDATE versions SET metadata = ? WHERE version_id = ?", (json.dumps(merged), version_id))
+
+    def get(self, version_id):
+        """Return a version's lineage info (without its text), or None."""
+        row = self.db.execute(
+            "SELECT version_id, session_id, parent_id, depth, storage, size, metadata, created_at "
+            "FROM versions WHERE version_id = ?",
+            (version_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        version = dict(row)
+        version['metadata'] = json.loads(row['metadata'])
+        return version
+
+    def latest(self, session_id):
+        """Return the most recent version for a session (revisions build on it), or None."""
+        row = self.db.execute(
+            "SELECT version_id FROM versions WHERE session_id = ? ORDER BY depth DESC, created_at DESC LIMIT 1",
+            (session_id,)
+        ).fetchone()
+        return self.get(row['version_id']) if row else None
+
+    def text(self, version_id):
+        """Rebuild a version's text from the nearest snapshot and the deltas after it."""
+        with self._lock:
+            if version_id in self._texts:
+                self._texts.move_to_end(version_id)
+                return self._texts[version_id]
+
+        chain = []
+        current = version_id
+        while True:
+            with self._lock:
+                cached = self._texts.get(current)
+            if cached is not None:
+                text = cached
+                break
+            row = self.db.execute(
+                "SELECT parent_id, storage, payload FROM versions WHERE version_id = ?", (current,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown version {current}")
+            payload = json.loads(zlib.decompress(row['payload']))
+            if row['storage'] == FULL:
+                text = payload
+                break
+            chain.append(payload)
+            current = row['parent_id']
+
+        for delta in reversed(chain):
+            text = apply_delta(text, delta)
+        self._remember(version_id, text)
+        return text
+
+    def _insert(self, version_id, session_id, parent_id, depth, storage, content, metadata):
+        payload = zlib.compress(json.dumps(content).encode('utf-8'), 9)
+        self.db.execute(
+            "INSERT OR IGNORE INTO versions (version_id, session_id, parent_id, depth, storage, payload, size, "
+            "metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (version_id, session_id, parent_id, depth, storage, payload, len(payload),
+             json.dumps(metadata or {}), datetime.now().isoformat())
+        )
+
+    def _remember(self, version_id, text):
+        with self._lock:
+            self._texts[version_id] = text
+            self._texts.move_to_end(version_id)
+            while len(self._texts) > self.cache_size:
+                self._texts.popitem(last=False)
@@ -0,0 +1,174 @@
+"""Single-flight coordination so concurrent requests share one expensive computation.
+
+Within a process, callers asking for the same key while a computation is in
+flight wait for it and receive the same result (or exception). Across gunicorn
+workers, the leader holds an exclusive lock file for the key; callers in other
+processes block on it and then run their function, which is expected to find
+the result the leader persisted (e.g. in the document store) and return early.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: in-process coordination only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_folder, timeout=300, poll_interval=0.05):
+        self.lock_folder = lock_folder
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._mutex = threading.Lock()
+        self._calls = {}
+        self._locks = {}
+        os.makedirs(lock_folder, exist_ok=True)
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers with the same key."""
+        with self._mutex:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self.lock(key):
+                call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._mutex:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    @contextmanager
+    def lock(self, key):
+        """Hold an exclusive lock for a key across threads and processes."""
+        with self._mutex:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                with self._file_lock(key):
+                    yield
+        finally:
+            with self._mutex:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    @asynccontextmanager
+    async def async_lock(self, key):
+        """``lock`` for coroutines: waits by polling with asyncio.sleep, never in a thread.
+
+        Waiting ties up no executor thread and releasing needs none, so any number
+        of tasks can wait for a key without starving other ``to_thread`` work.
+        """
+        with self._mutex:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            while not entry[0].acquire(blocking=False):
+                await asyncio.sleep(self.poll_interval)
+            try:
+                lock_file = None
+                if fcntl is not None:
+                    path = self._lock_path(key)
+                    deadline = time.monotonic() + self.timeout
+                    lock_file = self._try_file_lock(path)
+                    while lock_file is None and time.monotonic() < deadline:
+                        await asyncio.sleep(self.poll_interval)
+                        lock_file = self._try_file_lock(path)
+                    if lock_file is None:
+                        logger.warning(f"Timed out waiting for single-flight lock on {key}, proceeding without it")
+                try:
+                    yield
+                finally:
+                    if lock_file is not None:
+                        self._release_file_lock(path, lock_file)
+            finally:
+                entry[0].release()
+        finally:
+            with self._mutex:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    @contextmanager
+    def _file_lock(self, key):
+        if fcntl is None:
+            yield
+            return
+
+        path = self._lock_path(key)
+        deadline = time.monotonic() + self.timeout
+        lock_file = self._try_file_lock(path)
+        while lock_file is None:
+            if time.monotonic() >= deadline:
+                # A stuck holder must not block the request forever
+                logger.warning(f"Timed out waiting for single-flight lock on {key}, proceeding without it")
+                break
+            time.sleep(self.poll_interval)
+            lock_file = self._try_file_lock(path)
+        try:
+            yield
+        finally:
+            if lock_file is not None:
+                self._release_file_lock(path, lock_file)
+
+    def _lock_path(self, key):
+        return os.path.join(self.lock_folder, hashlib.sha1(key.encode()).hexdigest() + ".lock")
+
+    @staticmethod
+    def _try_file_lock(path):
+        """Lock the key's file without blocking; returns the open file, or None if another process holds it."""
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            # The previous holder unlinks the file on release; if it did so after we opened
+            # it, we locked a file nobody else will see, so start over with the current one
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @staticmethod
+    def _release_file_lock(path, lock_file):
+        # Unlink while still holding the lock so lock files don't pile up, one per key ever used
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
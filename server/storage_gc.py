@@ -0,0 +1,267 @@
+"""Retention and size quotas for the rendered-file folders.
+
+DOWNLOAD_FOLDER and REVISIONS_FOLDER gain a PDF/DOCX for every generation and
+revision. ``StorageCollector`` keeps each folder within a maximum age and
+total size:
+
+1. files not accessed for longer than the folder's ``max_age`` are deleted;
+2. if the folder is still over ``max_bytes``, the least recently accessed
+   files are deleted until it fits.
+
+Last access is the file's mtime: the app touches a rendered file whenever it
+reuses or serves it, since atime isn't kept on noatime mounts. Files named by
+sessions or revisions active within ``protect_seconds`` are never deleted, and
+neither are files younger than ``min_age`` (a render may not have recorded its
+filename yet). An evicted PDF/DOCX is rendered again from the stored text the
+next time it is requested. Legacy feedback_*.json and revision_info_*.json
+files are never collected: for revisions older than the lineage store they
+hold the only copy of the revised text.
+
+Every gunicorn worker runs a collector thread, but a run only proceeds while
+holding an exclusive, non-blocking lock file, so one process collects and the
+others skip the round. Run once from the command line with:
+
+    python storage_gc.py [--dry-run]
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: in-process coordination only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Files the collector manages; anything else in the folders (e.g. legacy revision JSON) is left alone
+DEFAULT_PATTERNS = ('*.pdf', '*.docx', '*.partial')
+
+AGE = 'age'
+QUOTA = 'quota'
+
+
+class FolderQuota:
+    def __init__(self, name, folder, max_age=None, max_bytes=None, patterns=DEFAULT_PATTERNS):
+        """
+        name: label used in reports and metrics (e.g. ``downloads``)
+        max_age: seconds since last access after which a file is deleted (None: no limit)
+        max_bytes: total size of the managed files to stay under (None: no limit)
+        """
+        self.name = name
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.patterns = tuple(patterns)
+
+    def matches(self, filename):
+        return any(fnmatch.fnmatch(filename, pattern) for pattern in self.patterns)
+
+
+def touch(folder, filename):
+    """Record an access to a managed file so LRU eviction keeps it (no-op if it is gone)."""
+    try:
+        os.utime(os.path.join(folder, filename))
+    except OSError:
+        pass
+
+
+class StorageCollector:
+    def __init__(self, quotas, lock_path, protected=None, protect_seconds=7 * 86400, min_age=600,
+                 interval=3600, dry_run=False, on_report=None):
+        """
+        protected: callable taking a datetime and returning the filenames referenced by
+                   sessions/revisions active since then
+        min_age: seconds a new file is left alone, whatever the quotas say
+        interval: seconds between runs of the background thread
+        dry_run: report what would be deleted without deleting anything
+        on_report: called with each run's report (used to export metrics)
+        """
+        self.quotas = list(quotas)
+        self.lock_path = lock_path
+        self.protected = protected
+        self.protect_seconds = protect_seconds
+        self.min_age = min_age
+        self.interval = interval
+        self.dry_run = dry_run
+        self.on_report = on_report
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._last_report = None
+        self._counts = {'runs': 0, 'skipped_locked': 0, 'errors': 0, 'deleted_files': 0, 'deleted_bytes': 0}
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='storage-gc', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        # Workers start together; stagger their first run so they don't all queue for the lock
+        if self._stopping.wait(min(self.interval, 60) * (os.getpid() % 10) / 10):
+            return
+        while not self._stopping.is_set():
+            try:
+                self.collect()
+            except Exception as e:
+                self._counts['errors'] += 1
+                logger.error(f"Storage collection failed: {str(e)}")
+            self._stopping.wait(self.interval)
+
+    def collect(self, dry_run=None):
+        """Run one collection and return its report, or None if another process is collecting."""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        with self._exclusive() as acquired:
+            if not acquired:
+                self._counts['skipped_locked'] += 1
+                return None
+            started = time.monotonic()
+            now = time.time()
+            protected = self._protected_filenames(now)
+            report = {
+                'started_at': datetime.fromtimestamp(now).isoformat(),
+                'dry_run': dry_run,
+                'protected_filenames': len(protected),
+                'folders': {quota.name: self._collect_folder(quota, protected, now, dry_run)
+                            for quota in self.quotas}
+            }
+            report['duration_seconds'] = round(time.monotonic() - started, 3)
+
+        self._counts['runs'] += 1
+        if not dry_run:
+            for folder in report['folders'].values():
+                self._counts['deleted_files'] += folder['deleted_files']
+                self._counts['deleted_bytes'] += folder['deleted_bytes']
+        self._last_report = report
+        if self.on_report:
+            self.on_report(report)
+        return report
+
+    def stats(self):
+        stats = dict(self._counts, dry_run=self.dry_run, interval=self.interval)
+        if self._last_report is not None:
+            stats['last_run'] = {
+                'started_at': self._last_report['started_at'],
+                'dry_run': self._last_report['dry_run'],
+                'folders': {name: {key: value for key, value in folder.items() if key != 'deleted'}
+                            for name, folder in self._last_report['folders'].items()}
+            }
+        return stats
+
+    def _protected_filenames(self, now):
+        if self.protected is None:
+            return set()
+        return set(self.protected(datetime.fromtimestamp(now - self.protect_seconds)))
+
+    def _collect_folder(self, quota, protected, now, dry_run):
+        files = []
+        for entry in os.scandir(quota.folder) if os.path.isdir(quota.folder) else ():
+            if not entry.is_file(follow_symlinks=False) or not quota.matches(entry.name):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+
+        total_bytes = sum(size for _, _, size in files)
+        result = {
+            'files': len(files),
+            'bytes': total_bytes,
+            'protected_files': 0,
+            'deleted_files': 0,
+            'deleted_bytes': 0,
+            'deleted': []
+        }
+        # Oldest access first, so quota eviction removes the least recently used files
+        for accessed, filename, size in files:
+            if filename in protected:
+                result['protected_files'] += 1
+                continue
+            age = now - accessed
+            if age < self.min_age:
+                continue
+            if quota.max_age is not None and age > quota.max_age:
+                reason = AGE
+            elif quota.max_bytes is not None and total_bytes > quota.max_bytes:
+                reason = QUOTA
+            else:
+                continue
+            if not dry_run and not self._delete(quota.folder, filename, accessed):
+                continue
+            total_bytes -= size
+            result['deleted_files'] += 1
+            result['deleted_bytes'] += size
+            result['deleted'].append({'filename': filename, 'bytes': size, 'reason': reason,
+                                      'last_access': datetime.fromtimestamp(accessed).isoformat()})
+
+        result['remaining_files'] = result['files'] - result['deleted_files']
+        result['remaining_bytes'] = total_bytes
+        return result
+
+    @staticmethod
+    def _delete(folder, filename, accessed):
+        """Delete a file unless it was accessed since the scan; returns whether it was deleted."""
+        path = os.path.join(folder, filename)
+        try:
+            if os.stat(path).st_mtime > accessed:
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Failed to delete {path}: {str(e)}")
+            return False
+        logger.info(f"Storage GC deleted {path}")
+        return True
+
+    @contextmanager
+    def _exclusive(self):
+        """Yield whether this process holds the collection lock (non-blocking)."""
+        if not self._lock.acquire(blocking=False):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply the storage quotas to the rendered-file folders once")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be deleted without deleting")
+    args = parser.parse_args()
+
+    # Only the configured collector and stores are needed: no job workers, render processes or GC thread
+    os.environ["JOB_WORKERS"] = "0"
+    os.environ["RENDER_WORKERS"] = "0"
+    os.environ["STORAGE_GC_INTERVAL"] = "0"
+    from app import storage_collector
+
+    report = storage_collector.collect(dry_run=args.dry_run)
+    if report is None:
+        print("Another process is collecting; try again later")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,151 @@
+"""Cache for Stripe checkout sessions used by the session-based endpoints.
+
+Paid checkout sessions don't change, so once retrieved their metadata is kept
+in a bounded per-process LRU and, optionally, in a SQLite file shared by all
+gunicorn workers. Unknown session ids are cached briefly as misses so retries
+and polling don't hammer the Stripe API. Sessions that aren't paid yet are
+always fetched live.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from db import SQLiteDatabase
+
+
+class CheckoutSession:
+    """The parts of a Stripe checkout session the endpoints rely on."""
+
+    def __init__(self, id, payment_status, status, metadata):
+        self.id = id
+        self.payment_status = payment_status
+        self.status = status
+        self.metadata = metadata
+
+    @classmethod
+    def from_stripe(cls, session):
+        return cls(session.id, session.payment_status, session.status, dict(session.metadata or {}))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'payment_status': self.payment_status,
+            'status': self.status,
+            'metadata': self.metadata
+        }
+
+
+class SessionCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checkout_sessions (
+        session_id TEXT PRIMARY KEY,
+        data TEXT,
+        error TEXT,
+        expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, fetch, not_found_errors=(), make_not_found=None, maxsize=1024, ttl=3600,
+                 negative_ttl=30, shared_path=None, on_count=None):
+        """
+        fetch: callable returning a Stripe checkout session for an id
+        not_found_errors: exception types meaning the session doesn't exist (negatively cached)
+        make_not_found: builds the exception re-raised for a cached miss from its message
+        shared_path: optional SQLite file shared across worker processes
+        on_count: optional callback(counter name) for exporting the counters
+        """
+        self.fetch = fetch
+        self.not_found_errors = tuple(not_found_errors)
+        self.make_not_found = make_not_found or LookupError
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared = SQLiteDatabase(shared_path, self.SCHEMA) if shared_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'shared_hits': 0, 'negative_hits': 0, 'misses': 0, 'uncacheable': 0}
+        self.on_count = on_count
+
+    def get(self, session_id):
+        now = time.time()
+        entry = self._get_local(session_id, now)
+        if entry is None and self.shared is not None:
+            entry = self._get_shared(session_id, now)
+            if entry is not None:
+                self._count('shared_hits')
+                self._set_local(session_id, entry)
+        elif entry is not None:
+            self._count('hits')
+
+        if entry is not None:
+            session, error, _ = entry
+            if error is not None:
+                self._count('negative_hits')
+                raise self.make_not_found(error)
+            return session
+
+        self._count('misses')
+        try:
+            session = CheckoutSession.from_stripe(self.fetch(session_id))
+        except self.not_found_errors as e:
+            self._store(session_id, (None, str(e), now + self.negative_ttl))
+            raise
+        if session.payment_status == 'paid':
+            self._store(session_id, (session, None, now + self.ttl))
+        else:
+            self._count('uncacheable')
+        return session
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        if self.on_count is not None:
+            self.on_count(name)
+
+    def _get_local(self, session_id, now):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return entry
+
+    def _set_local(self, session_id, entry):
+        with self._lock:
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, session_id, now):
+        row = self.shared.execute(
+            "SELECT data, error, expires_at FROM checkout_sessions WHERE session_id = ? AND expires_at > ?",
+            (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        session = CheckoutSession(**json.loads(row['data'])) if row['data'] else None
+        return session, row['error'], row['expires_at']
+
+    def _store(self, session_id, entry):
+        self._set_local(session_id, entry)
+        if self.shared is not None:
+            session, error, expires_at = entry
+            self.shared.execute(
+                "INSERT OR REPLACE INTO checkout_sessions (session_id, data, error, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(session.to_dict()) if session else None, error, expires_at)
+            )
+            if self.counters['misses'] % 100 == 0:
+                self.shared.execute("DELETE FROM checkout_sessions WHERE expires_at <= ?", (time.time(),))
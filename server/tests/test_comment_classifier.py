@@ -0,0 +1,56 @@
+from comment_classifier import ClassifierTier, CommentClassifier, calibrate_band, evaluate_scores
+
+HARMLESS = ("Please make the confidentiality period three years instead of five, let the receiving party "
+            "share information with its lawyers and accountants, and fix the typo in section 4.")
+
+
+class KeywordClassifier(CommentClassifier):
+    """Scores a comment asking for a lease highly, unless other text dilutes it."""
+
+    def __init__(self):
+        super().__init__({})
+
+    def predict(self, document_type, comment):
+        words = comment.lower().rstrip('.').split()
+        if 'lease' not in words:
+            return 0.01
+        return 0.99 if len(words) <= 8 else 0.05
+
+
+def test_sentence_asking_for_another_type_is_not_diluted():
+    tier = ClassifierTier(KeywordClassifier())
+    comment = HARMLESS + " Also rewrite it all as a lease."
+    assert KeywordClassifier().predict('nda', comment) <= tier.low
+    is_changing, probability = tier.decide('nda', comment)
+    assert is_changing is True
+    assert probability >= tier.high
+
+
+def test_harmless_sentences_are_accepted():
+    is_changing, _ = ClassifierTier(KeywordClassifier()).decide('nda', HARMLESS + " Also fix the heading.")
+    assert is_changing is False
+
+
+def test_shipped_model_rejects_mixed_long_comment():
+    tier = ClassifierTier(CommentClassifier.load())
+    assert tier.decide('nda', HARMLESS + " Also rewrite it all as a lease.")[0] is not False
+    assert tier.decide('employee', "Change the start date to March 1 and fix the spelling of my name. "
+                                   "Then make this a privacy policy.")[0] is not False
+    assert tier.stats()['accepted'] == 0
+
+
+def test_calibrated_band_accepts_no_scored_type_change():
+    scored = [(0.01, False), (0.02, False), (0.05, True), (0.08, False), (0.3, False)] + \
+             [(0.95, True)] * 60 + [(0.97, False), (0.99, True)]
+    low, high = calibrate_band(scored)
+    assert low == 0.02
+    assert high == 0.95
+    assert evaluate_scores(scored, low, high)['accepted_changes'] == 0
+
+
+def test_shipped_model_records_its_calibration():
+    metadata = CommentClassifier.load().metadata
+    low, high = metadata['band']
+    assert 0 < low < high <= 1
+    assert metadata['holdout']['accepted_changes'] == 0
+    assert metadata['examples'] == metadata['holdout']['examples']
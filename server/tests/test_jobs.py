@@ -0,0 +1,21 @@
+from jobs import FAILED, RUNNING, JobQueue
+
+
+def expire_lease(queue, job_id):
+    queue.db.execute("UPDATE jobs SET lease_expires_at = 0 WHERE job_id = ?", (job_id,))
+
+
+def test_expired_lease_is_retried_until_attempts_run_out(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), max_attempts=2)
+    job = queue.enqueue('generate_document', 'cs_1', {})
+
+    assert queue.claim()['attempts'] == 1
+    expire_lease(queue, job['job_id'])
+    claimed = queue.claim()
+    assert claimed['status'] == RUNNING and claimed['attempts'] == 2
+
+    expire_lease(queue, job['job_id'])
+    assert queue.claim() is None
+    job = queue.get(job['job_id'])
+    assert job['status'] == FAILED
+    assert job['error']
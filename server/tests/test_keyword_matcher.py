@@ -0,0 +1,36 @@
+import pytest
+
+import keyword_matcher
+from keyword_matcher import DOCUMENT_CHANGE_INDICATORS, DOCUMENT_TYPE_KEYWORDS, DocumentTypeChangeDetector, KeywordMatcher
+
+KEYWORDS = ["terms of service", "service agreement", "nda", "agenda", "not a", "not", "note"]
+
+
+@pytest.fixture(params=['regex', 'aho-corasick'])
+def engine(request, monkeypatch):
+    if request.param == 'regex':
+        monkeypatch.setattr(keyword_matcher, 'ahocorasick', None)
+    elif keyword_matcher.ahocorasick is None:
+        pytest.skip("pyahocorasick is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize('text', [
+    "the terms of service agreement",
+    "an agenda, not a note",
+    "notes",
+    "nothing to see",
+    "",
+])
+def test_finds_every_overlapping_keyword(engine, text):
+    matcher = KeywordMatcher(KEYWORDS)
+    assert matcher.engine == engine
+    assert matcher.find_all(text) == {keyword for keyword in KEYWORDS if keyword in text}
+
+
+def test_precedence_follows_table_order(engine):
+    detector = DocumentTypeChangeDetector(DOCUMENT_TYPE_KEYWORDS, DOCUMENT_CHANGE_INDICATORS)
+    # Indicators rank after document keywords, and the original type's own keywords are ignored
+    assert detector.detect('nda', "Switch to a joint venture NDA")[:2] == (True, 'partnership')
+    assert detector.detect('terms', "please switch to the terms of service")[:2] == (True, 'unknown')
+    assert detector.detect('nda', "Extend the term to three years") == (False, "", "")
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from llm import CompletionResult, LLMClient
+
+
+class FakeCompletions:
+    def __init__(self, response):
+        self.response = response
+
+    def create(self, **request):
+        return self.response
+
+
+class FakeOpenAI:
+    def __init__(self, response):
+        self.chat = SimpleNamespace(completions=FakeCompletions(response))
+
+    def with_options(self, **options):
+        return self
+
+
+def chunk(content=None, finish_reason=None, usage=None):
+    choices = [] if content is None and finish_reason is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream(list):
+    def close(self):
+        pass
+
+
+def test_complete_reports_finish_reason_and_usage():
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="text"), finish_reason='length')],
+        usage=SimpleNamespace(completion_tokens=500)
+    )
+    result = CompletionResult()
+    assert LLMClient(FakeOpenAI(response)).complete('gpt-4', [], 500, 0.2, result=result) == "text"
+    assert (result.finish_reason, result.completion_tokens) == ('length', 500)
+
+
+def test_stream_reports_finish_reason_and_usage_when_done():
+    stream = FakeStream([chunk("Hello "), chunk("world"), chunk(finish_reason='stop'),
+                         chunk(usage=SimpleNamespace(completion_tokens=2))])
+    result = CompletionResult()
+    deltas = LLMClient(FakeOpenAI(stream)).stream('gpt-4', [], 100, 0.2, result=result)
+    assert ''.join(deltas) == "Hello world"
+    assert (result.finish_reason, result.completion_tokens) == ('stop', 2)
@@ -0,0 +1,20 @@
+from document_ir import BODY, HEADING
+from renderers import create_pdf, pdf_styles
+
+
+def test_changing_a_style_only_affects_the_callers_copy():
+    styles = pdf_styles('Non-Disclosure Agreement (NDA)')
+    styles[BODY].fontSize = 30
+    styles[HEADING].textColor = None
+
+    fresh = pdf_styles('Non-Disclosure Agreement (NDA)')
+    assert fresh[BODY].fontSize == 11
+    assert fresh[HEADING].textColor is not None
+
+
+def test_renders_a_document_split_across_pages(tmp_path):
+    text = "1. TERMS\n" + "The Receiving Party shall keep the information confidential. " * 600
+    filepath = tmp_path / 'document.pdf'
+    create_pdf(text, str(filepath), 'Acme Ltd', 'Non-Disclosure Agreement (NDA)')
+    assert filepath.stat().st_size > 0
+    assert pdf_styles()[BODY].firstLineIndent == 20
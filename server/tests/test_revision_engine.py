@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from revision_engine import RevisionEngine, find_target_sections, split_sections
+
+DOCUMENT = """NON-DISCLOSURE AGREEMENT
+
+1. DEFINITIONS
+Confidential information means any information.
+
+2. TERMINATION
+Either party may terminate with 30 days notice.
+
+3. GOVERNING LAW
+This agreement is governed by the laws of England.
+"""
+TWO_TOPICS = "Make the termination notice 60 days and use governing law of Texas"
+
+
+def test_single_topic_is_matched_locally():
+    sections = split_sections(DOCUMENT)
+    assert find_target_sections(sections, "Make the termination notice 60 days") == [2]
+    assert find_target_sections(sections, "Change section 3 to the laws of Texas") == [3]
+
+
+def test_comment_covering_two_sections_is_not_narrowed_locally():
+    sections = split_sections(DOCUMENT)
+    assert find_target_sections(sections, TWO_TOPICS) is None
+    # A heading named besides the referenced section is ambiguous too
+    assert find_target_sections(sections, "In section 2 use 60 days, and change the governing law") is None
+
+
+def test_comment_covering_two_sections_revises_both():
+    def complete(messages, max_tokens, temperature):
+        prompt = messages[-1]['content']
+        if 'Return ONLY a JSON object' in prompt:
+            return json.dumps({'sections': [2, 3], 'insert_after': None})
+        section = prompt.split('Section to revise:\n```\n', 1)[1].split('\n```', 1)[0]
+        return section.replace('30 days', '60 days').replace('England', 'Texas')
+
+    revision = RevisionEngine(complete).revise(DOCUMENT, TWO_TOPICS, "NDA")
+    assert revision['mode'] == 'sections'
+    assert revision['sections'] == [2, 3]
+    assert '60 days notice' in revision['text']
+    assert 'laws of Texas' in revision['text']
+
+
+def test_async_revision_matches_sync_revision():
+    def complete(messages, max_tokens, temperature):
+        prompt = messages[-1]['content']
+        if 'Return ONLY a JSON object' in prompt:
+            return json.dumps({'sections': [2, 3], 'insert_after': 1})
+        if 'needs a new section' in prompt:
+            return "2A. NON-SOLICITATION\nNeither party may solicit the other's employees."
+        section = prompt.split('Section to revise:\n```\n', 1)[1].split('\n```', 1)[0]
+        return section.replace('30 days', '60 days').replace('England', 'Texas')
+
+    async def complete_async(messages, max_tokens, temperature):
+        return complete(messages, max_tokens, temperature)
+
+    engine = RevisionEngine(complete)
+    expected = engine.revise(DOCUMENT, TWO_TOPICS, "NDA")
+    assert asyncio.run(engine.revise_async(complete_async, DOCUMENT, TWO_TOPICS, "NDA")) == expected
+    assert 'NON-SOLICITATION' in expected['text']
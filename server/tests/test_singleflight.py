@@ -0,0 +1,92 @@
+import os
+import threading
+
+from singleflight import SingleFlight
+
+
+def test_lock_files_are_removed_on_release(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    for index in range(5):
+        with flight.lock(f"document:cs_{index}"):
+            assert len(os.listdir(tmp_path)) == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_lock_stays_exclusive_while_files_are_unlinked(tmp_path):
+    # Separate instances stand in for separate worker processes (no shared in-process lock)
+    flights = [SingleFlight(str(tmp_path), poll_interval=0.001) for _ in range(4)]
+    inside = []
+    overlaps = []
+
+    def worker(flight):
+        for _ in range(50):
+            with flight.lock("document:cs_1"):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                inside.pop()
+
+    threads = [threading.Thread(target=worker, args=(flight,)) for flight in flights]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_async_lock_contention_does_not_starve_the_executor(tmp_path):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    flight = SingleFlight(str(tmp_path), poll_interval=0.005)
+    order = []
+
+    async def task(name, key):
+        async with flight.async_lock(key):
+            order.append(f"{name}:in")
+            # Work done while holding the lock needs an executor thread, as the document stream's SQLite calls do
+            await asyncio.to_thread(threading.Event().wait, 0.05)
+            order.append(f"{name}:out")
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        await asyncio.wait_for(asyncio.gather(
+            task('t0', 'document:cs_1'), task('t1', 'document:cs_1'), task('t2', 'document:cs_1'),
+            task('other', 'document:cs_2')
+        ), timeout=5)
+
+    asyncio.run(main())
+    same_key = [event for event in order if not event.startswith('other')]
+    # Holders of the same key never overlap
+    assert all(same_key[i].split(':')[0] == same_key[i + 1].split(':')[0] for i in range(0, len(same_key), 2))
+    assert len(order) == 8
+    assert os.listdir(tmp_path) == []
+
+
+def test_async_lock_waits_for_a_thread_holding_the_key(tmp_path):
+    import asyncio
+
+    flight = SingleFlight(str(tmp_path), poll_interval=0.005)
+    held = threading.Event()
+    release = threading.Event()
+    events = []
+
+    def hold():
+        with flight.lock("document:cs_1"):
+            held.set()
+            release.wait(5)
+            events.append('thread:out')
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+
+    async def main():
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        async with flight.async_lock("document:cs_1"):
+            events.append('task:in')
+
+    asyncio.run(main())
+    thread.join()
+    assert events == ['thread:out', 'task:in']
@@ -0,0 +1,20 @@
+import os
+import time
+
+from storage_gc import FolderQuota, StorageCollector
+
+
+def test_legacy_revision_files_are_never_collected(tmp_path):
+    folder = tmp_path / 'revisions'
+    folder.mkdir()
+    old = time.time() - 365 * 86400
+    for name in ('revised_abc.pdf', 'revision_info_abc.json', 'feedback_abc.json'):
+        (folder / name).write_text('x')
+        os.utime(folder / name, (old, old))
+
+    collector = StorageCollector([FolderQuota('revisions', str(folder), max_age=90 * 86400)],
+                                 lock_path=str(tmp_path / 'locks' / 'gc.lock'))
+    report = collector.collect()
+
+    assert [item['filename'] for item in report['folders']['revisions']['deleted']] == ['revised_abc.pdf']
+    assert sorted(os.listdir(folder)) == ['feedback_abc.json', 'revision_info_abc.json']
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import token_budget
+from token_budget import CHARS_PER_TOKEN, TokenCounter
+
+
+class SlowEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+class SlowTiktoken:
+    """Stands in for tiktoken downloading its encoding file."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def encoding_for_model(self, model):
+        self.release.wait(5)
+        return SlowEncoding()
+
+
+def test_counts_are_estimated_while_the_encoding_loads(monkeypatch):
+    slow = SlowTiktoken()
+    monkeypatch.setattr(token_budget, 'tiktoken', slow)
+    counter = TokenCounter()
+    text = "one two three four five six"
+
+    started = time.monotonic()
+    assert counter.count(text, 'gpt-4') == int(len(text) / CHARS_PER_TOKEN) + 1
+    assert time.monotonic() - started < 1
+    assert not counter.ready()
+
+    slow.release.set()
+    deadline = time.monotonic() + 5
+    while counter.encoding('gpt-4') is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert counter.count(text, 'gpt-4') == 6
+    assert counter.ready()
+
+
+def test_observe_uses_the_reported_usage(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_budget, 'tiktoken', None)
+    budget = token_budget.TokenBudget(str(tmp_path / 'budget.db'), min_samples=1)
+    text = "word " * 10
+
+    assert budget.observe('preview', 'nda', 'gpt-4', text, 500, completion_tokens=480, finish_reason='stop') == 480
+    assert budget._observed_tokens('preview', 'nda', 'gpt-4') == (480, False)
+
+    # An estimate this far below max_tokens alone would never look truncated
+    budget.observe('validation', 'nda', 'gpt-4', text, 500, completion_tokens=12, finish_reason='length')
+    assert budget._observed_tokens('validation', 'nda', 'gpt-4')[1] is True
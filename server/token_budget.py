@@ -0,0 +1,288 @@
+"""Token budgets for LLM requests.
+
+Instead of a fixed ``max_tokens`` per call, each request is sized from its
+prompt and from what similar requests actually produced:
+
+- prompt tokens are counted locally (tiktoken when installed, otherwise a
+  characters-per-token estimate that errs on the high side). tiktoken may
+  download its encoding on first use, so encodings load in a background
+  thread at startup and the estimate is used until they are ready;
+- ``max_tokens`` is a high percentile of the output lengths observed for the
+  same kind of request and document type, plus headroom, falling back to the
+  kind's default until enough outputs have been seen, and always capped to
+  the model's output limit and what is left of its context window;
+- free-text inputs are trimmed (keeping their beginning and end) before they
+  can push a prompt out of the context window.
+
+Observed output lengths are kept in a SQLite file shared by all workers,
+using the API's ``usage.completion_tokens`` when it is reported. An output the
+API cut off (``finish_reason == 'length'``, or without one, an output that
+reached its ``max_tokens``) gives the key the model's full output limit.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from db import SQLiteDatabase
+
+try:
+    import tiktoken
+except ImportError:  # The estimate below is used instead
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# (context window, maximum output tokens) per model
+MODEL_LIMITS = {
+    'gpt-4': (8192, 4096),
+    'gpt-3.5-turbo': (16385, 4096),
+}
+DEFAULT_LIMITS = (8192, 4096)
+# Tokens the chat format adds per message and per reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# Conservative estimate when tiktoken isn't available; legal English averages ~4 characters per token
+CHARS_PER_TOKEN = 3.5
+TRIM_MARKER = "\n[... {omitted} tokens omitted ...]\n"
+
+# Where a budget came from
+OBSERVED = 'observed'
+DEFAULT = 'default'
+TRUNCATED = 'truncated'
+
+
+class TokenCounter:
+    """Counts tokens with the model's tiktoken encoding, or estimates them from the text length."""
+
+    def __init__(self, models=tuple(MODEL_LIMITS)):
+        """models: encodings to start loading right away"""
+        self._encodings = {}
+        self._loading = set()
+        self._lock = threading.Lock()
+        for model in models:
+            self.load(model)
+
+    def load(self, model):
+        """Load the model's encoding in a background thread; tiktoken may have to download it."""
+        if tiktoken is None:
+            return
+        with self._lock:
+            if model in self._encodings or model in self._loading:
+                return
+            self._loading.add(model)
+        threading.Thread(target=self._load, args=(model,), name=f'tiktoken-{model}', daemon=True).start()
+
+    def _load(self, model):
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except Exception as e:  # Unknown model, or the encoding file can't be downloaded
+            logger.error(f"Estimating tokens for {model}, tiktoken unavailable: {str(e)}")
+            encoding = None
+        with self._lock:
+            self._encodings[model] = encoding
+            self._loading.discard(model)
+
+    def encoding(self, model):
+        """The model's encoding, or None (use the estimate) while it is loading or if it can't be loaded."""
+        if tiktoken is None:
+            return None
+        with self._lock:
+            if model in self._encodings:
+                return self._encodings[model]
+        self.load(model)
+        return None
+
+    def ready(self):
+        with self._lock:
+            return any(encoding is not None for encoding in self._encodings.values())
+
+    def count(self, text, model):
+        return self._count(text, self.encoding(model))
+
+    def count_messages(self, messages, model):
+        encoding = self.encoding(model)
+        return sum(self._count(message['content'], encoding) + MESSAGE_OVERHEAD for message in messages) + REPLY_OVERHEAD
+
+    def trim(self, text, max_tokens, model):
+        """Shorten text to about ``max_tokens``, keeping its beginning and end around an omission marker."""
+        encoding = self.encoding(model)
+        tokens = self._count(text, encoding)
+        if tokens <= max_tokens:
+            return text
+        keep = max(max_tokens - 20, 0)
+        if encoding is not None:
+            ids = encoding.encode(text, disallowed_special=())
+            head, tail = encoding.decode(ids[:keep * 2 // 3]), encoding.decode(ids[len(ids) - keep // 3:])
+        else:
+            chars = int(keep * CHARS_PER_TOKEN)
+            head, tail = text[:chars * 2 // 3], text[len(text) - chars // 3:]
+        return head + TRIM_MARKER.format(omitted=tokens - keep) + tail
+
+    @staticmethod
+    def _count(text, encoding):
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class TokenBudget:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS outputs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        document_type TEXT NOT NULL,
+        model TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        truncated INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_outputs_key ON outputs (kind, document_type, model, id DESC);
+    """
+
+    def __init__(self, path, percentile=0.95, headroom=1.25, min_samples=20, window=200, refresh=300,
+                 on_budget=None):
+        """
+        percentile: share of observed outputs the budget should fit
+        headroom: multiplier applied on top of that percentile
+        min_samples: observed outputs needed before they replace the kind's default
+        window: most recent outputs per key that are considered
+        refresh: seconds a key's observed percentile is reused before it is read again
+        on_budget: optional callback(budget dict) for exporting the chosen budgets
+        """
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.counter = TokenCounter()
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.refresh = refresh
+        self.on_budget = on_budget
+        self._observed = {}
+        self._latest = {}
+        self._sources = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, text, model):
+        return self.counter.count(text, model)
+
+    def trim(self, text, max_tokens, model):
+        return self.counter.trim(text, max_tokens, model)
+
+    def plan(self, kind, document_type, model, messages, default, floor=64):
+        """Choose ``max_tokens`` for a request and return the budget as a dict.
+
+        default: the kind's output size until enough outputs have been observed
+        (kinds that are never observed always use it, capped to the context window)
+        """
+        context_window, max_output = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        prompt_tokens = self.counter.count_messages(messages, model)
+        room = max(context_window - prompt_tokens, 0)
+
+        observed, truncated = self._observed_tokens(kind, document_type or '', model)
+        if truncated:
+            wanted, source = max_output, TRUNCATED
+        elif observed is not None:
+            wanted, source = int(observed * self.headroom), OBSERVED
+        else:
+            wanted, source = default, DEFAULT
+        wanted = min(max(wanted, floor), max_output)
+        # Never below the floor: an estimated prompt size may be too high, so let the API have the final say
+        max_tokens = max(min(wanted, room), min(floor, wanted))
+
+        budget = {
+            'kind': kind,
+            'document_type': document_type or '',
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'max_tokens': max_tokens,
+            'wanted_tokens': wanted,
+            'context_window': context_window,
+            'source': source,
+            'fits': room >= wanted
+        }
+        with self._lock:
+            self._latest[(kind, budget['document_type'])] = budget
+            self._sources[source] += 1
+        if not budget['fits']:
+            logger.warning(f"{kind} prompt of {prompt_tokens} tokens leaves {room} of the {wanted} output tokens wanted")
+        if self.on_budget:
+            self.on_budget(budget)
+        return budget
+
+    def rewrite_tokens(self, text, model):
+        """Output tokens needed to return ``text`` rewritten (e.g. a full document revision)."""
+        return int(self.counter.count(text, model) * self.headroom)
+
+    def fits(self, model, messages, output_tokens):
+        """Whether a request can return ``output_tokens`` within the model's limits."""
+        context_window, max_output = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        return (output_tokens <= max_output
+                and self.counter.count_messages(messages, model) + output_tokens <= context_window)
+
+    def observe(self, kind, document_type, model, text, max_tokens, completion_tokens=None, finish_reason=None):
+        """Record the length of an output produced with ``max_tokens``.
+
+        completion_tokens/finish_reason: what the API reported (``usage.completion_tokens`` and
+        ``'length'`` when the output was cut off); counted and guessed from ``text`` when missing
+        """
+        tokens = completion_tokens if completion_tokens is not None else self.counter.count(text, model)
+        if finish_reason is not None:
+            truncated = finish_reason == 'length'
+        else:
+            truncated = tokens >= max_tokens * 0.98
+        row_id = self.db.execute(
+            "INSERT INTO outputs (kind, document_type, model, tokens, truncated, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, document_type or '', model, tokens, int(truncated), time.time())
+        ).lastrowid
+        if row_id % 1000 == 0:
+            self.prune()
+        if truncated:
+            with self._lock:
+                self._observed.pop((kind, document_type or '', model), None)
+        return tokens
+
+    def prune(self):
+        """Drop outputs older than each key's window."""
+        with self.db.transaction() as conn:
+            keys = conn.execute("SELECT DISTINCT kind, document_type, model FROM outputs").fetchall()
+            for key in keys:
+                conn.execute(
+                    "DELETE FROM outputs WHERE kind = ? AND document_type = ? AND model = ? AND id NOT IN "
+                    "(SELECT id FROM outputs WHERE kind = ? AND document_type = ? AND model = ? ORDER BY id DESC LIMIT ?)",
+                    tuple(key) * 2 + (self.window,)
+                )
+
+    def stats(self):
+        """The latest budget chosen per kind and document type, and how often each source decided."""
+        with self._lock:
+            return {
+                'tokenizer': 'tiktoken' if self.counter.ready() else 'estimate',
+                'sources': dict(self._sources),
+                'latest': {f"{kind}:{document_type}" if document_type else kind: dict(budget)
+                           for (kind, document_type), budget in self._latest.items()}
+            }
+
+    def _observed_tokens(self, kind, document_type, model):
+        """(percentile of recent outputs or None, whether recent outputs were truncated), cached for ``refresh``"""
+        key = (kind, document_type, model)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._observed.get(key)
+        if cached is not None and now - cached[0] < self.refresh:
+            return cached[1], cached[2]
+
+        rows = self.db.execute(
+            "SELECT tokens, truncated FROM outputs WHERE kind = ? AND document_type = ? AND model = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (kind, document_type, model, self.window)
+        ).fetchall()
+        truncated = any(row['truncated'] for row in rows[:self.min_samples])
+        observed = None
+        if len(rows) >= self.min_samples:
+            tokens = sorted(row['tokens'] for row in rows)
+            observed = tokens[min(int(len(tokens) * self.percentile), len(tokens) - 1)]
+        with self._lock:
+            self._observed[key] = (now, observed, truncated)
+        return observed, truncated
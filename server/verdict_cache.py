@@ -0,0 +1,234 @@
+"""Cache for LLM document-type validation verdicts.
+
+The frontend validates a comment and then submits the same comment, and users
+often resubmit a comment with small edits, so each verdict is kept keyed on
+(original document type, normalized comment). Near-duplicate comments are
+found with MinHash signatures over character shingles and LSH banding: a
+cached verdict is reused when the estimated Jaccard similarity reaches the
+threshold. Entries live in a bounded per-process LRU and, optionally, in a
+SQLite file shared by all gunicorn workers and kept across restarts.
+"""
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from db import SQLiteDatabase
+
+SHINGLE_SIZE = 5
+NUM_HASHES = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+# Fixed permutations so signatures are comparable across processes and restarts
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha256(f"a{i}".encode()).digest()[:8], 'big') % (MERSENNE_PRIME - 1) + 1,
+     int.from_bytes(hashlib.sha256(f"b{i}".encode()).digest()[:8], 'big') % MERSENNE_PRIME)
+    for i in range(NUM_HASHES)
+]
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_comment(comment):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _WHITESPACE.sub(' ', _PUNCTUATION.sub(' ', comment.lower())).strip()
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature (NUM_HASHES values) of a normalized comment's shingles."""
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+              for shingle in shingles(text)]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / NUM_HASHES
+
+
+def band_keys(document_type, signature):
+    return [
+        hashlib.blake2b(
+            f"{document_type}|{band}|{signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]}".encode(),
+            digest_size=12
+        ).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+class VerdictCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS verdicts (
+        cache_key TEXT PRIMARY KEY,
+        document_type TEXT NOT NULL,
+        signature BLOB NOT NULL,
+        verdict TEXT NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS verdict_bands (
+        band_key TEXT NOT NULL,
+        cache_key TEXT NOT NULL,
+        PRIMARY KEY (band_key, cache_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_verdicts_last_used ON verdicts (last_used);
+    CREATE INDEX IF NOT EXISTS idx_verdict_bands_key ON verdict_bands (cache_key);
+    """
+
+    def __init__(self, maxsize=2048, threshold=0.9, shared_path=None, shared_maxsize=50000, on_count=None):
+        """
+        threshold: minimum estimated Jaccard similarity for a near-duplicate hit (1.0 = exact only)
+        shared_path: optional SQLite file shared across worker processes and restarts
+        on_count: optional callback(counter name) for exporting the counters
+        """
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.shared = SQLiteDatabase(shared_path, self.SCHEMA) if shared_path else None
+        self.shared_maxsize = shared_maxsize
+        self._entries = OrderedDict()
+        self._bands = {}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'near_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self.on_count = on_count
+
+    def get(self, document_type, comment):
+        """Return the cached verdict for a comment (or a near-duplicate of it), or None."""
+        normalized = normalize_comment(comment)
+        key = self._key(document_type, normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+        if entry is not None:
+            self._counted('hits')
+            return entry[1]
+
+        signature = minhash(normalized)
+        bands = band_keys(document_type, signature)
+        with self._lock:
+            candidates = {candidate for band in bands for candidate in self._bands.get(band, ())}
+            best = self._best_match(signature, ((candidate, self._entries[candidate]) for candidate in candidates))
+            if best is not None:
+                self._entries.move_to_end(best[0])
+                self.counters['near_hits'] += 1
+        if best is not None:
+            self._counted('near_hits')
+            return best[1][1]
+
+        if self.shared is not None:
+            entry = self._get_shared(key, bands, signature)
+            if entry is not None:
+                self._count('shared_hits')
+                self._set_local(*entry, document_type=document_type)
+                return entry[2]
+
+        self._count('misses')
+        return None
+
+    def set(self, document_type, comment, verdict):
+        normalized = normalize_comment(comment)
+        key = self._key(document_type, normalized)
+        signature = minhash(normalized)
+        self._set_local(key, signature, verdict, document_type=document_type)
+        if self.shared is not None:
+            with self.shared.transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO verdicts (cache_key, document_type, signature, verdict, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, document_type, struct.pack(f'>{NUM_HASHES}Q', *signature), json.dumps(verdict), time.time())
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO verdict_bands (band_key, cache_key) VALUES (?, ?)",
+                    [(band, key) for band in band_keys(document_type, signature)]
+                )
+                count = conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+                if count > self.shared_maxsize:
+                    self._prune_shared(conn, count - self.shared_maxsize)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['near_hits'] + stats['shared_hits'] + stats['misses']
+        hits = lookups - stats['misses']
+        stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _key(document_type, normalized):
+        return hashlib.sha256(f"{document_type}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def _best_match(self, signature, candidates):
+        best = None
+        best_score = self.threshold
+        for key, entry in candidates:
+            score = similarity(signature, entry[0])
+            if score >= best_score:
+                best, best_score = (key, entry), score
+        return best
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+        self._counted(name)
+
+    def _counted(self, name):
+        if self.on_count is not None:
+            self.on_count(name)
+
+    def _set_local(self, key, signature, verdict, document_type):
+        bands = band_keys(document_type, signature)
+        with self._lock:
+            if key not in self._entries:
+                for band in bands:
+                    self._bands.setdefault(band, set()).add(key)
+            self._entries[key] = (signature, verdict, bands)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, (_, _, evicted_bands) = self._entries.popitem(last=False)
+                for band in evicted_bands:
+                    keys = self._bands.get(band)
+                    if keys is not None:
+                        keys.discard(evicted)
+                        if not keys:
+                            del self._bands[band]
+
+    def _get_shared(self, key, bands, signature):
+        row = self.shared.execute("SELECT signature, verdict FROM verdicts WHERE cache_key = ?", (key,)).fetchone()
+        if row is not None:
+            match = (key, row)
+        else:
+            rows = self.shared.execute(
+                f"SELECT DISTINCT v.cache_key, v.signature, v.verdict FROM verdict_bands b "
+                f"JOIN verdicts v ON v.cache_key = b.cache_key WHERE b.band_key IN ({', '.join('?' * len(bands))})",
+                bands
+            ).fetchall()
+            match = None
+            best_score = self.threshold
+            for candidate in rows:
+                score = similarity(signature, struct.unpack(f'>{NUM_HASHES}Q', candidate['signature']))
+                if score >= best_score:
+                    match, best_score = (candidate['cache_key'], candidate), score
+        if match is None:
+            return None
+        match_key, row = match
+        self.shared.execute("UPDATE verdicts SET last_used = ? WHERE cache_key = ?", (time.time(), match_key))
+        return match_key, struct.unpack(f'>{NUM_HASHES}Q', row['signature']), json.loads(row['verdict'])
+
+    def _prune_shared(self, conn, excess):
+        # Drop the least recently used verdicts (plus a margin so pruning doesn't run on every insert)
+        stale = [row[0] for row in conn.execute(
+            "SELECT cache_key FROM verdicts ORDER BY last_used LIMIT ?", (excess + self.shared_maxsize // 10,)
+        ).fetchall()]
+        conn.executemany("DELETE FROM verdicts WHERE cache_key = ?", [(key,) for key in stale])
+        conn.executemany("DELETE FROM verdict_bands WHERE cache_key = ?", [(key,) for key in stale])
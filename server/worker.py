@@ -0,0 +1,44 @@
+"""Standalone background job worker.
+
+Runs the same job handlers as the web process, so generation throughput can be
+scaled with worker processes independently of the HTTP workers:
+
+    JOB_WORKERS=0 gunicorn app:app ...      # web processes only enqueue
+    python worker.py                         # one or more worker processes
+
+Job and LLM metrics are written to the same PROMETHEUS_MULTIPROC_DIR as the
+gunicorn workers (``<DATA_FOLDER>/prometheus`` unless set), so ``/metrics``
+includes them. Start the workers after gunicorn, which clears that directory.
+"""
+import os
+import signal
+import threading
+
+# Keep the app module from starting its own in-process workers
+os.environ["JOB_WORKERS"] = "0"
+# Must be set before metrics is imported, like gunicorn.conf.py does for the web workers
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.getenv("DATA_FOLDER", "data"), "prometheus")
+)
+os.makedirs(metrics_dir, exist_ok=True)
+
+from app import app, job_queue, run_generate_document_job  # noqa: E402
+from jobs import JobWorkerPool  # noqa: E402
+
+if __name__ == '__main__':
+    pool = JobWorkerPool(
+        job_queue,
+        {'generate_document': run_generate_document_job},
+        workers=int(os.getenv("WORKER_THREADS", 8))
+    )
+    pool.start()
+    app.logger.info(f"Job worker started with {pool.workers} threads")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    stopped.wait()
+    pool.stop(timeout=30)
+
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(os.getpid())